@@ -0,0 +1,47 @@
+"""
+ランダム辞書・テンプレート辞書の学習速度を計測するベンチマーク。
+
+辞書が大きくなっても1件あたりの学習時間が一定であることを確認する。
+
+    python -m benchmarks.bench_ingest [総件数] [計測間隔]
+"""
+import sys
+import tempfile
+import time
+from unmo.dictionary import Dictionary
+
+
+NOUN = '名詞,一般,*,*'
+PARTICLE = '助詞,係助詞,*,*'
+AUX = '助動詞,*,*,*'
+
+
+def synthetic_parts(i):
+    """i番目の合成発言の形態素リストを返す。発言ごとに異なるテンプレートになる。"""
+    return [('名詞{}'.format(i % 1000), NOUN), ('は', PARTICLE),
+            (str(i), AUX), ('です', AUX)]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 10 ** 5
+
+    with tempfile.TemporaryDirectory() as dicdir:
+        Dictionary.DICT_DIR = dicdir
+        dictionary = Dictionary()
+
+        print('{:>10} {:>10} {:>12}'.format('entries', 'sec', 'usec/entry'))
+        for start in range(0, total, step):
+            batch = [('発言{}'.format(i), synthetic_parts(i))
+                     for i in range(start, start + step)]
+            began = time.perf_counter()
+            for text, parts in batch:
+                dictionary.study_random(text)
+                dictionary.study_template(parts)
+            elapsed = time.perf_counter() - began
+            print('{:>10} {:>10.3f} {:>12.2f}'.format(
+                start + step, elapsed, elapsed / step * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""preforkサーバー(unmo.prefork)のワーカーの数ごとに、メモリ使用量とスループットを計測する。
+
+合成した発言を学習させた辞書を一時ディレクトリに用意し、ワーカーの数ごとに
+`python -m unmo --serve --workers N`を新しいプロセスで起動して次の値を計測する。
+
+- parent RSS: 辞書を読み込んだ親プロセスのRSS
+- worker RSS / PSS / USS: ワーカー1つあたりの平均。PSSは共有ページを共有するプロセス数で割った値、
+  USSはそのワーカーだけが持つページの大きさで、ワーカーを1つ増やすたびに増えるメモリにあたる
+- total PSS: 親とすべてのワーカーのPSSの和
+- req/s: loadgenと同じクライアントを同時に接続させたときの毎秒の応答数
+
+RSSとPSSは負荷をかけた後に/proc/<pid>/smaps_rollupから読む(Linuxのみ)。
+比較のため、ワーカーを使わない`--serve`(スレッドで応答する)も同じように計測する。
+
+    python -m benchmarks.bench_prefork [--utterances 100000] [--workers 1 2 4 8]
+                                       [--clients 16] [--requests 100]
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from .loadgen import client
+
+
+BUILD = '''
+import sys
+from benchmarks.suite import synthesize
+from unmo.dictionary import Dictionary
+dictionary = Dictionary(load=False)
+for text, parts in synthesize(int(sys.argv[1])):
+    dictionary.study(text, parts)
+dictionary.random.add('こんにちは')
+dictionary.save()
+'''
+
+
+def memory(pid):
+    """プロセスpidの(RSS, PSS, USS)をバイト数で返す。"""
+    fields = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) * 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def children(pid):
+    """プロセスpidの子プロセスのIDのリストを返す。"""
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # commは括弧で囲まれ、空白を含みうるため、最後の')'より後ろを読む
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            found.append(int(entry))
+    return found
+
+
+async def load(address, clients, requests):
+    """clients個のクライアントからrequests回ずつ発言し、毎秒の応答数を返す。"""
+    latencies = []
+    await client(*address, 1, [])
+    began = time.perf_counter()
+    await asyncio.gather(*(client(*address, requests, latencies) for _ in range(clients)))
+    return len(latencies) / (time.perf_counter() - began)
+
+
+def measure(home, workers, args):
+    """ワーカーworkers個(0であればスレッドで応答する--serve)のサーバーを起動して計測する。"""
+    command = [sys.executable, '-m', 'unmo', '--serve', '--port', '0']
+    if workers:
+        command += ['--workers', str(workers)]
+    env = dict(os.environ, HOME=home, PYTHONUNBUFFERED='1')
+    server = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        line = server.stdout.readline()
+        if not line.startswith('Unmo server listening on'):
+            raise RuntimeError('サーバーを起動できませんでした: {!r}'.format(line))
+        host, port = line.split()[4].rsplit(':', 1)
+        rate = asyncio.run(load((host, int(port)), args.clients, args.requests))
+        parent = memory(server.pid)
+        pids = children(server.pid)
+        usage = [memory(pid) for pid in pids]
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    result = {'workers': workers, 'parent_rss': parent[0], 'req_per_sec': rate,
+              'total_pss': parent[1] + sum(pss for _, pss, _ in usage)}
+    if usage:
+        for index, name in enumerate(('worker_rss', 'worker_pss', 'worker_uss')):
+            result[name] = sum(values[index] for values in usage) / len(usage)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='preforkサーバーのメモリ使用量とスループットの計測')
+    parser.add_argument('--utterances', type=int, default=100000, help='辞書に学習させる合成発言の数')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=16, help='同時に接続するクライアントの数')
+    parser.add_argument('--requests', type=int, default=100, help='クライアントごとの発言の数')
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home)
+        subprocess.run([sys.executable, '-c', BUILD, str(args.utterances)], env=env, check=True)
+        print('utterances={} clients={} requests={} cpus={}'.format(
+            args.utterances, args.clients, args.requests, os.cpu_count()))
+        print('{:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>9}'.format(
+            'workers', 'parent RSS', 'worker RSS', 'worker PSS', 'worker USS', 'total PSS', 'req/s'))
+        print('{:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('', *['(MB)'] * 5))
+        for workers in [0] + args.workers:
+            result = measure(home, workers, args)
+            print('{:>8} {:>10.1f} {:>10} {:>10} {:>10} {:>10.1f} {:>9.1f}'.format(
+                workers or 'threads', result['parent_rss'] / mb,
+                *('{:.1f}'.format(result[name] / mb) if name in result else '-'
+                  for name in ('worker_rss', 'worker_pss', 'worker_uss')),
+                result['total_pss'] / mb, result['req_per_sec']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+起動時間と、最初の応答を返すまでの時間を計測するベンチマーク。
+
+合成した発言を学習させた辞書を一時ディレクトリに用意し、
+新しいプロセスで次の3つを計測する。--lazyの有無それぞれについて、
+辞書を遅延読み込みした場合との差を比べる。
+
+- cold start: `python -m unmo`を起動して何も入力せずに終了するまでの時間
+- first response: `python -m unmo`を起動して一つ発言し、終了するまでの時間
+- in-process: プロセス内でunmoをimportし、Unmoを作成して最初の応答を返すまでの時間
+
+    python -m benchmarks.bench_startup [学習させる発言の数] [繰り返し回数]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+import tempfile
+
+
+TEXT = '今日はいい天気ですね'
+
+IN_PROCESS = '''
+import time
+began = time.perf_counter()
+from unmo.unmo import Unmo
+from unmo.dictionary import Dictionary
+unmo = Unmo('bench', Dictionary(lazy={lazy}))
+ready = time.perf_counter()
+unmo.dialogue({text!r})
+done = time.perf_counter()
+print(ready - began, done - began)
+'''
+
+BUILD = '''
+import sys
+from unmo.dictionary import Dictionary
+NOUN = '名詞,一般,*,*'
+dictionary = Dictionary()
+for i in range({size}):
+    text = '名詞{{}}は{{}}番目の発言です'.format(i % 5000, i)
+    parts = [('名詞{{}}'.format(i % 5000), NOUN), ('は', '助詞,係助詞,*,*'),
+             (str(i), '名詞,数,*,*'), ('番目', '名詞,接尾,助数詞,*'),
+             ('の', '助詞,連体化,*,*'), ('発言', '名詞,サ変接続,*,*'),
+             ('です', '助動詞,*,*,*')]
+    dictionary.study(text, parts)
+dictionary.save()
+'''
+
+
+def run(home, args, stdin=''):
+    env = dict(os.environ, HOME=home)
+    began = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, input=stdin, env=env,
+                               stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return time.perf_counter() - began, completed.stdout
+
+
+def report(name, samples):
+    print('{:<40} median {:8.3f}s  min {:8.3f}s'.format(
+        name, statistics.median(samples), min(samples)))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as home:
+        print('building a dictionary of {} utterances...'.format(size))
+        run(home, ['-c', BUILD.format(size=size)])
+
+        for lazy in (False, True):
+            flags = ['--lazy'] if lazy else []
+            label = 'lazy' if lazy else 'eager'
+            cold = [run(home, ['-m', 'unmo'] + flags, '\n')[0] for _ in range(repeat)]
+            first = [run(home, ['-m', 'unmo'] + flags, TEXT + '\n\n')[0] for _ in range(repeat)]
+            ready, response = [], []
+            for _ in range(repeat):
+                out = run(home, ['-c', IN_PROCESS.format(lazy=lazy, text=TEXT)])[1]
+                ready_time, response_time = map(float, out.split())
+                ready.append(ready_time)
+                response.append(response_time)
+
+            report('cold start ({})'.format(label), cold)
+            report('first response, python -m unmo ({})'.format(label), first)
+            report('in-process, Unmo() ready ({})'.format(label), ready)
+            report('in-process, first response ({})'.format(label), response)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""チャットサーバー(unmo.server)に負荷をかけ、応答の遅延とスループットを計測する。
+
+複数のクライアントが同時に接続し、それぞれ決まった数の発言を送って応答を待つ。
+すべての応答の遅延からp50/p99を、全体の経過時間から毎秒のリクエスト数を求める。
+
+    python -m unmo --serve &
+    python -m benchmarks.loadgen [--clients 16] [--requests 200] [--host 127.0.0.1] [--port 8765]
+
+--selfhostを付けると、一時ディレクトリの辞書でサーバーをプロセス内に起動して計測する。
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+
+TEXTS = [
+    '今日はいい天気ですね',
+    'お腹がすいたのでラーメンを食べたい',
+    '明日は雨が降るらしい',
+    '猫と犬ではどちらが好きですか',
+    '週末は図書館で本を読みます',
+    'コーヒーを飲みながら音楽を聴く',
+    '新しいパソコンが欲しい',
+    '駅前に新しいカフェができた',
+]
+
+
+async def client(host, port, requests, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            began = time.perf_counter()
+            writer.write(random.choice(TEXTS).encode('utf-8') + b'\n')
+            await writer.drain()
+            if not await reader.readline():
+                raise ConnectionError('サーバーが接続を閉じました')
+            latencies.append(time.perf_counter() - began)
+        writer.write(b'\n')
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def run(args):
+    server = None
+    if args.selfhost:
+        from unmo.dictionary import Dictionary
+        from unmo.server import UnmoServer
+        from unmo.unmo import Unmo
+        dictionary = Dictionary()
+        dictionary.study_random(TEXTS[0])
+        server = UnmoServer(Unmo('loadgen', dictionary), args.host, args.port)
+        await server.start()
+        args.host, args.port = server.address
+
+    # 形態素解析器の読み込みなど、最初の一回だけかかる時間を計測から除く
+    await client(args.host, args.port, 1, [])
+
+    latencies = []
+    began = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, args.requests, latencies)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - began
+
+    if server is not None:
+        await server.close()
+
+    print('clients={} requests={}'.format(args.clients, len(latencies)))
+    print('p50      {:8.2f} ms'.format(percentile(latencies, 0.50) * 1000))
+    print('p99      {:8.2f} ms'.format(percentile(latencies, 0.99) * 1000))
+    print('max      {:8.2f} ms'.format(max(latencies) * 1000))
+    print('req/s    {:8.1f}'.format(len(latencies) / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='unmoサーバーの負荷試験')
+    parser.add_argument('--clients', type=int, default=16, help='同時に接続するクライアントの数')
+    parser.add_argument('--requests', type=int, default=200, help='クライアントごとの発言の数')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--selfhost', action='store_true',
+                        help='一時ディレクトリの辞書でサーバーをプロセス内に起動する')
+    args = parser.parse_args()
+    if args.selfhost:
+        os.environ['HOME'] = tempfile.mkdtemp()
+        args.port = 0
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""学習・応答・保存の性能をまとめて計測するベンチマーク。
+
+乱数の種から合成した発言で、規模ごと(既定では10^3, 10^4, 10^5件)に辞書を作り、
+次の処理のスループット(ops/s)、1回あたりの遅延の分位点(p50/p90/p99/max)、
+処理を終えた時点のピークRSSを計測する。
+
+- study: Dictionary.study
+- markov.add_sentence / markov.generate: Markov単体での学習と生成
+- respond.<Responder名>: 各Responder.response
+- save / load: Dictionary.saveと、保存した辞書からのDictionary()
+- load.lazy_first_response: 遅延読み込みで最初の応答を返すまで
+
+応答は規模によらずRESPONSES回、保存と読み込みはREPEATS回計測する。
+
+ピークRSSを規模ごとに分けて測るため、規模ごとに新しいプロセスで計測する。
+形態素解析は計測の対象ではないため、合成した形態素をそのまま使う。
+
+    python -m benchmarks.suite [--scales 1000 10000 100000 1000000] [--output result.json]
+    python -m benchmarks.suite --compare 前回.json 今回.json [--threshold 0.1]
+
+--outputを付けると結果をJSONで書き出す。--compareは二つの結果のスループットとp99を比べ、
+threshold(既定では10%)を超えて悪化した項目を表示し、あれば終了コード1で終わる。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+
+NOUN = '名詞,一般,*,*'
+PARTICLE = '助詞,格助詞,一般,*'
+VERB = '動詞,自立,*,*'
+AUX = '助動詞,*,*,*'
+PARTICLES = ['は', 'が', 'を', 'に', 'と', 'で']
+VERBS = ['好き', '見る', '食べる', '行く', '話す', '作る', '読む', '書く']
+ENDINGS = ['です', 'ます', 'だ', 'でした']
+
+RESPONSES = 2000
+REPEATS = 5
+SEED = 2024
+
+
+def synthesize(count, seed=SEED):
+    """count件の合成発言を(text, parts)のリストで返す。
+    名詞は発言数の1/10(最低100)種類で、出現頻度はZipf分布に従う。"""
+    rng = random.Random(seed)
+    vocabulary = ['語{}'.format(i) for i in range(max(100, count // 10))]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    cumulative = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    corpus = []
+    for _ in range(count):
+        parts = []
+        for noun in rng.choices(vocabulary, cum_weights=cumulative, k=rng.randint(1, 3)):
+            parts.append((noun, NOUN))
+            parts.append((rng.choice(PARTICLES), PARTICLE))
+        parts.append((rng.choice(VERBS), VERB))
+        parts.append((rng.choice(ENDINGS), AUX))
+        corpus.append((''.join(word for word, _ in parts), parts))
+    return corpus
+
+
+def peak_rss():
+    """このプロセスのピークRSSをバイト数で返す。"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def summarize(latencies, elapsed=None):
+    """1回ごとの秒数latenciesから、回数・スループット・分位点を辞書で返す。"""
+    ordered = sorted(latencies)
+    elapsed = sum(ordered) if elapsed is None else elapsed
+
+    def quantile(ratio):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+    return {
+        'ops': len(ordered),
+        'seconds': elapsed,
+        'ops_per_sec': len(ordered) / elapsed if elapsed else None,
+        'p50_us': quantile(0.50) * 1e6,
+        'p90_us': quantile(0.90) * 1e6,
+        'p99_us': quantile(0.99) * 1e6,
+        'max_us': ordered[-1] * 1e6,
+        'peak_rss': peak_rss(),
+    }
+
+
+def timed(function, arguments):
+    """argumentsの各要素でfunction(*args)を呼び出し、1回ごとの秒数のリストを返す。"""
+    clock = time.perf_counter
+    latencies = []
+    for args in arguments:
+        began = clock()
+        function(*args)
+        latencies.append(clock() - began)
+    return latencies
+
+
+def run_scale(count):
+    """count件の規模で各処理を計測し、結果を辞書で返す。"""
+    from unmo.dictionary import Dictionary
+    from unmo.markov import Markov
+    from unmo.responder import (WhatResponder, RandomResponder, PatternResponder,
+                                TemplateResponder, MarkovResponder)
+    from unmo.unmo import Unmo
+
+    corpus = synthesize(count)
+    rng = random.Random(SEED)
+    samples = [corpus[rng.randrange(count)] for _ in range(RESPONSES)]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as dicdir:
+        Dictionary.DICT_DIR = dicdir
+
+        markov = Markov()
+        results['markov.add_sentence'] = summarize(timed(markov.add_sentence,
+                                                         ((parts,) for _, parts in corpus)))
+        keywords = [parts[0][0] for _, parts in samples]
+        results['markov.generate'] = summarize(timed(markov.generate,
+                                                     ((keyword, rng) for keyword in keywords)))
+        del markov
+
+        dictionary = Dictionary(load=False)
+        results['study'] = summarize(timed(dictionary.study, corpus))
+
+        for cls in (WhatResponder, RandomResponder, PatternResponder,
+                    TemplateResponder, MarkovResponder):
+            responder = cls(cls.__name__[:-len('Responder')], dictionary)
+            results['respond.' + responder.name] = summarize(
+                timed(responder.response, ((text, parts, rng) for text, parts in samples)))
+
+        results['save'] = summarize(timed(dictionary.save, [()] * REPEATS))
+        del responder, dictionary
+
+        results['load'] = summarize(timed(Dictionary, [()] * REPEATS))
+
+        def lazy_first_response():
+            text, parts = samples[0]
+            Unmo('bench', Dictionary(lazy=True)).respond(text, parts, rng)
+        results['load.lazy_first_response'] = summarize(timed(lazy_first_response, [()] * REPEATS))
+
+        results['files'] = {name: os.path.getsize(os.path.join(dicdir, filename))
+                            for name, filename in Dictionary.DICT.items()
+                            if os.path.exists(os.path.join(dicdir, filename))}
+
+    return results
+
+
+def measure(scales):
+    """規模ごとに新しいプロセスでrun_scaleを実行し、結果をまとめた辞書を返す。"""
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': _git_commit(),
+            'seed': SEED,
+            'responses': RESPONSES,
+            'repeats': REPEATS,
+        },
+        'scales': {},
+    }
+    for count in scales:
+        print('measuring {} utterances...'.format(count), file=sys.stderr)
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--worker', str(count)],
+                                check=True, stdout=subprocess.PIPE).stdout
+        report['scales'][str(count)] = json.loads(output)
+    return report
+
+
+def show(report):
+    for count, results in report['scales'].items():
+        print('== {} utterances'.format(count))
+        print('{:<28} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+            'benchmark', 'ops/s', 'p50 us', 'p99 us', 'max us', 'RSS MB'))
+        for name, result in results.items():
+            if name == 'files':
+                continue
+            print('{:<28} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, result['ops_per_sec'] or 0, result['p50_us'], result['p99_us'],
+                result['max_us'], result['peak_rss'] / 2 ** 20))
+        print('files: ' + ', '.join('{} {:.1f} KB'.format(name, size / 1024)
+                                    for name, size in results['files'].items()))
+
+
+def compare(before, after, threshold):
+    """二つの結果を比べて表を表示し、thresholdを超えて悪化した項目の数を返す。"""
+    regressions = 0
+    print('{:<10} {:<28} {:>10} {:>10} {:>10}'.format(
+        'scale', 'benchmark', 'ops/s', 'p99', 'RSS'))
+    for count, results in after['scales'].items():
+        previous = before['scales'].get(count, {})
+        for name, result in results.items():
+            if name == 'files' or name not in previous:
+                continue
+            old = previous[name]
+            ratios = (
+                (result['ops_per_sec'] or 0) / old['ops_per_sec'] if old['ops_per_sec'] else 1.0,
+                result['p99_us'] / old['p99_us'] if old['p99_us'] else 1.0,
+                result['peak_rss'] / old['peak_rss'] if old['peak_rss'] else 1.0,
+            )
+            worse = ratios[0] < 1 - threshold or ratios[1] > 1 + threshold or ratios[2] > 1 + threshold
+            regressions += worse
+            print('{:<10} {:<28} {:>9.2f}x {:>9.2f}x {:>9.2f}x{}'.format(
+                count, name, *ratios, '  <-- regression' if worse else ''))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='unmoの学習・応答・保存のベンチマーク')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10 ** 3, 10 ** 4, 10 ** 5],
+                        help='合成する発言の数')
+    parser.add_argument('--output', help='結果を書き出すJSONファイル')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='二つの結果のJSONファイルを比べる')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='--compareで悪化とみなす割合')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_scale(args.worker), sys.stdout)
+        return
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+
+    report = measure(args.scales)
+    show(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
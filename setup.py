@@ -14,8 +14,11 @@ def main():
         install_requires=[
             'janome',
             'tqdm',
-            'dill',
         ],
+        extras_require={
+            # 旧形式(dill)のmarkov.datを読み込む場合にのみ必要
+            'legacy': ['dill'],
+        },
         entry_points={
             'console_scripts': [
                 'unmo = cli:main',
@@ -0,0 +1,47 @@
+"""
+AsyncUnmoクラスのテストを行うモジュール
+"""
+import asyncio
+import os
+import shutil
+from nose.tools import eq_, ok_, with_setup
+from unmo.aio import AsyncUnmo
+from unmo.dictionary import Dictionary
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dialogue_and_flush():
+    """AsyncUnmo#flush: キューに積まれた学習を順に終える"""
+    sentenses = ['波が立つ', '波が引く', '風が吹く']
+
+    async def talk():
+        unmo = AsyncUnmo('test', Dictionary())
+        for sentense in sentenses:
+            response = await unmo.dialogue(sentense)
+            ok_(isinstance(response, str))
+        await unmo.flush()
+        await unmo.close()
+        return unmo._unmo._dictionary
+
+    dictionary = asyncio.run(talk())
+    eq_(list(dictionary.random), ['こんにちは'] + sentenses)
+    eq_(dictionary.pattern[0]['phrases'], sentenses[:2])
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dialogue_before_learning():
+    """AsyncUnmo#dialogue: 学習を待たずに応答を返す"""
+    async def talk():
+        unmo = AsyncUnmo('test', Dictionary())
+        await unmo.dialogue('波が立つ')
+        learned = len(unmo._unmo._dictionary.random)
+        await unmo.close()
+        return learned, len(unmo._unmo._dictionary.random)
+
+    eq_(asyncio.run(talk()), (1, 2))
@@ -0,0 +1,243 @@
+"""
+SQLiteBackendのテストを行うモジュール
+"""
+import os
+import random
+import shutil
+import tempfile
+from nose.tools import eq_, ok_, raises, with_setup
+from unmo.backend import SQLiteBackend, import_files
+from unmo.dictionary import Dictionary
+from unmo.markov import Markov
+from unmo.responder import PatternResponder, TemplateResponder, MarkovResponder
+
+DB_DIR = None
+
+NOUN = '名詞,一般,*,*'
+PARTICLE = '助詞,係助詞,*,*'
+AUX = '助動詞,*,*,*'
+UTTERANCES = [
+    ('猫は好きです', [('猫', NOUN), ('は', PARTICLE), ('好き', NOUN), ('です', AUX)]),
+    ('犬は好きです', [('犬', NOUN), ('は', PARTICLE), ('好き', NOUN), ('です', AUX)]),
+    ('猫は魚です', [('猫', NOUN), ('は', PARTICLE), ('魚', NOUN), ('です', AUX)]),
+]
+
+
+def setup_db():
+    global DB_DIR
+    DB_DIR = tempfile.mkdtemp()
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def teardown_db():
+    shutil.rmtree(DB_DIR)
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def open_db():
+    return Dictionary(backend=SQLiteBackend(os.path.join(DB_DIR, 'unmo.db')))
+
+
+def study_all(dictionary):
+    for text, parts in UTTERANCES:
+        dictionary.study(text, parts)
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_study_and_reopen():
+    """Dictionary: バックエンドに学習した内容は、開き直しても残っている"""
+    d = open_db()
+    study_all(d)
+    d.backend.close()
+
+    d = open_db()
+    eq_(list(d.random), ['こんにちは'] + [text for text, _ in UTTERANCES])
+    eq_(d.pattern.get('猫')['phrases'], ['猫は好きです', '猫は魚です'])
+    eq_(d.template.frequency('%noun%は%noun%です'), 3)
+    eq_(d.sizes()['markov_transitions'], 7)
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_same_as_memory():
+    """Dictionary: バックエンドの辞書は、メモリ上の辞書と同じ内容を学習する"""
+    d = open_db()
+    memory = Dictionary(load=False)
+    study_all(d)
+    study_all(memory)
+    memory.random.add('こんにちは')
+
+    eq_(sorted(d.random), sorted(memory.random))
+    eq_([(p['pattern'], list(p['phrases'])) for p in d.pattern],
+        [(p['pattern'], list(p['phrases'])) for p in memory.pattern])
+    eq_(list(d.template.entries()), list(memory.template.entries()))
+    eq_(sorted(d.markov.transitions()), sorted(memory.markov.transitions()))
+    eq_(sorted(d.markov.starts()), sorted(memory.markov.starts()))
+    eq_(d.markov.sizes(), memory.markov.sizes())
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_responders():
+    """Responder: バックエンドの辞書からも応答を作成できる"""
+    d = open_db()
+    study_all(d)
+    rng = random.Random(0)
+    text, parts = UTTERANCES[0]
+    ok_(PatternResponder('Pattern', d).response('猫を見た', [], rng) in ['猫は好きです', '猫は魚です'])
+    ok_(TemplateResponder('Template', d).response(text, parts, rng).endswith('です'))
+    ok_(MarkovResponder('Markov', d).response(text, parts, rng).startswith(('猫', '犬')))
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_search_order():
+    """SQLPatternStore#search: 部分文字列と正規表現のうち、先に登録されたパターンを返す"""
+    d = open_db()
+    d.pattern.add('^(こんにちは|こんばんは)', 'やあ', regex=True)
+    d.pattern.add('こんにちは', 'どうも')
+    d.pattern.add('猫', 'にゃー')
+    pattern, matched = d.match_pattern('猫さん、こんにちは')
+    eq_((pattern['pattern'], matched), ('こんにちは', 'こんにちは'))
+    pattern, matched = d.match_pattern('猫さん')
+    eq_((pattern['pattern'], matched), ('猫', '猫'))
+    pattern, matched = d.match_pattern('こんにちは')
+    eq_((pattern['pattern'], matched), ('^(こんにちは|こんばんは)', 'こんにちは'))
+    eq_(d.match_pattern('犬'), None)
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_symbol_nouns():
+    """SQLPatternStore#add: 記号の単語は文字列として学習し、正規表現として登録した古い行も読み込める"""
+    d = open_db()
+    d.study('C++が好きです', [('C', NOUN), ('++', NOUN), ('が', PARTICLE), ('好き', NOUN), ('です', AUX)])
+    d.study('(笑)', [('(', NOUN), ('笑', NOUN), (')', NOUN)])
+    eq_(d.pattern.get('++')['phrases'], ['C++が好きです'])
+    eq_(d.match_pattern('D++'), (d.pattern.get('++'), '++'))
+    eq_(d.match_pattern('(')[1], '(')
+    d.backend.execute("UPDATE pattern SET regex = 1 WHERE word IN ('++', '(')")
+    d.backend.commit()
+    d.backend.close()
+
+    d = open_db()
+    eq_(d.match_pattern('D++')[1], '++')
+    eq_(d.backend.query_one('SELECT COUNT(*) FROM pattern WHERE regex = 1')[0], 0)
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_remove_and_prune():
+    """SQLiteBackend: 辞書から項目を取り除いても、残りの順序と遷移が保たれる"""
+    d = open_db()
+    study_all(d)
+    d.random.remove_all(['犬は好きです'])
+    eq_(list(d.random), ['こんにちは', '猫は好きです', '猫は魚です'])
+    eq_(d.random[2], '猫は魚です')
+    d.pattern.remove_all(['猫'])
+    eq_(d.pattern.get('猫'), None)
+    eq_(d.pattern.get('好き')['phrases'], ['猫は好きです', '犬は好きです'])
+
+    eq_(d.prune_markov(2), 5)
+    eq_(sorted(d.markov.transitions()),
+        [('は', '好き', 'です', 2), ('好き', 'です', Markov.ENDMARK, 2)])
+    eq_(d.markov.sizes()['words'], 3)
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_template_choose():
+    """SQLTemplateStore#choose: 出現数の累積和で重み付けして選び、取り除いた後や古いデータベースでも選べる"""
+    d = open_db()
+    d.template.add('%noun%は%noun%です', 3)
+    d.template.add('%noun%と%noun%', 1)
+    d.template.add('%noun%です', 2)
+    d.template.add('%noun%と%noun%', 1)
+    eq_([d.template.choose(2, FixedRandom(n)) for n in range(5)],
+        ['%noun%は%noun%です'] * 3 + ['%noun%と%noun%'] * 2)
+    eq_(d.template.choose(1, FixedRandom(1)), '%noun%です')
+    eq_(d.template.choose(3), None)
+
+    d.template.remove_all(['%noun%は%noun%です'])
+    eq_([d.template.choose(2, FixedRandom(n)) for n in range(2)], ['%noun%と%noun%'] * 2)
+    eq_(d.template.choose(1, FixedRandom(0)), '%noun%です')
+
+    d.template.add('%noun%は%noun%です', 3)
+    d.backend.execute('DELETE FROM template_event')
+    d.backend.commit()
+    d.backend.close()
+    d = open_db()
+    eq_([d.template.choose(2, FixedRandom(n)) for n in range(5)],
+        ['%noun%と%noun%'] * 2 + ['%noun%は%noun%です'] * 3)
+    d.backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_template_events_compacted():
+    """SQLTemplateStore#add: template_event表の行は、テンプレートの数の2倍に達したら詰め直す"""
+    d = open_db()
+    for _ in range(50):
+        d.template.add('%noun%は%noun%です')
+        d.template.add('%noun%と%noun%', 2)
+    d.template.add('%noun%です')
+    rows = d.backend.query_one('SELECT COUNT(*) FROM template_event WHERE nouns = 2')[0]
+    ok_(rows <= 4)
+    chosen = [d.template.choose(2, FixedRandom(n)) for n in range(150)]
+    eq_(chosen.count('%noun%は%noun%です'), 50)
+    eq_(chosen.count('%noun%と%noun%'), 100)
+    eq_(d.template.choose(1, FixedRandom(0)), '%noun%です')
+    d.backend.close()
+
+
+class FixedRandom:
+    """randrangeが常にvalueを返す乱数生成器"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def randrange(self, stop):
+        assert self.value < stop
+        return self.value
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_import_files():
+    """import_files: 辞書ファイルの学習内容をバックエンドに取り込む"""
+    files = Dictionary(load=False)
+    study_all(files)
+    files.save()
+
+    backend = SQLiteBackend(os.path.join(DB_DIR, 'unmo.db'))
+    import_files(backend)
+    d = Dictionary(backend=backend)
+    eq_(len(d.random), 4)
+    eq_(d.template.frequency('%noun%は%noun%です'), 3)
+    eq_(sorted(d.markov.transitions()), sorted(Markov.transitions(Dictionary.load_markov(
+        Dictionary.dicfile('markov')))))
+    backend.close()
+
+
+@with_setup(setup=setup_db, teardown=teardown_db)
+def test_import_ngram_files():
+    """import_files: n-gramのマルコフ辞書はTypeErrorとし、何も取り込まない"""
+    files = Dictionary(load=False, markov_order=4)
+    study_all(files)
+    files.save()
+
+    backend = SQLiteBackend(os.path.join(DB_DIR, 'unmo.db'))
+    try:
+        import_files(backend)
+    except TypeError as error:
+        ok_('NgramMarkov' in str(error))
+    else:
+        ok_(False, 'TypeErrorが送出されていない')
+    eq_(Dictionary(backend=backend).sizes()['random'], 1)
+    backend.close()
+
+
+@raises(ValueError)
+def test_backend_with_journal():
+    """Dictionary: バックエンドとジャーナルモードは併用できない"""
+    Dictionary(journal=True, backend=object())
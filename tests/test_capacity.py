@@ -0,0 +1,136 @@
+"""
+Capacityクラスと、辞書の上限のテストを行うモジュール
+"""
+import pickle
+import sys
+import threading
+from nose.tools import eq_, ok_, raises
+from unmo.capacity import Capacity
+from unmo.dictionary import Dictionary
+from unmo.store import IndexedSet, PatternStore, TemplateStore
+
+
+NOUN = '名詞,一般,*,*'
+PARTICLE = '助詞,係助詞,*,*'
+
+
+def test_victims_age():
+    """Capacity#victims: ageであれば古く学習されたものから選ぶ"""
+    capacity = Capacity(3, 'age')
+    for key in 'abcd':
+        capacity.learned(key)
+    capacity.used('a')
+    eq_(capacity.victims('abcd', 2), ['a', 'b'])
+
+
+def test_victims_lru():
+    """Capacity#victims: lruであれば応答に使われたのが古いものから選ぶ"""
+    capacity = Capacity(3, 'lru')
+    for key in 'abcd':
+        capacity.learned(key)
+    capacity.used('a')
+    capacity.used('b')
+    eq_(capacity.victims('abcd', 2), ['c', 'd'])
+
+
+def test_victims_lfu():
+    """Capacity#victims: lfuであれば学習・使用の回数が少ないものから選ぶ"""
+    capacity = Capacity(3, 'lfu')
+    for key in 'abcdd':
+        capacity.learned(key)
+    capacity.used('a')
+    capacity.used('c')
+    eq_(capacity.victims('abcd', 2), ['b', 'a'])
+
+
+def test_overflow():
+    """Capacity#overflow: 上限を超えたら、上限の1割を余分に取り除く"""
+    capacity = Capacity(100)
+    eq_(capacity.overflow(100), 0)
+    eq_(capacity.overflow(101), 11)
+    eq_(Capacity(5).overflow(6), 1)
+
+
+@raises(ValueError)
+def test_unknown_policy():
+    """Capacity: 未対応の追い出し方はValueErrorを送出する"""
+    Capacity(10, 'mru')
+
+
+def test_used_from_threads():
+    """Capacity#used: 応答中のスレッドから並行して記録しても、回数を取りこぼさない"""
+    capacity = Capacity(10, 'lfu')
+
+    def respond():
+        for _ in range(5000):
+            capacity.used('a')
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=respond) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    eq_(capacity._counts['a'], 20000)
+
+    copied = pickle.loads(pickle.dumps(capacity))
+    copied.used('b')
+    eq_(copied.victims(['a', 'b'], 1), ['b'])
+
+
+def test_remove_all():
+    """IndexedSet, PatternStore, TemplateStore#remove_all: 取り除いても残りの順序を保つ"""
+    items = IndexedSet('abcd')
+    items.remove_all(['b', 'x'])
+    eq_(items, ['a', 'c', 'd'])
+    eq_(items.index('d'), 2)
+
+    store = PatternStore([{'pattern': '猫', 'phrases': ['猫だ']},
+                          {'pattern': '犬', 'phrases': ['犬だ']}])
+    store.remove_all(['猫'])
+    eq_([pattern['pattern'] for pattern in store], ['犬'])
+    ok_(store.search('猫と犬')[1] == '犬')
+
+    templates = TemplateStore([('%noun%は', 1), ('%noun%が', 3), ('%noun%と%noun%', 2)])
+    templates.remove_all(['%noun%は'])
+    eq_(list(templates.entries()), [('%noun%が', 3), ('%noun%と%noun%', 2)])
+    eq_(templates.choose(1), '%noun%が')
+    eq_(templates.weight(1), 3)
+    templates.remove_all(['%noun%と%noun%'])
+    ok_(2 not in templates)
+    eq_(templates.choose(2), None)
+    templates.add('%noun%は')
+    eq_(list(templates.entries()), [('%noun%が', 3), ('%noun%は', 1)])
+    eq_(templates.weight(1), 4)
+
+
+def test_dictionary_limits():
+    """Dictionary: 上限を超えた辞書から項目を取り除く"""
+    dictionary = Dictionary(load=False, limits={'random': Capacity(10, 'age'),
+                                                'pattern': Capacity(5, 'lru'),
+                                                'template': Capacity(3, 'lfu')})
+    for i in range(30):
+        noun = '名詞{}'.format(i)
+        suffix = 'は' * (i % 4 + 1)
+        dictionary.study(noun + suffix, [(noun, NOUN), (suffix, PARTICLE)])
+        dictionary.used('pattern', '名詞0')
+    ok_(len(dictionary.random) <= 10)
+    eq_(dictionary.random[-1], '名詞29は' + 'は' * (29 % 4))
+    ok_(len(dictionary.pattern) <= 5)
+    ok_(dictionary.pattern.get('名詞0'))
+    ok_(dictionary.template.total <= 3)
+    eq_(dictionary.sizes()['markov_states'], 0)
+
+
+def test_dictionary_without_limits():
+    """Dictionary: 上限を設定しなければ項目を取り除かない"""
+    dictionary = Dictionary(load=False)
+    for i in range(30):
+        noun = '名詞{}'.format(i)
+        dictionary.study(noun + 'は', [(noun, NOUN), ('は', PARTICLE)])
+    eq_(len(dictionary.random), 30)
+    eq_(len(dictionary.pattern), 30)
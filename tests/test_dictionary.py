@@ -2,9 +2,12 @@
 Dictionaryクラスのテストを行うモジュール
 """
 import os
+import json
 from pathlib import Path
 import shutil
 import re
+import threading
+import warnings
 from nose.tools import eq_, ok_, with_setup
 from unmo.dictionary import Dictionary
 from unmo.morph import analyze
@@ -76,6 +79,21 @@ def test_template_save_and_load():
     ok_(d2.template[3] == [result])
 
 
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_template_frequency_save_and_load():
+    """Dictionary#template: 出現数を保存し、出現数の列が無い行は1として読み込む"""
+    parts = analyze('私はプログラムの女の子です')
+    d1 = Dictionary()
+    d1.study_template(parts)
+    d1.study_template(parts)
+    d1.save()
+    with open(Dictionary.dicfile('template'), 'a', encoding='utf-8') as f:
+        f.write('\n1\t%noun%です')
+    d2 = Dictionary()
+    eq_(d2.template.frequency('%noun%は%noun%の%noun%です'), 2)
+    eq_(d2.template.frequency('%noun%です'), 1)
+
+
 @with_setup(setup=remove_dic, teardown=remove_dic)
 def test_markov_save_and_load():
     """Dictionary#markov: 保存した辞書を読み込める"""
@@ -88,6 +106,193 @@ def test_markov_save_and_load():
     ok_(d2.markov.generate('私').startswith('私は'))
 
 
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_replay():
+    """Dictionary: ジャーナルモードでは保存しなくても学習内容を復元できる"""
+    sentense = '私はプログラムの女の子です'
+    d1 = Dictionary(journal=True)
+    d1.study(sentense, analyze(sentense))
+    d2 = Dictionary(journal=True)
+    ok_(sentense in d2.random)
+    eq_(len(d2.pattern), 3)
+    eq_(d2.template[3], ['%noun%は%noun%の%noun%です'])
+    ok_(d2.markov.generate('私').startswith('私は'))
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_compaction():
+    """Dictionary: 一定回数学習するとジャーナルを辞書ファイルに畳み込む"""
+    d1 = Dictionary(journal=True, compact_every=2)
+    for sentense in ('波が立つ', '波が引く'):
+        d1.study(sentense, analyze(sentense))
+    eq_(os.path.getsize(Dictionary.dicfile('journal')), 0)
+    d2 = Dictionary()
+    eq_(d2.pattern[0]['phrases'], ['波が立つ', '波が引く'])
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_compaction_allows_readers():
+    """Dictionary#study: ジャーナルを畳み込む間も、読み込みロックは取得できる"""
+    d = Dictionary(journal=True, compact_every=1)
+    save = d._save
+    readable = []
+
+    def read():
+        with d.lock.read():
+            readable.append(True)
+
+    def saving():
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        save()
+
+    d._save = saving
+    d.study('波が立つ', analyze('波が立つ'))
+    eq_(readable, [True])
+    eq_(os.path.getsize(Dictionary.dicfile('journal')), 0)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_interrupted_save():
+    """Dictionary: 保存の途中で中断されても、保存済みの辞書にジャーナルを二重に学習させない"""
+    d1 = Dictionary(journal=True)
+    for sentense in ('波が立つ', '波が引く', '波が立つ'):
+        d1.study(sentense, analyze(sentense))
+    # テンプレート辞書とマルコフ辞書だけを保存したところで中断する
+    d1._save_template()
+    d1._markov.save(Dictionary.dicfile('markov'), d1._journal_seq)
+
+    d2 = Dictionary(journal=True)
+    eq_(list(d2.template.entries()), list(d1.template.entries()))
+    eq_(d2.markov.sizes(), d1.markov.sizes())
+    eq_(d2.markov._starts, d1.markov._starts)
+    eq_(list(d2.random), list(d1.random))
+    eq_(list(d2.pattern), list(d1.pattern))
+
+    # 続けて学習した記録は、すべての辞書に学習させる
+    d2.study('風が吹く', analyze('風が吹く'))
+    d3 = Dictionary(journal=True)
+    ok_('風が吹く' in d3.random)
+    eq_(d3.template.frequency('%noun%が吹く'), 1)
+    eq_(d3.markov.sizes(), d2.markov.sizes())
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_failed_study():
+    """Dictionary: 学習に失敗した発言はジャーナルに記録せず、学習できない記録は読み飛ばす"""
+    d1 = Dictionary(journal=True)
+    d1.study('波が立つ', analyze('波が立つ'))
+    try:
+        d1.study('壊れた発言', [('壊れた',)])
+    except ValueError:
+        pass
+    d1._journal.write(json.dumps(['壊れた記録', [['壊れた']], 5], ensure_ascii=False) + '\n')
+    d1._journal.flush()
+    d1.study('風が吹く', analyze('風が吹く'))
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        d2 = Dictionary(journal=True)
+    eq_(len(caught), 1)
+    ok_('壊れた記録' in str(caught[0].message))
+    ok_('波が立つ' in d2.random)
+    ok_('風が吹く' in d2.random)
+    ok_('壊れた発言' not in d2.random)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_journal_torn_record():
+    """Dictionary: 書き込み途中のジャーナルの行は読み飛ばす"""
+    sentense = '波が立つ'
+    d1 = Dictionary(journal=True)
+    d1.study(sentense, analyze(sentense))
+    with open(Dictionary.dicfile('journal'), 'a', encoding='utf-8') as f:
+        f.write('["途中')
+    d2 = Dictionary(journal=True)
+    eq_(list(d2.random), ['こんにちは', sentense])
+    d2.study('波が引く', analyze('波が引く'))
+    d3 = Dictionary(journal=True)
+    eq_(list(d3.random), ['こんにちは', sentense, '波が引く'])
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_lazy():
+    """Dictionary: lazyであれば辞書は初めて参照したときに読み込む"""
+    sentense = '波が立つ'
+    d1 = Dictionary()
+    d1.study(sentense, analyze(sentense))
+    d1.save()
+    d2 = Dictionary(lazy=True)
+    ok_(d2._random is None and d2._pattern is None)
+    ok_(sentense in d2.random)
+    ok_(d2._pattern is None)
+    eq_(d2.match_pattern('大きな波')[1], '波')
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_lazy_save():
+    """Dictionary#save: lazyで読み込んでいない辞書は保存しない"""
+    d = Dictionary(lazy=True)
+    d.study_random('Hello')
+    d.save()
+    ok_(os.path.exists(Dictionary.dicfile('random')))
+    ok_(not os.path.exists(Dictionary.dicfile('pattern')))
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_pattern_phrase_table():
+    """Dictionary#save: パターン辞書はフレーズ表と番号で保存する"""
+    d1 = Dictionary()
+    for sentense in ('大きな波が立つ', '波が引く'):
+        d1.study_pattern(sentense, analyze(sentense))
+    d1.save()
+    with open(Dictionary.dicfile('pattern'), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    eq_(lines[:3], ['%phrases%\t2', '大きな波が立つ', '波が引く'])
+    d2 = Dictionary()
+    eq_(list(d2.pattern), list(d1.pattern))
+    eq_(d2.match_pattern('大きな波'), d1.match_pattern('大きな波'))
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_pattern_legacy_format():
+    """Dictionary: フレーズ表のない従来の形式のパターン辞書も読み込める"""
+    os.makedirs(Dictionary.DICT_DIR)
+    with open(Dictionary.dicfile('pattern'), 'w', encoding='utf-8') as f:
+        f.write('波\t波が立つ|波が引く\n')
+    d = Dictionary()
+    eq_(d.pattern[0], {'pattern': '波', 'phrases': ['波が立つ', '波が引く']})
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_pattern_symbol_nouns():
+    """Dictionary#study: 記号の名詞は文字列のパターンとして学習し、保存して読み込んでも変わらない"""
+    d1 = Dictionary()
+    for sentense in ('C++が好きです', '(笑)'):
+        d1.study(sentense, analyze(sentense))
+    eq_(d1.match_pattern('D++'), (d1.pattern.get('++'), '++'))
+    eq_(d1.match_pattern('笑'), (d1.pattern.get('笑'), '笑'))
+    d1.save()
+    d2 = Dictionary()
+    eq_(list(d2.pattern), list(d1.pattern))
+    eq_(d2.match_pattern('D++')[1], '++')
+    ok_(all('regex' not in pattern for pattern in d2.pattern))
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_pattern_handwritten_regex():
+    """Dictionary: 手書きのパターン辞書の正規表現は照合に使い、コンパイルできなければ文字列として扱う"""
+    os.makedirs(Dictionary.DICT_DIR)
+    with open(Dictionary.dicfile('pattern'), 'w', encoding='utf-8') as f:
+        f.write('^(こんにちは|こんばんは)\tやあ\n**\tすごい\n')
+    d = Dictionary()
+    eq_(d.match_pattern('こんばんは')[1], 'こんばんは')
+    eq_(d.match_pattern('**注意**')[1], '**')
+    d.save()
+    eq_(Dictionary().match_pattern('こんにちは')[1], 'こんにちは')
+
+
 def test_pattern_to_line():
     """Dictionary.pattern2line: パターンハッシュを一行の文字列にする"""
     test_dict = {'pattern': 'Test', 'phrases': ['This', 'is', 'test', 'phrases']}
@@ -202,6 +407,23 @@ class TestDictionary:
         for i, sentense in enumerate(sentenses):
             eq_(self.dictionary.pattern[0]['phrases'][i], sentense)
 
+    def test_study_pattern_with_same_phrase(self):
+        """Dictionary#study_pattern: 同じ単語と発言の組み合わせは学習しない"""
+        sentense = '波が立つ'
+        parts = analyze(sentense)
+        self.dictionary.study_pattern(sentense, parts)
+        self.dictionary.study_pattern(sentense, parts)
+        eq_(len(self.dictionary.pattern), 1)
+        eq_(self.dictionary.pattern[0]['phrases'], [sentense])
+
+    def test_match_pattern(self):
+        """Dictionary#match_pattern: 学習したパターンに一致する"""
+        sentense = '波が立つ'
+        self.dictionary.study_pattern(sentense, analyze(sentense))
+        pattern, match = self.dictionary.match_pattern('大きな波だ')
+        eq_(pattern['pattern'], '波')
+        eq_(match, '波')
+
     def test_save(self):
         """Dictionary#save: 正常に保存できる"""
         self.dictionary.save()
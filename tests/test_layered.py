@@ -0,0 +1,136 @@
+"""
+重ねた辞書(layeredモジュール)のテストを行うモジュール
+"""
+import os
+import random
+import tempfile
+from nose.tools import eq_, ok_, raises
+from unmo.dictionary import Dictionary
+from unmo.markov import Markov
+from unmo.responder import PatternResponder, TemplateResponder, MarkovResponder
+
+NOUN = '名詞,一般,*,*'
+PARTICLE = '助詞,係助詞,*,*'
+AUX = '助動詞,*,*,*'
+
+
+def parts_of(*words):
+    """単語のリストを、名詞と助詞・助動詞が交互に並んだ形態素解析結果の形にする"""
+    return [(word, NOUN if i % 2 == 0 else PARTICLE) for i, word in enumerate(words)]
+
+
+def make_base():
+    """共有の辞書を作成する"""
+    base = Dictionary(load=False)
+    base.random.add('こんにちは')
+    base.study('猫は好きです', [('猫', NOUN), ('は', PARTICLE), ('好き', NOUN), ('です', AUX)])
+    base.study_markov(parts_of('私', 'は', '猫', 'が', '好き'))
+    return base
+
+
+def test_study_writes_overlay():
+    """Dictionary: 共有の辞書に重ねると、学習した内容は上層にだけ書き込む"""
+    base = make_base()
+    persona = Dictionary(load=False, base=base)
+    persona.study('猫は魚です', [('猫', NOUN), ('は', PARTICLE), ('魚', NOUN), ('です', AUX)])
+    persona.study('猫は好きです', [('猫', NOUN), ('は', PARTICLE), ('好き', NOUN), ('です', AUX)])
+
+    eq_(list(base.random), ['こんにちは', '猫は好きです'])
+    eq_(list(persona.random), ['こんにちは', '猫は好きです', '猫は魚です'])
+    eq_(persona.random[-1], '猫は魚です')
+    eq_(persona.random.index('猫は魚です'), 2)
+    eq_(persona.sizes()['random'], 3)
+
+    eq_(base.pattern.get('猫')['phrases'], ['猫は好きです'])
+    eq_(persona.pattern.get('猫')['phrases'], ['猫は好きです', '猫は魚です'])
+    eq_(persona.pattern.get('魚')['phrases'], ['猫は魚です'])
+    eq_([p['pattern'] for p in persona.pattern], ['猫', '好き', '魚'])
+
+    eq_(base.template.frequency('%noun%は%noun%です'), 1)
+    eq_(persona.template.frequency('%noun%は%noun%です'), 3)
+    eq_(persona.template.total, 1)
+
+
+def test_responders():
+    """Responder: 重ねた辞書の両方の層から応答を作成できる"""
+    base = make_base()
+    persona = Dictionary(load=False, base=base)
+    persona.study('猫は魚です', [('猫', NOUN), ('は', PARTICLE), ('魚', NOUN), ('です', AUX)])
+    rng = random.Random(0)
+
+    responder = PatternResponder('Pattern', persona)
+    eq_({responder.response('猫を見た', [], rng) for _ in range(50)}, {'猫は好きです', '猫は魚です'})
+    eq_(responder.response('魚を見た', [], rng), '猫は魚です')
+
+    responder = TemplateResponder('Template', persona)
+    parts = [('犬', NOUN), ('が', PARTICLE), ('鳥', NOUN)]
+    eq_(responder.response('', parts, rng), '犬は鳥です')
+
+    responder = MarkovResponder('Markov', persona)
+    eq_(responder.response('', [('魚', NOUN)], rng), '猫は魚です')
+
+
+def test_markov_merges_counts():
+    """LayeredMarkov#generate: 両方の層の遷移をまとめた辞書と同じ文章を生成する"""
+    base = make_base()
+    persona = Dictionary(load=False, base=base)
+    persona.study_markov(parts_of('猫', 'が', '嫌い', 'です'))
+    merged = Markov()
+    merged.merge(base.markov)
+    merged.merge(persona.markov.overlay)
+
+    rng = random.Random(0)
+    generated = {persona.markov.generate('猫', rng) for _ in range(200)}
+    expected = {merged.generate('猫', rng) for _ in range(200)}
+    eq_(generated, expected)
+    ok_('私は猫が嫌いです' in generated)
+    eq_(persona.markov.sizes()['transitions'], 7 + 3)
+    eq_(base.markov.sizes()['transitions'], 7)
+
+
+def test_personas_share_base():
+    """Dictionary: 人格ごとの辞書は、dict_dirに自身が学習した内容だけを保存する"""
+    base = make_base()
+    with tempfile.TemporaryDirectory() as root:
+        alice, bob = os.path.join(root, 'alice'), os.path.join(root, 'bob')
+        persona = Dictionary(dict_dir=alice, base=base)
+        eq_(list(persona.random), ['こんにちは', '猫は好きです'])
+        persona.study('犬は魚です', [('犬', NOUN), ('は', PARTICLE), ('魚', NOUN), ('です', AUX)])
+        persona.save()
+        other = Dictionary(dict_dir=bob, base=base)
+        eq_(other.pattern.get('犬'), None)
+
+        with open(Dictionary.dicfile('random', alice), encoding='utf-8') as f:
+            eq_(f.read(), '犬は魚です')
+        ok_(not os.path.exists(bob))
+
+        reloaded = Dictionary(dict_dir=alice, base=base)
+        eq_(list(reloaded.random), ['こんにちは', '猫は好きです', '犬は魚です'])
+        eq_(reloaded.pattern.get('犬')['phrases'], ['犬は魚です'])
+        eq_(reloaded.markov.generate('犬'), '犬は魚です')
+
+
+@raises(ValueError)
+def test_base_with_markov_order():
+    """Dictionary: 共有の辞書に重ねる場合は、マルコフ辞書の次数を指定できない"""
+    Dictionary(load=False, base=make_base(), markov_order=3)
+
+
+@raises(ValueError)
+def test_base_with_ngram_markov():
+    """Dictionary: NgramMarkovのマルコフ辞書を持つ辞書には重ねられない"""
+    with tempfile.TemporaryDirectory() as base_dir:
+        base = Dictionary(load=False, markov_order=3, dict_dir=base_dir)
+        base.study_markov(parts_of('私', 'は', '猫'))
+        base.save()
+        Dictionary(base=Dictionary(dict_dir=base_dir), load=False)
+
+
+@raises(ValueError)
+def test_overlay_with_ngram_markov():
+    """Dictionary: 上層のマルコフ辞書がNgramMarkovのファイルであれば重ねられない"""
+    with tempfile.TemporaryDirectory() as dict_dir:
+        persona = Dictionary(load=False, markov_order=3, dict_dir=dict_dir)
+        persona.study_markov(parts_of('私', 'は', '猫'))
+        persona.save()
+        Dictionary(base=make_base(), dict_dir=dict_dir)
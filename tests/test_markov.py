@@ -0,0 +1,246 @@
+"""
+Markovクラスのテストを行うモジュール
+"""
+import os
+import pickle
+import tempfile
+from collections import Counter
+from nose.tools import eq_, ok_
+from unmo.markov import Markov, ChainTable
+from unmo import markovfile
+
+
+def parts_of(*words):
+    """単語のリストを形態素解析結果の形にする"""
+    return [(word, '名詞,一般,*,*') for word in words]
+
+
+def test_chain_table_counts():
+    """ChainTable#add: 同じ遷移は出現数として記録する"""
+    table = ChainTable()
+    ok_(table.add(1, 2, 3))
+    ok_(not table.add(1, 2, 3))
+    ok_(not table.add(1, 2, 4))
+    eq_(sorted(table.suffixes(1, 2)), [(3, 2), (4, 1)])
+    eq_(len(table), 1)
+    ok_((1, 2) in table)
+    ok_((2, 1) not in table)
+
+
+def test_chain_table_grow():
+    """ChainTable: 状態が増えてもすべて参照できる"""
+    table = ChainTable()
+    for i in range(1, 1000):
+        table.add(i, i + 1, i + 2)
+    eq_(len(table), 999)
+    for i in range(1, 1000):
+        eq_(list(table.suffixes(i, i + 1)), [(i + 2, 1)])
+
+
+def test_generate_weighted():
+    """Markov#generate: 接尾辞は出現数で重み付けして選択する"""
+    markov = Markov()
+    for _ in range(3):
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+    markov.add_sentence(parts_of('私', 'は', '犬'))
+    counts = Counter(markov.generate('私') for _ in range(4000))
+    eq_(set(counts), {'私は猫', '私は犬'})
+    ok_(2700 < counts['私は猫'] < 3300)
+
+
+def test_generate_empty():
+    """Markov#generate: 辞書が空であればNoneを返す"""
+    ok_(Markov().generate('私') is None)
+
+
+def test_save_and_load():
+    """Markov#save: 保存した辞書を読み込める"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫'))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        loaded = Markov()
+        loaded.load(filename)
+    eq_(loaded.generate('私'), '私は猫')
+
+
+def test_load_legacy():
+    """Markov#load: 旧形式の辞書を読み込める"""
+    dic = {'私': {'は': ['猫', '猫', '%END%']}, 'は': {'猫': ['%END%']}}
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        with open(filename, 'wb') as f:
+            pickle.dump((dic, {'私': 1}), f)
+        markov = Markov()
+        markov.load(filename)
+    ok_(markov.generate('私') in ('私は', '私は猫'))
+    eq_(markov._starts, {markov._ids['私']: 1})
+
+
+def test_generate_unknown_keyword():
+    """Markov#generate: 存在しないキーワードで辞書を変更しない"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫'))
+    eq_(markov.generate('犬'), '私は猫')
+    ok_('犬' not in markov._ids)
+    eq_(len(markov._seconds), 2)
+
+
+def test_generate_weighted_starts():
+    """Markov#generate: weighted_startsであれば学習した回数で始まりの単語を選ぶ"""
+    markov = Markov(weighted_starts=True)
+    for _ in range(9):
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+    markov.add_sentence(parts_of('君', 'は', '犬'))
+    counts = Counter(markov.generate('') for _ in range(2000))
+    ok_(1650 < counts['私は猫'] < 1950)
+
+
+def test_weighted_starts_saved_as_counts():
+    """Markov#save: 文章の始まりは単語ごとの回数だけを保存し、読み込んだ後も重み付けして選ぶ"""
+    markov = Markov(weighted_starts=True)
+    for _ in range(900):
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+    markov.add_sentence(parts_of('君', 'は', '犬'))
+    eq_(markov.start_weight(), 901)
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        eq_(len(markovfile.read(filename)['startcnt']), 2)
+        ok_('startevs' not in markovfile.read(filename))
+        loaded = Markov(weighted_starts=True)
+        loaded.load(filename)
+        eq_(loaded.start_weight(), 901)
+        counts = Counter(loaded.generate('') for _ in range(1000))
+        ok_(counts['私は猫'] > 950)
+        loaded.add_sentence(parts_of('君', 'は', '犬'))
+        eq_(loaded.start_weight(), 902)
+
+
+def test_load_mapped_and_study():
+    """Markov#load: mmapした辞書から学習を続け、保存し直せる"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫'))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        mapped = Markov()
+        mapped.load(filename)
+        ok_(mapped._mapped)
+        eq_(mapped.generate('私'), '私は猫')
+        ok_(mapped.generate('犬') == '私は猫')
+
+        mapped.add_sentence(parts_of('君', 'は', '犬'))
+        ok_(mapped._mapped is None)
+        mapped.save(filename)
+        reloaded = Markov()
+        reloaded.load(filename)
+    eq_(reloaded.generate('君'), '君は犬')
+    eq_(reloaded.generate('私'), '私は猫')
+    eq_(len(reloaded._starts), 2)
+
+
+def test_convert_legacy():
+    """markovfile: 旧形式の辞書をバイナリ形式に変換できる"""
+    dic = {'私': {'は': ['猫']}, 'は': {'猫': ['%END%']}}
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        with open(filename, 'wb') as f:
+            pickle.dump((dic, {'私': 1}), f)
+        markov = Markov()
+        markov.load(filename)
+        markov.save(filename)
+        ok_(markovfile.is_markov_file(filename))
+        converted = Markov()
+        converted.load(filename)
+    eq_(converted.generate('私'), '私は猫')
+
+
+def test_prune():
+    """Markov#prune: 出現数の少ない遷移と、使われなくなった単語・開始点を取り除く"""
+    markov = Markov()
+    for _ in range(3):
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+    markov.add_sentence(parts_of('君', 'は', '犬'))
+    markov.add_sentence(parts_of('私', 'は', '犬'))
+
+    eq_(markov.prune(2), 2)
+    eq_(markov.sizes(), {'words': 4, 'states': 3, 'transitions': 3, 'starts': 1})
+    eq_(markov.generate('君'), '私は猫')
+
+
+def test_prune_dead_end():
+    """Markov#prune: 続く状態が取り除かれていれば、そこで文章を終える"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫', 'だ'))
+    markov.add_sentence(parts_of('私', 'は', '猫', 'だ'))
+    markov.add_sentence(parts_of('私', 'は', '犬'))
+    markov.prune(2)
+    eq_(markov.generate('私'), '私は猫だ')
+    markov.prune(3)
+    ok_(markov.generate('私') is None)
+
+
+def test_prune_mapped():
+    """Markov#prune: mmapした辞書を取り除いて保存できる"""
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov = Markov()
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+        markov.add_sentence(parts_of('君', 'は', '犬'))
+        markov.save(filename)
+
+        mapped = Markov()
+        mapped.load(filename)
+        eq_(mapped.prune(2), 2)
+        mapped.save(filename)
+
+        reloaded = Markov()
+        reloaded.load(filename)
+        eq_(reloaded.sizes()['states'], 2)
+        eq_(reloaded.generate('君'), '私は猫')
+
+
+def test_generate_around_keyword():
+    """Markov#generate: 文頭に現れたことのないkeywordからも、前後へ伸ばして文章を生成する"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫', 'が', '好き'))
+    markov.add_sentence(parts_of('君', 'は', '犬', 'が', '好き'))
+    eq_(markov.generate('猫'), '私は猫が好き')
+    eq_(set(markov.generate('好き') for _ in range(200)), {'私は猫が好き', '君は犬が好き'})
+    eq_(markov.generate('犬'), '君は犬が好き')
+
+
+def test_generate_around_keyword_mapped():
+    """Markov#load: 後ろ向きの連鎖と転置索引も保存し、mmapして使う"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫', 'が', '好き'))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        mapped = Markov()
+        mapped.load(filename)
+        eq_(mapped.generate('が'), '私は猫が好き')
+        mapped.add_sentence(parts_of('君', 'は', '犬', 'が', '嫌い'))
+        eq_(mapped.generate('嫌い'), '君は犬が嫌い')
+
+
+def test_derive_backward_from_version1():
+    """Markov#load: 後ろ向きの連鎖の無い辞書では、前向きの遷移から作成する"""
+    markov = Markov()
+    markov.add_sentence(parts_of('私', 'は', '猫', 'が', '好き'))
+    sections = markov._chains.sections()
+    sections.update(markovfile.TokenTable.sections(markov._tokens))
+    sections.update(markovfile.OffsetMap.sections(markov._seconds, len(markov._tokens),
+                                                  'secoffs', 'seconds'))
+    sections['startwds'] = markov._start_words
+    sections['startcnt'] = markov._start_words
+    sections['startevs'] = markov._start_words
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markovfile.write(filename, sections)
+        loaded = Markov()
+        loaded.load(filename)
+        eq_(loaded.generate('猫'), '私は猫が好き')
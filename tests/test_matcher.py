@@ -0,0 +1,62 @@
+"""
+PatternMatcherクラスのテストを行うモジュール
+"""
+from nose.tools import eq_, ok_
+from unmo.matcher import PatternMatcher
+
+
+def test_search():
+    """PatternMatcher#search: 一致したパターンと文字列を返す"""
+    pattern = {'pattern': '波', 'phrases': ['波が立つ']}
+    matcher = PatternMatcher([pattern])
+    eq_(matcher.search('大きな波だ'), (pattern, '波'))
+
+
+def test_search_not_found():
+    """PatternMatcher#search: 一致しなければNoneを返す"""
+    matcher = PatternMatcher([{'pattern': '波', 'phrases': ['波が立つ']}])
+    ok_(matcher.search('風が吹く') is None)
+
+
+def test_search_first_registered():
+    """PatternMatcher#search: 先に登録されたパターンを優先する"""
+    first = {'pattern': '風', 'phrases': ['風が吹く']}
+    second = {'pattern': '波', 'phrases': ['波が立つ']}
+    matcher = PatternMatcher([first, second])
+    eq_(matcher.search('波と風'), (first, '風'))
+    eq_(matcher.search('風と波'), (first, '風'))
+
+
+def test_search_regex():
+    """PatternMatcher#search: 正規表現のパターンはre.searchで照合する"""
+    literal = {'pattern': '天気', 'phrases': ['いい天気']}
+    regex = {'pattern': 'こん(にち|ばん)は', 'phrases': ['%match%！'], 'regex': True}
+    matcher = PatternMatcher([regex, literal])
+    eq_(matcher.search('こんばんは、いい天気'), (regex, 'こんばんは'))
+
+
+def test_search_symbols():
+    """PatternMatcher#search: 'regex'の無いパターンは、記号を含んでいても文字列として照合する"""
+    plus = {'pattern': '++', 'phrases': ['C++が好きです']}
+    paren = {'pattern': '(笑)', 'phrases': ['(笑)']}
+    matcher = PatternMatcher([plus, paren])
+    eq_(matcher.search('C++です'), (plus, '++'))
+    eq_(matcher.search('笑'), None)
+    eq_(matcher.search('それは(笑)'), (paren, '(笑)'))
+
+
+def test_parse_and_escape():
+    """PatternMatcher#parse: エスケープした単語とコンパイルできない単語は文字列に戻す"""
+    for word in ['++', '(笑)', '[', '**', '?', '猫']:
+        eq_(PatternMatcher.parse(PatternMatcher.escape(word)), (word, False))
+    eq_(PatternMatcher.parse('**'), ('**', False))
+    eq_(PatternMatcher.parse('^(猫|犬)$'), ('^(猫|犬)$', True))
+
+
+def test_add():
+    """PatternMatcher#add: 登録後の検索に反映される"""
+    matcher = PatternMatcher()
+    ok_(matcher.search('名詞です') is None)
+    pattern = {'pattern': '名詞', 'phrases': ['名詞です']}
+    matcher.add(pattern)
+    eq_(matcher.search('名詞です'), (pattern, '名詞'))
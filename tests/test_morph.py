@@ -0,0 +1,64 @@
+"""
+形態素解析モジュールのテストを行うモジュール
+"""
+from nose.tools import eq_, ok_
+from unmo import morph
+from unmo.morph import AnalysisCache, analyze
+
+
+def test_analyze_immutable():
+    """analyze: 変更できないタプルを返す"""
+    parts = analyze('私はプログラムです')
+    ok_(isinstance(parts, tuple))
+    ok_(all(isinstance(part, tuple) for part in parts))
+    eq_(parts[0][0], '私')
+
+
+def test_analyze_cached():
+    """analyze: 同じ文字列の解析結果はキャッシュから返す"""
+    morph.CACHE.clear()
+    first = analyze('波が立つ')
+    second = analyze('波が立つ')
+    ok_(first is second)
+    info = morph.cache_info()
+    eq_((info.hits, info.misses), (1, 1))
+
+
+def test_cache_eviction():
+    """AnalysisCache: 上限を超えると最も古く使われたものから追い出す"""
+    cache = AnalysisCache(maxsize=2)
+    cache.put('a', ())
+    cache.put('b', ())
+    cache.get('a')
+    cache.put('c', ())
+    ok_(cache.get('b') is None)
+    ok_(cache.get('a') is not None)
+    eq_(cache.info().evictions, 1)
+    eq_(cache.info().currsize, 2)
+
+
+def test_cache_disabled():
+    """AnalysisCache: 上限が0であればキャッシュしない"""
+    cache = AnalysisCache(maxsize=0)
+    cache.put('a', ())
+    ok_(cache.get('a') is None)
+
+
+def test_is_keyword():
+    """is_keyword: 名詞の一般・代名詞・固有名詞・サ変接続・形容動詞語幹をキーワードとする"""
+    ok_(morph.is_keyword('名詞,一般,*,*'))
+    ok_(morph.is_keyword('名詞,固有名詞,人名,名'))
+    ok_(not morph.is_keyword('名詞,数,*,*'))
+    ok_(not morph.is_keyword('助詞,格助詞,一般,*'))
+
+
+def test_set_keyword_classes():
+    """set_keyword_classes: キーワードとする品詞を変更できる"""
+    try:
+        morph.set_keyword_classes(['名詞', '動詞,自立'])
+        ok_(morph.is_keyword('名詞,数,*,*'))
+        ok_(morph.is_keyword('動詞,自立,*,*'))
+        ok_(not morph.is_keyword('動詞,非自立,*,*'))
+    finally:
+        morph.set_keyword_classes(morph.KEYWORD_CLASSES)
+    ok_(not morph.is_keyword('名詞,数,*,*'))
@@ -0,0 +1,177 @@
+"""
+NgramMarkovクラスのテストを行うモジュール
+"""
+import os
+import random
+import shutil
+import tempfile
+from array import array
+from nose.tools import eq_, ok_, raises, with_setup
+from unmo.dictionary import Dictionary
+from unmo.markov import Markov
+from unmo.ngram import NgramMarkov
+from unmo import markovfile
+from unmo.markovfile import ChildIndex
+
+
+def parts_of(*words):
+    """単語のリストを形態素解析結果の形にする"""
+    return [(word, '名詞,一般,*,*') for word in words]
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def test_generate_from_keyword():
+    """NgramMarkov#generate: keywordに続く単語があれば、keywordから文章を始める"""
+    markov = NgramMarkov(3)
+    markov.add_sentence(parts_of('私', 'は', '猫', 'が', '好き'))
+    eq_(markov.generate('私'), '私は猫が好き')
+    eq_(markov.generate('猫'), '猫が好き')
+    eq_(markov.generate('犬'), '私は猫が好き')
+
+
+def test_generate_empty():
+    """NgramMarkov#generate: 辞書が空であればNoneを返す"""
+    ok_(NgramMarkov().generate('私') is None)
+
+
+def test_higher_order_is_coherent():
+    """NgramMarkov: 次数が高いほど、長い文脈に従って単語を選ぶ"""
+    markov = NgramMarkov(4)
+    markov.add_sentence(parts_of('赤い', '猫', 'が', '鳴く'))
+    markov.add_sentence(parts_of('青い', '鳥', 'が', '飛ぶ'))
+    rng = random.Random(0)
+    eq_({markov.generate('赤い', rng) for _ in range(50)}, {'赤い猫が鳴く'})
+    eq_({markov.generate('赤い', rng, order=2) for _ in range(200)},
+        {'赤い猫が鳴く', '赤い猫が飛ぶ'})
+
+
+def test_backoff():
+    """NgramMarkov#_choose: 長い文脈が記録されていなければ、短い文脈で選択する"""
+    markov = NgramMarkov(3)
+    markov.add_sentence(parts_of('猫', 'が', '鳴く'))
+    markov.add_sentence(parts_of('犬', 'は', '吠える'))
+    ids = markov._ids
+    # 文脈(犬, が)は無いため、文脈(が)に続く単語を選ぶ
+    eq_(markov._choose([ids['犬'], ids['が']], random), ids['鳴く'])
+    # 文脈(吠える)に続く単語はENDMARKだけである
+    eq_(markov._choose([ids['は'], ids['吠える']], random), markov._end)
+
+
+def test_shared_contexts():
+    """NgramMarkov: 低い次数の文脈は、高い次数の文脈と節点を共有する"""
+    markov = NgramMarkov(5)
+    markov.add_sentence(parts_of('a', 'b', 'c', 'd', 'e'))
+    # 各位置から始まる長さ5までのn-gram: (a)(a b)...(a b c d e)、(b)...(b c d e END)、...
+    # 短いn-gramは長いn-gramの途中の節点であり、別に記録しない
+    eq_(markov.sizes()['transitions'], 5 + 5 + 4 + 3 + 2 + 1)
+    eq_(len(markov._children), 20)
+
+
+def test_save_and_load():
+    """NgramMarkov#save: 保存した辞書を読み込み、続けて学習できる"""
+    markov = NgramMarkov(4)
+    markov.add_sentence(parts_of('私', 'は', '猫', 'が', '好き'))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        ok_(NgramMarkov.is_ngram_file(filename))
+        loaded = NgramMarkov()
+        loaded.load(filename)
+        eq_(loaded.order, 4)
+        eq_(loaded.generate('私'), '私は猫が好き')
+        eq_(loaded.sizes(), markov.sizes())
+        loaded.add_sentence(parts_of('犬', 'は', '猫', 'が', '嫌い'))
+        eq_(loaded.generate('犬', random.Random(0))[:4], '犬は猫が')
+
+
+def test_weighted_starts():
+    """NgramMarkov#generate: weighted_startsであれば、保存した回数で始まりの単語を重み付けして選ぶ"""
+    markov = NgramMarkov(3, weighted_starts=True)
+    for _ in range(900):
+        markov.add_sentence(parts_of('私', 'は', '猫'))
+    markov.add_sentence(parts_of('君', 'は', '犬'))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        ok_('startevs' not in markovfile.read(filename))
+        loaded = NgramMarkov(weighted_starts=True)
+        loaded.load(filename)
+        rng = random.Random(0)
+        starts = [loaded.generate('', rng)[0] for _ in range(1000)]
+        ok_(starts.count('私') > 950)
+
+
+def test_load_without_child_table():
+    """NgramMarkov#load: 子の節点を引く表はメモリ上に作らず、mmapしたファイルを二分探索する"""
+    markov = NgramMarkov(3)
+    for words in (('私', 'は', '猫', 'が', '好き'), ('私', 'は', '犬', 'が', '嫌い')):
+        markov.add_sentence(parts_of(*words))
+    with tempfile.TemporaryDirectory() as dicdir:
+        filename = os.path.join(dicdir, 'markov.dat')
+        markov.save(filename)
+        loaded = NgramMarkov()
+        loaded.load(filename)
+        ok_(isinstance(loaded._children, ChildIndex))
+        for path, _ in markov._ngrams():
+            eq_(loaded._node(path), markov._node(path))
+        ok_(loaded._node([0, 0]) is None)
+        del loaded, markov
+
+        # 子の節点を引くセクションの無い古いファイルも読み込める
+        sections = markovfile.read(filename)
+        for name in ('childoffs', 'childlbls', 'childord'):
+            del sections[name]
+        markovfile.write(filename, {name: array(values.format, values) for name, values in sections.items()})
+        del sections
+        old = NgramMarkov()
+        old.load(filename)
+        eq_(old.generate('私', random.Random(0))[:2], '私は')
+
+
+def test_merge_and_prune():
+    """NgramMarkov#merge: 分割して学習した辞書を取り込むと、まとめて学習した場合と同じになる"""
+    sentences = [parts_of('私', 'は', '猫', 'が', '好き'), parts_of('私', 'は', '犬', 'が', '好き')]
+    whole = NgramMarkov(3)
+    merged = NgramMarkov(3)
+    for parts in sentences:
+        whole.add_sentence(parts)
+        part = NgramMarkov(3)
+        part.add_sentence(parts)
+        merged.merge(part)
+    eq_(sorted(merged._ngrams()), sorted(whole._ngrams()))
+    eq_(merged._starts, whole._starts)
+
+    removed = whole.prune(2)
+    ok_(removed > 0)
+    ok_(whole.generate('私').startswith('私は'))
+    ok_(all(count >= 2 for _, count in whole._ngrams()))
+
+
+@raises(TypeError)
+def test_merge_mismatched():
+    """NgramMarkov#merge: Markovの辞書は取り込めない"""
+    other = Markov()
+    other.add_sentence(parts_of('私', 'は', '猫'))
+    NgramMarkov(3).merge(other)
+
+
+@raises(ValueError)
+def test_invalid_order():
+    """NgramMarkov: 次数は1から5まで"""
+    NgramMarkov(6)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dictionary_markov_order():
+    """Dictionary: markov_orderを指定するとNgramMarkovを作成し、保存後はファイルから判別して読み込む"""
+    d = Dictionary(markov_order=4)
+    ok_(isinstance(d.markov, NgramMarkov))
+    d.study_markov(parts_of('私', 'は', '猫', 'が', '好き'))
+    d.save()
+    ok_(isinstance(Dictionary().markov, NgramMarkov))
+    ok_(isinstance(Dictionary(load=False).markov, Markov))
@@ -0,0 +1,86 @@
+"""
+ResponsePoolクラスのテストを行うモジュール
+"""
+import time
+import random
+from nose.tools import eq_, ok_
+from unmo.dictionary import Dictionary
+from unmo.pool import ResponsePool
+from unmo.responder import MarkovResponder
+from unmo.stats import Stats
+
+
+def parts_of(*words):
+    """単語のリストを形態素解析結果の形にする"""
+    return [(word, '名詞,一般,*,*') for word in words]
+
+
+def study(dictionary, *words):
+    dictionary.study_markov(parts_of(*words))
+
+
+def test_take_and_fill():
+    """ResponsePool#fill: takeで登録されたキーワードの応答を、per_keyword個まで補充する"""
+    d = Dictionary(load=False)
+    study(d, '私', 'は', '猫')
+    pool = ResponsePool(per_keyword=3, seed=0)
+    ok_(pool.take('猫') is None)
+    eq_(pool.fill(d.markov), 3)
+    eq_(pool.fill(d.markov), 0)
+    eq_([pool.take('猫') for _ in range(4)], ['私は猫'] * 3 + [None])
+    eq_((pool.hits, pool.misses), (3, 2))
+
+
+def test_invalidate_on_study():
+    """Dictionary#study_markov: 学習した文章の単語について、蓄えた応答を捨てる"""
+    pool = ResponsePool(per_keyword=2, seed=0)
+    d = Dictionary(load=False, pool=pool)
+    study(d, '私', 'は', '猫')
+    pool.take('猫')
+    pool.take('犬')
+    pool.fill(d.markov)
+    study(d, '君', 'は', '犬')
+    eq_(pool.take('犬'), None)
+    eq_(pool.take('猫'), '私は猫')
+    pool.fill(d.markov)
+    eq_(pool.take('犬'), '君は犬')
+
+
+def test_bounded_keywords():
+    """ResponsePool: キーワードが上限を超えると、使われた回数の少ないものから取り除く"""
+    d = Dictionary(load=False)
+    study(d, '私', 'は', '猫')
+    pool = ResponsePool(per_keyword=1, max_keywords=2, seed=0)
+    pool.take('私')
+    pool.take('私')
+    pool.take('は')
+    pool.take('猫')
+    eq_(sorted(pool._ready), ['猫', '私'])
+
+
+def test_limit():
+    """ResponsePool#fill: limitを指定すると、その数だけ生成する"""
+    d = Dictionary(load=False)
+    study(d, '私', 'は', '猫')
+    pool = ResponsePool(per_keyword=5)
+    pool.take('私')
+    eq_(pool.fill(d.markov, limit=2), 2)
+
+
+def test_background_refill():
+    """ResponsePool#start: 応答が途切れている間に補充し、MarkovResponderはそれを返す"""
+    pool = ResponsePool(per_keyword=4, seed=0)
+    d = Dictionary(load=False, pool=pool)
+    study(d, '私', 'は', '猫')
+    stats = Stats()
+    responder = MarkovResponder('Markov', d, stats)
+    eq_(responder.response('猫', parts_of('猫'), random.Random(0)), '私は猫')
+    pool.start(d, idle=0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while len(pool._ready['猫']) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+    eq_(responder.response('猫', parts_of('猫'), random.Random(0)), '私は猫')
+    eq_(stats.snapshot()['counters'], {'pool.miss': 1, 'pool.hit': 1})
@@ -0,0 +1,174 @@
+"""
+PreforkServerクラスのテストを行うモジュール
+"""
+import gc
+import os
+import weakref
+import socket
+import shutil
+import threading
+from nose.tools import eq_, ok_, raises, with_setup
+from unmo.dictionary import Dictionary
+from unmo.prefork import PreforkServer
+from unmo.capacity import Capacity
+from unmo.morph import analyze
+from unmo.stats import Stats
+from unmo.unmo import Unmo
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def talk(address, *texts):
+    """addressに接続してtextsを順に送り、応答のリストを返す"""
+    with socket.create_connection(address) as conn, conn.makefile('rwb') as f:
+        responses = []
+        for text in texts:
+            f.write(text.encode('utf-8') + b'\n')
+            f.flush()
+            responses.append(f.readline())
+        f.write(b'\n')
+        f.flush()
+    return responses
+
+
+def start(unmo=None, **kwargs):
+    """ワーカーを2つ持つPreforkServerを起動し、serve_foreverを別スレッドで実行する"""
+    unmo = unmo if unmo is not None else Unmo('test', Dictionary())
+    server = PreforkServer(unmo, port=0, workers=2, **kwargs)
+    server.start()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    return server, thread
+
+
+def stop(server, thread):
+    server.close()
+    thread.join()
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_workers_send_updates():
+    """PreforkServer: ワーカーが応答し、学習内容は親の辞書に届いて保存される"""
+    sentences = ['波が立つ', '風が吹く', '雨が降る']
+    server, thread = start()
+    try:
+        eq_(len(server.workers), 2)
+        for text in sentences:
+            response, = talk(server.address, text)
+            ok_(response.endswith(b'\n'))
+    finally:
+        stop(server, thread)
+    eq_(server.learned, 3)
+    eq_(set(Dictionary.load_random()), {'こんにちは'} | set(sentences))
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_workers_send_usage():
+    """PreforkServer: ワーカーでの計測と、応答に使われた項目の記録は親に届く"""
+    text = '波が立つ'
+    stats = Stats()
+    dictionary = Dictionary(limits={'pattern': Capacity(100, 'lfu')})
+    dictionary.study(text, analyze(text))
+    server, thread = start(Unmo('test', dictionary, stats))
+    try:
+        talk(server.address, *[text] * 30)
+    finally:
+        stop(server, thread)
+    timers = stats.snapshot()['timers']
+    eq_(timers['analyze']['count'], 30)
+    eq_(sum(timer['count'] for name, timer in timers.items() if name.startswith('respond.')), 30)
+    # 学習で1 + 30回記録され、パターン辞書から応答するたびにさらに記録される
+    ok_(dictionary._limits['pattern']._counts['波'] > 31)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_fork_while_locked():
+    """PreforkServer: 計測や使用の記録のロックを取得している間にforkしても、ワーカーは応答できる"""
+    text = '波が立つ'
+    stats = Stats()
+    dictionary = Dictionary(limits={'pattern': Capacity(100, 'lfu')})
+    dictionary.study(text, analyze(text))
+    capacity = dictionary._limits['pattern']
+    with stats._lock, capacity._lock:
+        server, thread = start(Unmo('test', dictionary, stats))
+    try:
+        responses = []
+        talker = threading.Thread(target=lambda: responses.extend(talk(server.address, text, text)),
+                                  daemon=True)
+        talker.start()
+        talker.join(5)
+        eq_(len(responses), 2)
+    finally:
+        stop(server, thread)
+
+
+@raises(ValueError)
+def test_reject_backend():
+    """PreforkServer: バックエンドを使う辞書は共有できない"""
+    from unmo.backend import SQLiteBackend
+    PreforkServer(Unmo('test', Dictionary(backend=SQLiteBackend(':memory:'))), port=0)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_refresh_workers():
+    """PreforkServer: refresh_everyだけ学習すると、ワーカーをforkし直す"""
+    server, thread = start(refresh_every=2)
+    try:
+        before = server.workers
+        talk(server.address, '波が立つ', '風が吹く')
+        for _ in range(500):
+            if not set(server.workers) & set(before):
+                break
+            thread.join(0.01)
+        eq_(len(server.workers), 2)
+        eq_(set(server.workers) & set(before), set())
+        talk(server.address, '雨が降る')
+    finally:
+        stop(server, thread)
+    eq_(server.learned, 3)
+
+
+class Garbage:
+    """循環参照のゴミ"""
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_refresh_does_not_freeze_garbage():
+    """PreforkServer: ワーカーをforkし直すときに、親の循環参照のゴミを凍結しない"""
+    server, thread = start(refresh_every=1)
+    try:
+        garbage = Garbage()
+        garbage.cycle = garbage
+        ref = weakref.ref(garbage)
+        del garbage
+        before = server.workers
+        talk(server.address, '波が立つ')
+        for _ in range(500):
+            if not set(server.workers) & set(before):
+                break
+            thread.join(0.01)
+    finally:
+        stop(server, thread)
+    gc.collect()
+    ok_(ref() is None)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_respawn_worker():
+    """PreforkServer: 終了したワーカーは作り直す"""
+    server, thread = start()
+    try:
+        killed = server.workers[0]
+        os.kill(killed, 9)
+        for _ in range(500):
+            if killed not in server.workers:
+                break
+            thread.join(0.01)
+        ok_(killed not in server.workers)
+        eq_(len(talk(server.address, '波が立つ')), 1)
+    finally:
+        stop(server, thread)
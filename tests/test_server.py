@@ -0,0 +1,79 @@
+"""
+UnmoServerクラスとRWLockクラスのテストを行うモジュール
+"""
+import asyncio
+import os
+import shutil
+import threading
+from nose.tools import eq_, ok_, with_setup
+from unmo.dictionary import Dictionary
+from unmo.server import UnmoServer
+from unmo.unmo import Unmo
+from unmo.util import RWLock
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def test_rwlock_readers_share():
+    """RWLock#read: 読み込みロックは同時に複数取得できる"""
+    lock = RWLock()
+    with lock.read():
+        acquired = threading.Event()
+
+        def reader():
+            with lock.read():
+                acquired.set()
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        ok_(acquired.wait(1))
+        thread.join()
+
+
+def test_rwlock_writer_excludes_readers():
+    """RWLock#write: 書き込みロックの間は読み込みを待たせる"""
+    lock = RWLock()
+    events = []
+    with lock.write():
+        def reader():
+            with lock.read():
+                events.append('read')
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        thread.join(0.1)
+        events.append('written')
+    thread.join()
+    eq_(events, ['written', 'read'])
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_sessions():
+    """UnmoServer: 複数のセッションに応答し、すべての発言を学習する"""
+    sentenses = ['波が立つ', '風が吹く', '雨が降る']
+
+    async def session(host, port, text):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(text.encode('utf-8') + b'\n')
+        response = await reader.readline()
+        writer.close()
+        return response
+
+    async def talk():
+        dictionary = Dictionary()
+        server = UnmoServer(Unmo('test', dictionary), port=0)
+        await server.start()
+        host, port = server.address
+        responses = await asyncio.gather(*(session(host, port, text) for text in sentenses))
+        await server.close()
+        return dictionary, responses
+
+    dictionary, responses = asyncio.run(talk())
+    for response in responses:
+        ok_(response.endswith(b'\n'))
+    eq_(set(dictionary.random), {'こんにちは'} | set(sentenses))
+    ok_(os.path.exists(Dictionary.dicfile('random')))
@@ -0,0 +1,73 @@
+"""
+Statsクラスのテストを行うモジュール
+"""
+import io
+import json
+import os
+import shutil
+from nose.tools import eq_, ok_, with_setup
+from unmo.dictionary import Dictionary
+from unmo.stats import Stats
+from unmo.unmo import Unmo
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+def test_timer_and_count():
+    """Stats#snapshot: 区間の回数と、名前ごとの回数を返す"""
+    stats = Stats()
+    for _ in range(3):
+        with stats.timer('study'):
+            pass
+    stats.record('respond.Pattern', 0.5)
+    stats.record('respond.Pattern', 0.25)
+    stats.record('respond.Random', 0.25)
+    stats.count('fallback.Pattern')
+
+    snapshot = stats.snapshot()
+    eq_(snapshot['timers']['study']['count'], 3)
+    eq_(snapshot['timers']['respond.Pattern']['max'], 0.5)
+    eq_(snapshot['responders']['Pattern'],
+        {'calls': 2, 'share': 2 / 3, 'hit_rate': 0.5, 'fallback_rate': 0.5})
+    eq_(snapshot['responders']['Random']['fallback_rate'], 0.0)
+
+    stats.reset()
+    eq_(stats.snapshot()['timers'], {})
+
+
+def test_drain_and_merge():
+    """Stats#drain: 取り出した記録は消去され、mergeで別のStatsに加えられる"""
+    worker, parent = Stats(), Stats()
+    parent.record('respond.Pattern', 0.25)
+    worker.record('respond.Pattern', 0.5)
+    worker.count('fallback.Pattern')
+    parent.merge(worker.drain())
+    eq_(worker.snapshot()['timers'], {})
+    timer = parent.snapshot()['timers']['respond.Pattern']
+    eq_((timer['count'], timer['total'], timer['max']), (2, 0.75, 0.5))
+    eq_(parent.snapshot()['counters'], {'fallback.Pattern': 1})
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_unmo_stats():
+    """Unmo: Statsを渡すと各区間の時間と辞書の大きさを記録する"""
+    stats = Stats()
+    unmo = Unmo('test', Dictionary(), stats)
+    for text in ['私は猫が好き', '猫は魚が好き', '散歩は楽しい']:
+        unmo.dialogue(text)
+
+    out = io.StringIO()
+    stats.dump(out, unmo.dictionary)
+    snapshot = json.loads(out.getvalue())
+    for name in ('dialogue', 'analyze', 'study'):
+        eq_(snapshot['timers'][name]['count'], 3)
+    eq_(sum(responder['calls'] for responder in snapshot['responders'].values()), 3)
+    eq_(snapshot['dictionary']['random'], 4)
+    eq_(snapshot['dictionary']['patterns'], len(unmo.dictionary.pattern))
+    eq_(snapshot['dictionary']['phrases'],
+        sum(len(pattern['phrases']) for pattern in unmo.dictionary.pattern))
+    ok_(snapshot['dictionary']['markov_states'] > 0)
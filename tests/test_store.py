@@ -0,0 +1,125 @@
+"""
+辞書のコンテナクラスのテストを行うモジュール
+"""
+import pickle
+import random
+from collections import Counter
+from random import choice
+from nose.tools import eq_, ok_
+from unmo.store import IndexedSet, PatternStore, TemplateStore
+
+
+def test_indexed_set_add():
+    """IndexedSet#add: 登録順を保ち、重複は追加しない"""
+    items = IndexedSet(['a', 'b'])
+    ok_(items.add('c'))
+    ok_(not items.add('a'))
+    eq_(items, ['a', 'b', 'c'])
+    eq_(items[-1], 'c')
+    ok_('b' in items)
+    eq_(items.index('c'), 2)
+
+
+def test_indexed_set_choice():
+    """IndexedSet: random.choiceで選択できる"""
+    items = IndexedSet(['a', 'b'])
+    ok_(choice(items) in ('a', 'b'))
+
+
+def test_pattern_store_merge_duplicated():
+    """PatternStore: 同じ単語のパターンはまとめる"""
+    store = PatternStore([{'pattern': '波', 'phrases': ['波が立つ']},
+                          {'pattern': '波', 'phrases': ['波が引く', '波が立つ']}])
+    eq_(len(store), 1)
+    eq_(store[0], {'pattern': '波', 'phrases': ['波が立つ', '波が引く']})
+    eq_(store.get('波'), store[0])
+
+
+def test_pattern_store_shared_phrases():
+    """PatternStore: 同じフレーズは一つのフレーズ表に一度だけ持つ"""
+    store = PatternStore()
+    store.add('波', '大きな波が立つ')
+    store.add('大き', '大きな波が立つ')
+    store.add('波', '波が引く')
+    eq_(list(store.phrases), ['大きな波が立つ', '波が引く'])
+    eq_(store.get('大き')['phrases'], ['大きな波が立つ'])
+    eq_(list(store.get('波')['phrases'].ids), [0, 1])
+    restored = pickle.loads(pickle.dumps(store))
+    eq_(list(restored), list(store))
+
+
+def test_pattern_store_known_phrase():
+    """PatternStore#add: 前からある発言も、同じパターンには一度だけ追加する"""
+    store = PatternStore()
+    for word, text in [('波', '波が立つ'), ('波', '波が引く'), ('海', '波が立つ'),
+                       ('波', '波が立つ'), ('海', '波が立つ'), ('海', '波が引く')]:
+        store.add(word, text)
+    eq_(store.get('波')['phrases'], ['波が立つ', '波が引く'])
+    eq_(store.get('海')['phrases'], ['波が立つ', '波が引く'])
+    ok_(store.has('海', '波が引く'))
+    ok_(not store.has('海', '空が青い'))
+
+
+def test_pattern_store_remove_releases_phrases():
+    """PatternStore#remove_all: どのパターンからも参照されなくなったフレーズは取り除き、番号を詰める"""
+    store = PatternStore()
+    for word, text in [('空', '空が青い'), ('波', '大きな波が立つ'), ('大き', '大きな波が立つ'),
+                       ('波', '波が引く'), ('海', '海は広い')]:
+        store.add(word, text)
+    store.remove_all(['空', '大き'])
+    eq_(list(store.phrases), ['大きな波が立つ', '波が引く', '海は広い'])
+    eq_(store.get('波')['phrases'], ['大きな波が立つ', '波が引く'])
+    store.remove_all(['波'])
+    eq_(list(store.phrases), ['海は広い'])
+    eq_(store.get('海')['phrases'], ['海は広い'])
+    ok_(store.has('海', '海は広い'))
+    store.add('海', '海は広い')
+    store.add('海', '波が引く')
+    eq_(list(store.get('海')['phrases'].ids), [0, 1])
+
+
+def test_template_store_add():
+    """TemplateStore#add: 名詞の数ごとに保持し、同じテンプレートは出現数を増やす"""
+    store = TemplateStore()
+    ok_(store.add('%noun%は%noun%です'))
+    ok_(not store.add('%noun%は%noun%です'))
+    ok_(store.add('%noun%だ'))
+    ok_(not store.add('名詞なし'))
+    eq_(store[2], ['%noun%は%noun%です'])
+    eq_(sorted(store), [1, 2])
+    eq_(store.frequency('%noun%は%noun%です'), 2)
+
+
+def test_template_store_generate():
+    """TemplateStore#generate: 名詞の数が同じテンプレートを選び、順に名詞を埋める"""
+    store = TemplateStore([('%noun%は%noun%の%noun%です', 1), ('%noun%', 1)])
+    eq_(store.generate(['私', 'プログラム', '女の子']), '私はプログラムの女の子です')
+    eq_(store.generate(['猫']), '猫')
+    ok_(store.generate(['猫', '犬']) is None)
+
+
+def test_template_store_weighted():
+    """TemplateStore#choose: 出現数で重み付けして選択する"""
+    store = TemplateStore([('%noun%は', 1), ('%noun%が', 3)])
+    rng = random.Random(0)
+    counts = Counter(store.choose(1, rng) for _ in range(4000))
+    ok_(2.5 < counts['%noun%が'] / counts['%noun%は'] < 3.5)
+
+
+def test_template_store_large_frequency():
+    """TemplateStore#add: 出現数が大きくても、重み付けの配列は学習の回数の分しか伸びない"""
+    store = TemplateStore([('%noun%は', 10 ** 9), ('%noun%が', 1)])
+    for _ in range(100):
+        store.add('%noun%が')
+    ok_(len(store._events[1]) <= 4)
+    eq_(store.weight(1), 10 ** 9 + 101)
+    rng = random.Random(0)
+    eq_(store.choose(1, rng), '%noun%は')
+
+
+def test_template_store_pickle():
+    """TemplateStore: pickleして復元できる"""
+    store = TemplateStore([('%noun%は', 1), ('%noun%が', 3)])
+    restored = pickle.loads(pickle.dumps(store))
+    eq_(list(restored.entries()), list(store.entries()))
+    eq_(restored.generate(['猫'], random.Random(1)), store.generate(['猫'], random.Random(1)))
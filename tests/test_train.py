@@ -0,0 +1,55 @@
+"""
+コーパスの並列学習のテストを行うモジュール
+"""
+from nose.tools import eq_, ok_
+from unmo.dictionary import Dictionary
+from unmo.ngram import NgramMarkov
+from unmo.morph import analyze
+from unmo.train import iter_sentences, train
+
+
+CORPUS = ['私はプログラムの女の子です。波が立つ！波が引く',
+          'テンプレートを学習する？プログラムを作成する',
+          '私はプログラムの女の子です']
+
+
+def transitions(markov):
+    """マルコフ辞書の遷移を、単語の組から出現数への辞書にする"""
+    words = markov._tokens
+    return {(words[p1], words[p2], words[suffix]): count
+            for p1, p2 in markov._chains.states()
+            for suffix, count in markov._chains.suffixes(p1, p2)}
+
+
+def test_iter_sentences():
+    """iter_sentences: 行を文に分割し、空の文は返さない"""
+    eq_(list(iter_sentences(['波が立つ。波が引く', '', '。'])), ['波が立つ', '波が引く'])
+
+
+def test_train_same_as_serial():
+    """train: 並列に学習した辞書は、順に学習した辞書と同じ内容になる"""
+    serial = Dictionary(load=False)
+    for sentence in iter_sentences(CORPUS):
+        serial.study(sentence, analyze(sentence))
+
+    parallel = Dictionary(load=False)
+    train(parallel, iter_sentences(CORPUS), processes=2, chunk_size=2)
+
+    eq_(list(parallel.random), list(serial.random))
+    eq_(list(parallel.pattern), list(serial.pattern))
+    eq_(dict(parallel.template), dict(serial.template))
+    eq_(transitions(parallel.markov), transitions(serial.markov))
+
+
+def test_train_ngram():
+    """train: NgramMarkovの辞書には、同じ次数のNgramMarkovで学習してmergeする"""
+    serial = Dictionary(load=False, markov_order=4)
+    for sentence in iter_sentences(CORPUS):
+        serial.study(sentence, analyze(sentence))
+
+    parallel = Dictionary(load=False, markov_order=4)
+    train(parallel, iter_sentences(CORPUS), processes=1, chunk_size=2)
+
+    ok_(isinstance(parallel.markov, NgramMarkov))
+    eq_(parallel.markov.order, 4)
+    eq_(sorted(parallel.markov._ngrams()), sorted(serial.markov._ngrams()))
@@ -0,0 +1,46 @@
+"""
+Unmoクラスのテストを行うモジュール
+"""
+import os
+import random
+import shutil
+from nose.tools import eq_, with_setup
+from unmo.dictionary import Dictionary
+from unmo.unmo import Unmo
+
+
+SENTENSES = ['私は猫が好き', '猫は魚が好き', '犬は散歩が好き', '私は犬と散歩する',
+             '魚は海で泳ぐ', '猫と犬が遊ぶ', '私は海が好き', '散歩は楽しい']
+
+
+def remove_dic():
+    """辞書ファイルを削除する"""
+    if os.path.isdir(Dictionary.DICT_DIR):
+        shutil.rmtree(Dictionary.DICT_DIR)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dialogue_batch_seed():
+    """Unmo#dialogue_batch: 同じseedであれば同じ応答を返す"""
+    replays = [list(Unmo('test', Dictionary()).dialogue_batch(SENTENSES * 3, seed=42))
+               for _ in range(2)]
+    eq_(replays[0], replays[1])
+    eq_([reply.text for reply in replays[0]], SENTENSES * 3)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dialogue_batch_keeps_global_random():
+    """Unmo#dialogue_batch: randomモジュールの状態を変更しない"""
+    state = random.getstate()
+    list(Unmo('test', Dictionary()).dialogue_batch(SENTENSES, seed=1))
+    eq_(random.getstate(), state)
+
+
+@with_setup(setup=remove_dic, teardown=remove_dic)
+def test_dialogue_batch_study():
+    """Unmo#dialogue_batch: studyがFalseであれば学習しない"""
+    unmo = Unmo('test', Dictionary())
+    list(unmo.dialogue_batch(SENTENSES, study=False))
+    eq_(list(unmo._dictionary.random), ['こんにちは'])
+    list(unmo.dialogue_batch(SENTENSES))
+    eq_(list(unmo._dictionary.random), ['こんにちは'] + SENTENSES)
@@ -0,0 +1,90 @@
+import asyncio
+from .unmo import Unmo
+
+
+class AsyncUnmo:
+    """Unmoをasyncioから使うためのクラス。
+
+    dialogueは応答が決まった時点で返り、学習はキューに積まれる。
+    キューに積まれた学習は、バックグラウンドのタスクが受け付けた順に一つずつ行う。
+    学習は応答と同じイベントループ上で行うため、応答の途中で辞書が書き換わることはない。
+
+    メソッド:
+    dialogue(text) -- 応答を返し、学習をキューに積む
+    flush() -- キューに積まれた学習がすべて終わるまで待つ
+    save() -- 学習を終えてから辞書を保存する
+    close() -- 学習を終えてからバックグラウンドのタスクを止める
+
+    プロパティ:
+    name -- 人工無脳コアの名前
+    responder_name -- 現在の応答クラスの名前
+    """
+
+    def __init__(self, name, dictionary=None):
+        """Unmo(name, dictionary)を作成し、学習用のキューを用意する。"""
+        self._unmo = Unmo(name, dictionary)
+        self._queue = asyncio.Queue()
+        self._worker = None
+        self._error = None
+
+    async def dialogue(self, text):
+        """ユーザーからの入力を受け取り、Responderに処理させた結果を返す。
+        入力の学習はバックグラウンドで行う。"""
+        self._start()
+        parts = self._unmo.analyze(text)
+        response = self._unmo.respond(text, parts)
+        self._queue.put_nowait((text, parts))
+        return response
+
+    async def flush(self):
+        """キューに積まれた学習がすべて終わるまで待つ。
+        学習中に例外が発生していた場合は、その例外を送出する。"""
+        await self._queue.join()
+        if self._error:
+            error, self._error = self._error, None
+            raise error
+
+    async def save(self):
+        """キューに積まれた学習を終えてから、辞書を保存する。"""
+        await self.flush()
+        self._unmo.save()
+
+    async def close(self):
+        """キューに積まれた学習を終えてから、バックグラウンドのタスクを止める。"""
+        try:
+            await self.flush()
+        finally:
+            if self._worker:
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+                self._worker = None
+
+    def _start(self):
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._learn())
+
+    async def _learn(self):
+        """キューから学習内容を取り出し、順にstudyする。"""
+        while True:
+            text, parts = await self._queue.get()
+            try:
+                self._unmo.study(text, parts)
+            except Exception as error:
+                self._error = self._error or error
+            finally:
+                self._queue.task_done()
+            # 学習が続く間も応答を待たせないよう、一件ごとにイベントループへ制御を返す
+            await asyncio.sleep(0)
+
+    @property
+    def name(self):
+        """人工無脳インスタンスの名前"""
+        return self._unmo.name
+
+    @property
+    def responder_name(self):
+        """保持しているResponderの名前"""
+        return self._unmo.responder_name
@@ -0,0 +1,140 @@
+"""辞書の保存先(ストレージバックエンド)。
+
+Dictionaryは既定では辞書をすべてメモリに読み込み、save()でファイルに書き出す。
+backendを渡すと、各辞書をバックエンドから読み込み、学習のたびにバックエンドへ確定(commit)する。
+
+SQLiteBackendは辞書をSQLiteのデータベースに置き、参照した行だけを読み出すため、
+辞書全体をメモリに読み込まずに済み、起動も速い。
+既存の辞書ファイル(random.txt, pattern.txt, template.txt, markov.dat)は次のように取り込める。
+
+    python -m unmo.backend 辞書.db [--dict-dir DIR]
+"""
+import os
+import abc
+import sqlite3
+import argparse
+import threading
+from .sqlstore import SCHEMA, SQLRandomStore, SQLPatternStore, SQLTemplateStore, SQLMarkov
+
+
+class StorageBackend(abc.ABC):
+    """辞書の保存先の基底クラス。
+
+    メソッド:
+    load(name) -- 辞書name('random', 'pattern', 'template', 'markov')を返す
+    commit() -- それまでの変更を確定する
+    close() -- 保存先を閉じる
+    """
+
+    NAMES = ('random', 'pattern', 'template', 'markov')
+
+    @abc.abstractmethod
+    def load(self, name):
+        """辞書nameを返す。"""
+
+    @abc.abstractmethod
+    def commit(self):
+        """それまでの変更を確定する。"""
+
+    def close(self):
+        """保存先を閉じる。"""
+
+
+class SQLiteBackend(StorageBackend):
+    """辞書をSQLiteのデータベースファイルに置くバックエンド。
+
+    WALモードで開くため、確定した変更は他のプロセスからも読み出せ、
+    学習の途中で中断しても確定済みの内容は失われない。
+    接続は一つで、複数のスレッドからの利用は内部のロックで直列化する。
+    """
+
+    def __init__(self, path):
+        """データベースファイルpathを開く。無ければ作成する。"""
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+            self._connection.executescript(SCHEMA)
+            self._connection.commit()
+
+    def load(self, name):
+        """辞書nameを、データベースを参照するオブジェクトとして返す。
+        ランダム辞書が空である場合、ファイルの辞書と同じく'こんにちは'という一文を追加する。"""
+        if name == 'random':
+            store = SQLRandomStore(self)
+            if not store:
+                store.add('こんにちは')
+                self.commit()
+            return store
+        if name == 'pattern':
+            return SQLPatternStore(self)
+        if name == 'template':
+            return SQLTemplateStore(self)
+        if name == 'markov':
+            return SQLMarkov(self)
+        raise ValueError('未対応の辞書です: {}'.format(name))
+
+    def commit(self):
+        with self._lock:
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def execute(self, sql, params=()):
+        """sqlを実行し、カーソルを返す。"""
+        with self._lock:
+            return self._connection.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """rowsの各要素でsqlを実行する。"""
+        with self._lock:
+            self._connection.executemany(sql, rows)
+
+    def query(self, sql, params=()):
+        """sqlを実行し、結果の行をすべてリストで返す。"""
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        """sqlを実行し、結果の最初の行を返す。無ければNoneを返す。"""
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()
+
+
+def import_files(backend, dict_dir=None):
+    """dict_dir(省略時はDictionary.DICT_DIR)の辞書ファイルを、backendに一つのトランザクションで取り込む。
+    backendにすでにある学習内容には、ファイルの学習内容を追加する。
+    n-gramのマルコフ辞書(--markov-order)は取り込めず、何も取り込まずにTypeErrorを送出する。"""
+    from .dictionary import Dictionary
+    files = Dictionary(dict_dir=dict_dir)
+    dictionary = Dictionary(backend=backend)
+    dictionary.merge(files)
+    return dictionary.sizes()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m unmo.backend',
+                                     description='辞書ファイルをSQLiteのデータベースに取り込む')
+    parser.add_argument('database', help='取り込み先のデータベースファイル')
+    parser.add_argument('--dict-dir', help='辞書ファイルのディレクトリ')
+    args = parser.parse_args(args)
+
+    backend = SQLiteBackend(args.database)
+    try:
+        sizes = import_files(backend, args.dict_dir)
+    except TypeError as error:
+        parser.error(str(error))
+    finally:
+        backend.close()
+    print(', '.join('{} {}'.format(name, size) for name, size in sizes.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""辞書の容量の上限と、上限を超えたときに取り除く項目の選び方。
+
+追い出し方(policy):
+    lru -- 応答に使われたのが最も古いものから取り除く。まだ使われていないものは学習した時点を使う
+    lfu -- 学習された回数と応答に使われた回数の合計が少ないものから取り除く
+    age -- 最も古く学習されたものから取り除く
+
+同じ順位のものは、古く学習されたものから取り除く。
+項目を一つずつ取り除くと辞書を何度も作り直すことになるため、
+上限を超えたときは上限の1割(slack)を余分に取り除き、しばらくは取り除かずに済むようにする。
+
+使用回数や最後に使われた時点はメモリ上にだけ記録する。
+辞書を読み込み直すと記録は失われ、読み込んだ項目はすべて同じ扱いになる(順位は学習した順となる)。
+応答は読み込みロックの下で並行して行われるため、記録は辞書のロックとは別のロックで守る。
+"""
+import heapq
+import threading
+from .util import renew_lock_after_fork
+
+
+POLICIES = ('lru', 'lfu', 'age')
+
+
+class Capacity:
+    """一つの辞書の容量の上限と、項目の使用状況を記録する。
+
+    メソッド:
+    learned(key) -- keyが学習されたことを記録する
+    used(key) -- keyが応答に使われたことを記録する
+    overflow(size) -- 辞書の大きさがsizeのとき、取り除くべき項目の数を返す
+    victims(keys, count) -- 古い順に並んだkeysから、取り除く項目をcount個選ぶ
+    forget(keys) -- 取り除いた項目の記録を消去する
+
+    プロパティ:
+    maxsize -- 項目の数の上限
+    policy -- 追い出し方
+    """
+
+    def __init__(self, maxsize, policy='lru', slack=0.1):
+        """項目の数の上限maxsizeと、追い出し方policyを設定する。
+        上限を超えたときは、maxsizeのslackの割合だけ余分に取り除く。"""
+        if policy not in POLICIES:
+            raise ValueError('未対応の追い出し方です: {}'.format(policy))
+        if maxsize < 1:
+            raise ValueError('上限は1以上でなければなりません: {}'.format(maxsize))
+        self._maxsize = maxsize
+        self._policy = policy
+        self._low = max(1, maxsize - int(maxsize * slack))
+        self._clock = 0
+        self._last_used = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        renew_lock_after_fork(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        renew_lock_after_fork(self)
+
+    @property
+    def maxsize(self):
+        """項目の数の上限"""
+        return self._maxsize
+
+    @property
+    def policy(self):
+        """追い出し方"""
+        return self._policy
+
+    def learned(self, key):
+        with self._lock:
+            self._clock += 1
+            self._last_used.setdefault(key, self._clock)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def used(self, key):
+        with self._lock:
+            self._clock += 1
+            self._last_used[key] = self._clock
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def overflow(self, size):
+        return size - self._low if size > self._maxsize else 0
+
+    def victims(self, keys, count):
+        """古く学習された順に並んだkeysから、追い出し方に従って取り除く項目をcount個選んで返す。"""
+        if self._policy == 'age':
+            return [key for key, _ in zip(keys, range(count))]
+        table = self._last_used if self._policy == 'lru' else self._counts
+        with self._lock:
+            return heapq.nsmallest(count, keys, key=lambda key: table.get(key, 0))
+
+    def forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._last_used.pop(key, None)
+                self._counts.pop(key, None)
@@ -1,4 +1,11 @@
+import sys
+import asyncio
+import argparse
 from .unmo import Unmo
+from .dictionary import Dictionary
+from .stats import Stats
+from .capacity import Capacity, POLICIES
+from .pool import ResponsePool
 
 
 def _build_prompt(unmo):
@@ -7,15 +14,121 @@ def _build_prompt(unmo):
                                          responder=unmo.responder_name)
 
 
-def main():
-    print('Unmo System prototype : proto')
-    proto = Unmo('proto')
-    while True:
-        text = input('> ')
-        if not text:
-            break
+def _parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='unmo', description='人工無脳Unmo')
+    parser.add_argument('--lazy', action='store_true',
+                        help='辞書を起動時ではなく、初めて使うときに読み込む')
+    parser.add_argument('--serve', action='store_true',
+                        help='対話の代わりに、複数のクライアントから接続できるチャットサーバーを起動する')
+    parser.add_argument('--host', default='127.0.0.1', help='サーバーが待ち受けるホスト')
+    parser.add_argument('--port', type=int, default=8765, help='サーバーが待ち受けるポート')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='--serveで、辞書を共有するN個のワーカープロセスをforkして応答する')
+    parser.add_argument('--refresh-every', type=int, metavar='N',
+                        help='--workersで、N件学習するたびにワーカーをforkし直して学習内容を反映する')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                        help='応答にかかった時間と辞書の大きさを計測し、終了時にJSONでFILEへ書き出す'
+                             '(省略時は標準出力)')
+    parser.add_argument('--max-random', type=int, metavar='N', help='ランダム辞書の発言の数の上限')
+    parser.add_argument('--max-patterns', type=int, metavar='N', help='パターン辞書のパターンの数の上限')
+    parser.add_argument('--max-templates', type=int, metavar='N',
+                        help='テンプレート辞書のテンプレートの数の上限')
+    parser.add_argument('--eviction', choices=POLICIES, default='lru',
+                        help='上限を超えたときに取り除く項目の選び方')
+    parser.add_argument('--db', metavar='PATH',
+                        help='辞書をファイルの代わりにSQLiteのデータベースPATHに置く')
+    parser.add_argument('--dict-dir', metavar='DIR',
+                        help='辞書ファイルを置くディレクトリ(省略時は~/.unmo/dics)')
+    parser.add_argument('--base-dir', metavar='DIR',
+                        help='読み取り専用で共有する辞書のディレクトリ。学習した内容は--dict-dirにだけ保存する')
+    parser.add_argument('--markov-order', type=int, metavar='N',
+                        help='新しく作成するマルコフ辞書の次数(1〜5)。文脈が記録されていなければ短い文脈で生成する')
+    parser.add_argument('--pool', type=int, metavar='N',
+                        help='よく使われるキーワードについて、マルコフ辞書の応答をN個ずつ手の空いている間に生成しておく')
+    parser.add_argument('--prune-markov', type=int, metavar='MIN_COUNT',
+                        help='マルコフ辞書から出現数がMIN_COUNT未満の遷移を取り除いて保存し、終了する')
+    parsed = parser.parse_args(args)
+    if parsed.workers and parsed.db:
+        parser.error('--workersと--dbは併用できません')
+    return parsed
 
-        response = proto.dialogue(text)
-        print('{prompt}{response}'.format(prompt=_build_prompt(proto),
-                                          response=response))
-    proto.save()
+
+def _build_limits(args):
+    """コマンドライン引数から、Dictionaryに渡す上限の辞書を作成する。"""
+    limits = {}
+    for name, maxsize in (('random', args.max_random), ('pattern', args.max_patterns),
+                          ('template', args.max_templates)):
+        if maxsize:
+            limits[name] = Capacity(maxsize, args.eviction)
+    return limits
+
+
+def _dump_stats(unmo, filename):
+    """unmoの計測結果をJSONでfilenameに書き出す。filenameが'-'であれば標準出力に書き出す。"""
+    if filename == '-':
+        unmo.stats.dump(sys.stdout, unmo.dictionary)
+        return
+    with open(filename, 'w', encoding='utf-8') as f:
+        unmo.stats.dump(f, unmo.dictionary)
+
+
+def _open_dictionary(args, **kwargs):
+    """コマンドライン引数に従って辞書を開く。
+    --dbが無ければ、異常終了しても学習内容を失わないようジャーナルモードで開く。
+    --dbがあれば学習のたびにデータベースへ確定するため、ジャーナルは使わない。
+    --base-dirがあれば、そのディレクトリの辞書に重ねて開く。"""
+    if args.db:
+        from .backend import SQLiteBackend
+        return Dictionary(backend=SQLiteBackend(args.db), **kwargs)
+    base = Dictionary(dict_dir=args.base_dir) if args.base_dir else None
+    return Dictionary(journal=True, markov_order=args.markov_order, dict_dir=args.dict_dir,
+                      base=base, **kwargs)
+
+
+def main(args=None):
+    args = _parse_args(args)
+    if args.prune_markov is not None:
+        dictionary = _open_dictionary(args)
+        before = dictionary.markov.sizes()
+        removed = dictionary.prune_markov(args.prune_markov)
+        dictionary.save()
+        after = dictionary.markov.sizes()
+        print('removed {} transitions: states {} -> {}, words {} -> {}'.format(
+            removed, before['states'], after['states'], before['words'], after['words']))
+        return
+
+    stats = Stats() if args.stats else None
+    pool = ResponsePool(args.pool) if args.pool else None
+    dictionary = _open_dictionary(args, lazy=args.lazy, limits=_build_limits(args), pool=pool)
+    proto = Unmo('proto', dictionary, stats)
+
+    if args.serve and args.workers:
+        from .prefork import serve
+        try:
+            serve(proto, args.host, args.port, args.workers, args.refresh_every)
+        except KeyboardInterrupt:
+            pass
+    elif args.serve:
+        from .server import serve
+        try:
+            asyncio.run(serve(proto, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        if pool is not None:
+            pool.start(dictionary)
+        print('Unmo System prototype : proto')
+        while True:
+            text = input('> ')
+            if not text:
+                break
+
+            response = proto.dialogue(text)
+            print('{prompt}{response}'.format(prompt=_build_prompt(proto),
+                                              response=response))
+        if pool is not None:
+            pool.stop()
+        proto.save()
+
+    if stats:
+        _dump_stats(proto, args.stats)
@@ -1,9 +1,15 @@
 import os
+import json
+import threading
+import warnings
 from pathlib import Path
-from collections import defaultdict
 import functools
+from . import markovfile
 from .markov import Markov
-from .util import format_error
+from .ngram import NgramMarkov
+from .store import IndexedSet, PatternStore, TemplateStore
+from .layered import LayeredRandom, LayeredPatternStore, LayeredTemplateStore, LayeredMarkov
+from .util import format_error, atomic_open, RWLock
 from .morph import analyze, is_keyword
 
 
@@ -11,23 +17,41 @@ class Dictionary:
     """思考エンジンの辞書クラス。
 
     クラス変数:
-    DICT_RANDOM -- ランダム辞書のファイル名
-    DICT_PATTERN -- パターン辞書のファイル名
+    DICT_DIR -- 辞書ファイルを置く既定のディレクトリ
+    DICT -- 辞書の名前からファイル名への対応表
 
     スタティックメソッド:
     line2pattern(str) -- パターン辞書読み込み用のヘルパー
     pattern2line(pattern) -- パターンハッシュをパターン辞書形式に変換する
 
-    load_random(file) -- fileからランダム辞書の読み込みを行う
-    load_pattern(file) -- fileからパターン辞書の読み込みを行う
-    load_template(file) -- fileからテンプレート辞書の読み込みを行う
+    load_random(dict_dir) -- dict_dirからランダム辞書の読み込みを行う
+    load_pattern(dict_dir) -- dict_dirからパターン辞書の読み込みを行う
+    load_template(dict_dir) -- dict_dirからテンプレート辞書の読み込みを行う
     load_markov(file) -- fileからマルコフ辞書の読み込みを行う
 
+    メソッド:
+    match_pattern(text) -- textに一致する最初のパターンを探す
+    merge(other) -- 別の辞書の学習内容を取り込む
+    used(name, key) -- 辞書nameの項目keyが応答に使われたことを記録する
+    record_usage(records) -- usedで記録した項目をリストにも加える
+    prune_markov(min_count) -- マルコフ辞書から出現数の少ない遷移を取り除く
+    sizes() -- 各辞書の大きさを返す
+    save() -- 辞書をファイルに保存する。ジャーナルモードではジャーナルを空にする。
+              バックエンドを使う場合は変更を確定する
+
     プロパティ:
+    lock -- 辞書の読み書きロック。学習は書き込みロックを取得して行う
+    dict_dir -- 辞書ファイルを置くディレクトリ
+    base -- 重ねている共有の辞書。重ねていない場合はNone
+    backend -- 辞書の保存先。ファイルに保存する場合はNone
+    pool -- マルコフ辞書の応答プール。使わない場合はNone
     random -- ランダム辞書
     pattern -- パターン辞書
     template -- テンプレート辞書
     markov -- マルコフ辞書
+
+    共有の辞書baseを重ねると、各辞書のプロパティは共有の辞書とこの辞書を重ねた辞書(layeredモジュール)を返す。
+    学習した内容はこの辞書にだけ書き込み、保存するのもこの辞書の内容だけである。
     """
 
     DICT_DIR = os.path.join(str(Path.home()), '.unmo', 'dics')
@@ -36,30 +60,155 @@ class Dictionary:
         'pattern': 'pattern.txt',
         'template': 'template.txt',
         'markov': 'markov.dat',
+        'journal': 'journal.log',
+    }
+
+    PHRASES_MARK = '%phrases%'
+    JOURNAL_MARK = '%journal%'
+    STUDIED = ('random', 'pattern', 'template', 'markov')
+    LIMITABLE = ('random', 'pattern', 'template')
+    LAYERS = {
+        'random': LayeredRandom,
+        'pattern': LayeredPatternStore,
+        'template': LayeredTemplateStore,
+        'markov': LayeredMarkov,
     }
 
-    def __init__(self):
-        """ファイルから辞書の読み込みを行う。"""
-        self._random = Dictionary.load_random()
-        self._pattern = Dictionary.load_pattern()
-        self._template = Dictionary.load_template()
-        self._markov = Dictionary.load_markov(Dictionary.dicfile('markov'))
+    def __init__(self, journal=False, compact_every=1000, load=True, lazy=False, limits=None,
+                 backend=None, markov_order=None, pool=None, dict_dir=None, base=None):
+        """ファイルから辞書の読み込みを行う。
+
+        load -- Falseであればファイルを読み込まず、空の辞書を作成する
+        lazy -- Trueであれば、各辞書はプロパティから初めて参照されたときに読み込む。
+                ジャーナルモードでは再生のためにすべての辞書を読み込む。
+        journal -- Trueであればジャーナルモードで動作する。
+                   studyのたびに学習内容を番号を付けてジャーナルファイルへ追記し、
+                   読み込み時にはジャーナルを再生して前回の状態を復元する。
+                   各辞書ファイルには、取り込んだジャーナルの最後の記録の番号を保存し、
+                   再生するときはその辞書がすでに取り込んだ記録を読み飛ばす。
+        compact_every -- ジャーナルモードで、この回数だけ学習するたびに
+                         辞書ファイルを保存してジャーナルを空にする
+        limits -- 'random', 'pattern', 'template'から、その辞書の上限を表すCapacityへの辞書。
+                  学習して上限を超えた辞書からは、Capacityの追い出し方に従って項目を取り除く。
+                  省略した辞書には上限を設けない
+        backend -- 辞書の保存先(StorageBackend)。指定すると各辞書はbackendから読み込み、
+                   学習するたびにbackendへ確定するため、ジャーナルモードとは併用できない。
+                   loadとlazyは無視し、各辞書はプロパティから初めて参照されたときに読み込む
+        markov_order -- 指定すると、マルコフ辞書を次数markov_orderのNgramMarkovで作成する。
+                        すでに辞書ファイルがあれば、ファイルの形式と次数に従って読み込む
+        pool -- マルコフ辞書の応答をあらかじめ生成しておくResponsePool。
+                マルコフ辞書に学習させると、学習した文章の単語の応答を捨てる
+        dict_dir -- 辞書ファイルとジャーナルを置くディレクトリ。省略時はDICT_DIR
+        base -- 読み取り専用で共有する辞書(Dictionary)。指定すると、この辞書はbaseに重ねる上層となり、
+                学習した内容はこの辞書にだけ書き込む。baseは複数の辞書で共有してよいが、学習させてはならない。
+                重ねられるのはファイルに保存するMarkovのマルコフ辞書だけであり、
+                baseまたはこの辞書のマルコフ辞書がNgramMarkovであればValueErrorを送出する
+        """
+        if backend is not None and journal:
+            raise ValueError('バックエンドとジャーナルモードは併用できません')
+        if backend is not None and markov_order is not None:
+            raise ValueError('バックエンドではマルコフ辞書の次数を指定できません')
+        if base is not None and (backend is not None or base.backend is not None):
+            raise ValueError('バックエンドを使う辞書は重ねられません')
+        if base is not None and markov_order is not None:
+            raise ValueError('共有の辞書に重ねる場合はマルコフ辞書の次数を指定できません')
+        self._backend = backend
+        self._markov_order = markov_order
+        self._pool = pool
+        self._dict_dir = dict_dir if dict_dir is not None else Dictionary.DICT_DIR
+        self._base = base
+        if base is not None:
+            self._check_layerable(load)
+        self._layers = {}
+        if backend is not None or (load and lazy):
+            self._random = self._pattern = self._template = self._markov = None
+        elif load:
+            self._random = self._load('random')
+            self._pattern = self._load('pattern')
+            self._template = self._load('template')
+            self._markov = self._load('markov')
+        else:
+            self._random = IndexedSet()
+            self._pattern = PatternStore()
+            self._template = TemplateStore()
+            self._markov = NgramMarkov(markov_order) if markov_order else Markov()
+
+        self._limits = dict(limits or {})
+        for name in self._limits:
+            if name not in Dictionary.LIMITABLE:
+                raise ValueError('上限を設定できない辞書です: {}'.format(name))
+
+        self._usage = None
+        self._lock = RWLock()
+        self._save_lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+        self._journal_seq = 0
+        self._compact_every = compact_every
+        if journal:
+            self._replay_journal()
+            self._open_journal()
+
+    def __getstate__(self):
+        # ロックとジャーナルのファイル、応答プールはプロセスをまたいで渡せないため、辞書の内容だけをpickleする
+        state = self.__dict__.copy()
+        del state['_lock'], state['_save_lock']
+        state['_journal'] = None
+        state['_pool'] = None
+        state['_usage'] = None
+        state['_layers'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = RWLock()
+        self._save_lock = threading.Lock()
 
     def study(self, text, parts):
-        """ランダム辞書、パターン辞書、テンプレート辞書をメモリに保存する。"""
-        self.study_random(text)
-        self.study_pattern(text, parts)
-        self.study_template(parts)
-        self.study_markov(parts)
+        """ランダム辞書、パターン辞書、テンプレート辞書をメモリに保存する。
+        ジャーナルモードでは、学習に成功した発言だけをジャーナルへ記録する。
+        学習の間は書き込みロックを取得する。
+        ジャーナルを畳み込むときは、書き込みロックを放してからsave()と同じく読み込みロックの下で保存するため、
+        応答は保存を待たない。"""
+        with self._lock.write():
+            self._study(text, parts)
+            if self._journal:
+                self._write_journal(text, parts)
+            if self._backend is not None:
+                self._backend.commit()
+
+            compact = self._journal and self._journal_records >= self._compact_every
+
+        if compact:
+            with self._lock.read(), self._save_lock:
+                # 待っている間に他のスレッドが畳み込んでいれば、保存しない
+                if self._journal_records >= self._compact_every:
+                    self._save()
+
+    def _study(self, text, parts, names=STUDIED):
+        """発言textと形態素partsを、names(省略時はすべて)に含まれる辞書に学習させる。"""
+        if 'random' in names:
+            self.study_random(text)
+        if 'pattern' in names:
+            self.study_pattern(text, parts)
+        if 'template' in names:
+            self.study_template(parts)
+        if 'markov' in names:
+            self.study_markov(parts)
+        if self._limits:
+            self._evict()
 
     def study_markov(self, parts):
-        """形態素のリストpartsを受け取り、マルコフ辞書に学習させる。"""
-        self._markov.add_sentence(parts)
+        """形態素のリストpartsを受け取り、マルコフ辞書に学習させる。
+        応答プールがあれば、partsの単語について蓄えた応答を捨てる。"""
+        self.markov.add_sentence(parts)
+        if self._pool is not None:
+            self._pool.invalidate(word for word, _ in parts)
 
     def study_template(self, parts):
         """形態素のリストpartsを受け取り、
-        名詞のみ'%noun%'に変更した文字列templateをself._templateに追加する。
-        名詞が存在しなかった場合、または同じtemplateが存在する場合は何もしない。
+        名詞のみ'%noun%'に変更した文字列templateをテンプレート辞書に追加する。
+        名詞が存在しなかった場合は何もしない。同じtemplateが存在する場合は出現数を増やす。
         """
         template = ''
         count = 0
@@ -69,14 +218,15 @@ class Dictionary:
                 count += 1
             template += word
 
-        if count > 0 and template not in self._template[count]:
-            self._template[count].append(template)
+        if count > 0:
+            self.template.add(template)
+            self._learned('template', template)
 
     def study_random(self, text):
         """ユーザーの発言textをランダム辞書に保存する。
         すでに同じ発言があった場合は何もしない。"""
-        if text not in self._random:
-            self._random.append(text)
+        self.random.add(text)
+        self._learned('random', text)
 
     def study_pattern(self, text, parts):
         """ユーザーの発言textを、形態素partsに基づいてパターン辞書に保存する。"""
@@ -84,22 +234,207 @@ class Dictionary:
             if not is_keyword(part):  # 品詞が名詞でなければ学習しない
                 continue
 
-            # 単語の重複チェック
-            # 同じ単語で登録されていれば、パターンを追加する
+            # 同じ単語で登録されていれば、パターンにフレーズを追加する
             # 無ければ新しいパターンを作成する
-            duplicated = self._find_duplicated_pattern(word)
-            if duplicated and text not in duplicated['phrases']:
-                duplicated['phrases'].append(text)
+            self.pattern.add(word, text)
+            self._learned('pattern', word)
+
+    def merge(self, other):
+        """別のDictionary otherの学習内容を、otherが学習した順に取り込む。
+        学習内容を分割して別々に学習させた辞書を、順にmergeすることで
+        すべてを一つの辞書で学習させた場合と同じ内容になる。
+        マルコフ辞書の種類が違えば、何も取り込まずにTypeErrorを送出する。"""
+        with self._lock.write():
+            # 種類の違うマルコフ辞書はTypeErrorになるため、他の辞書に取り込む前に取り込む
+            self.markov.merge(other.markov)
+            for text in other.random:
+                self.study_random(text)
+            for pattern in other.pattern:
+                for text in pattern['phrases']:
+                    self.pattern.add(pattern['pattern'], text, pattern.get('regex', False))
+            for template, frequency in other.template.entries():
+                self.template.add(template, frequency)
+            if self._pool is not None:
+                self._pool.invalidate()
+            if self._limits:
+                self._evict()
+            if self._backend is not None:
+                self._backend.commit()
+
+    def prune_markov(self, min_count):
+        """マルコフ辞書から出現数がmin_count未満の遷移を取り除き、取り除いた遷移の数を返す。"""
+        with self._lock.write():
+            removed = self.markov.prune(min_count)
+            if self._pool is not None:
+                self._pool.invalidate()
+            if self._backend is not None:
+                self._backend.commit()
+            return removed
+
+    def used(self, name, key):
+        """辞書nameの項目keyが応答に使われたことを記録する。
+        nameの辞書に上限が設定されていなければ何もしない。"""
+        capacity = self._limits.get(name)
+        if capacity is not None:
+            capacity.used(key)
+            if self._usage is not None:
+                self._usage.append((name, key))
+
+    def record_usage(self, records):
+        """以後usedで記録した(辞書の名前, 項目)を、リストrecordsの末尾にも加える。
+        記録を別のプロセスの辞書に伝えるために使う。Noneを渡すと加えるのをやめる。"""
+        self._usage = records
+
+    def _learned(self, name, key):
+        capacity = self._limits.get(name)
+        if capacity is not None:
+            capacity.learned(key)
+
+    def _evict(self):
+        """上限を超えた辞書から、Capacityが選んだ項目を取り除く。
+        共有の辞書に重ねている場合、上限はこの辞書が学習した内容に対して設ける。"""
+        for name, capacity in self._limits.items():
+            store = self._own(name)
+            if name == 'random':
+                size = len(store)
+                keys = store
+            elif name == 'pattern':
+                size = len(store)
+                keys = (pattern['pattern'] for pattern in store)
             else:
-                self._pattern.append({'pattern': word, 'phrases': [text]})
+                size = store.total
+                keys = (template for template, _ in store.entries())
+
+            count = capacity.overflow(size)
+            if count:
+                victims = capacity.victims(keys, count)
+                store.remove_all(victims)
+                capacity.forget(victims)
+
+    def match_pattern(self, text):
+        """パターン辞書からtextに一致する最初のパターンを探す。
+        (パターンハッシュ, 一致した文字列)のタプルを、無ければNoneを返す。"""
+        return self.pattern.search(text)
+
+    def sizes(self):
+        """各辞書の大きさを辞書で返す。
+        random -- ランダム辞書の発言の数
+        patterns, phrases -- パターン辞書のパターンの数と、フレーズの総数
+        templates -- テンプレート辞書のテンプレートの総数
+        markov_* -- マルコフ辞書の単語・状態・遷移・文章が始まる単語の数
+        """
+        with self._lock.read():
+            sizes = {
+                'random': len(self.random),
+                'patterns': len(self.pattern),
+                'phrases': sum(len(pattern['phrases']) for pattern in self.pattern),
+                'templates': self.template.total,
+            }
+            for name, size in self.markov.sizes().items():
+                sizes['markov_' + name] = size
+        return sizes
 
     def save(self):
-        """メモリ上の辞書をファイルに保存する。"""
-        dic_markov = os.path.join(Dictionary.DICT_DIR, Dictionary.DICT['markov'])
-        self._save_random()
-        self._save_pattern()
-        self._save_template()
-        self._markov.save(dic_markov)
+        """メモリ上の辞書をファイルに保存する。
+        各ファイルは一時ファイルに書き込んでから置き換えるため、途中で中断しても壊れない。
+        まだ読み込んでいない辞書はファイルから変わっていないため、保存しない。
+        ジャーナルモードでは、すべての辞書を保存した後にジャーナルを空にする。
+        保存の間は読み込みロックを取得するため、応答は止まらないが学習は待たされる。
+        バックエンドを使う場合、学習内容はすでに確定しているため、変更を確定するだけである。"""
+        with self._lock.read(), self._save_lock:
+            if self._backend is not None:
+                self._backend.commit()
+            else:
+                self._save()
+
+    def _save(self):
+        if self._random is not None:
+            self._save_random()
+        if self._pattern is not None:
+            self._save_pattern()
+        if self._template is not None:
+            self._save_template()
+        if self._markov is not None:
+            os.makedirs(self._dict_dir, exist_ok=True)
+            self._markov.save(self._dicfile('markov'), self._journal_seq if self._journal else None)
+        if self._journal:
+            self._reset_journal()
+
+    def _open_journal(self):
+        """ジャーナルファイルを追記モードで開く。"""
+        os.makedirs(self._dict_dir, exist_ok=True)
+        self._journal = open(self._dicfile('journal'), 'a', encoding='utf-8')
+
+    def _write_journal(self, text, parts):
+        """発言textと形態素parts、記録の番号を1行のJSONとしてジャーナルに追記する。
+        記録の番号はジャーナルを空にしても続けて増やす。"""
+        self._journal_seq += 1
+        record = json.dumps([text, [list(part) for part in parts], self._journal_seq],
+                            ensure_ascii=False)
+        self._journal.write(record + '\n')
+        self._journal.flush()
+        self._journal_records += 1
+
+    def _replay_journal(self):
+        """ジャーナルファイルの記録を順に学習し直す。
+        書き込みの途中で中断された末尾の行は読み飛ばす。
+        学習できなかった記録は警告を出して読み飛ばし、残りの記録の学習を続ける。
+
+        各記録は、辞書ファイルに保存された番号より後のものだけをその辞書に学習させる。
+        保存の途中(一部の辞書ファイルを置き換えた後、ジャーナルを空にする前)で中断されても、
+        すでに保存した辞書に同じ記録を二重に学習させることはない。
+        番号の無い古い形式の記録は、すべての辞書に学習させる。"""
+        folded = {name: self._folded(name) for name in Dictionary.STUDIED}
+        self._journal_seq = max(folded.values())
+        journal = self._dicfile('journal')
+        if not os.path.exists(journal):
+            return
+        with open(journal, 'rb+') as f:
+            valid = 0
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete record')
+                    text, parts, *seq = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # 以降の追記が壊れた行に続かないよう、正しく書き込まれた位置で切り詰める
+                    f.truncate(valid)
+                    break
+                names = Dictionary.STUDIED
+                if seq:
+                    names = [name for name in names if seq[0] > folded[name]]
+                try:
+                    self._study(text, [tuple(part) for part in parts], names)
+                except Exception as error:
+                    warnings.warn('ジャーナルの記録を学習できませんでした({}): {}'.format(
+                        format_error(error), text))
+                if seq:
+                    self._journal_seq = max(self._journal_seq, seq[0])
+                self._journal_records += 1
+                valid += len(line)
+
+    def _folded(self, name):
+        """辞書nameのファイルが取り込んだジャーナルの最後の記録の番号を返す。
+        ファイルが無いか、番号が保存されていなければ0を返す。"""
+        filename = self._dicfile(name)
+        if not os.path.exists(filename):
+            return 0
+        if name == 'markov':
+            if not markovfile.is_markov_file(filename):
+                return 0
+            sections = markovfile.read(filename)
+            return sections['journal'][0] if 'journal' in sections else 0
+        with open(filename, encoding='utf-8') as f:
+            mark, _, seq = f.readline().rstrip('\n').partition('\t')
+        return int(seq) if mark == Dictionary.JOURNAL_MARK else 0
+
+    def _reset_journal(self):
+        """ジャーナルファイルを空のファイルに置き換え、開き直す。"""
+        self._journal.close()
+        with atomic_open(self._dicfile('journal'), encoding='utf-8'):
+            pass
+        self._journal = open(self._dicfile('journal'), 'a', encoding='utf-8')
+        self._journal_records = 0
 
     def save_dictionary(dict_key):
         """
@@ -110,12 +445,13 @@ class Dictionary:
             @functools.wraps(func)
             def wrapper(self, *args, **kwargs):
                 """辞書ファイルを開き、デコレートされた関数を実行する。
-                ディレクトリが存在しない場合は新たに作成する。"""
-                if not os.path.isdir(Dictionary.DICT_DIR):
-                    os.makedirs(Dictionary.DICT_DIR)
-                dicfile = Dictionary.dicfile(dict_key)
-                with open(dicfile, 'w', encoding='utf-8') as f:
+                ディレクトリが存在しない場合は新たに作成する。
+                ジャーナルモードでは、1行目に'%journal%\t取り込んだジャーナルの最後の記録の番号'を書く。"""
+                os.makedirs(self._dict_dir, exist_ok=True)
+                with atomic_open(self._dicfile(dict_key), encoding='utf-8') as f:
                     result = func(self, *args, **kwargs)
+                    if self._journal:
+                        f.write('{}\t{}\n'.format(Dictionary.JOURNAL_MARK, self._journal_seq))
                     f.write(result)
                 return result
             return wrapper
@@ -123,72 +459,112 @@ class Dictionary:
 
     @save_dictionary('template')
     def _save_template(self):
-        """テンプレート辞書を保存する。"""
+        """テンプレート辞書を保存する。
+        各行は'名詞の数\tテンプレート'で、出現数が2以上であれば'\t出現数'を続ける。"""
         lines = []
         for count, templates in self._template.items():
             for template in templates:
-                lines.append('{}\t{}'.format(count, template))
+                frequency = self._template.frequency(template)
+                if frequency > 1:
+                    lines.append('{}\t{}\t{}'.format(count, template, frequency))
+                else:
+                    lines.append('{}\t{}'.format(count, template))
         return '\n'.join(lines)
 
     @save_dictionary('pattern')
     def _save_pattern(self):
-        """パターン辞書を保存する。"""
-        lines = [Dictionary.pattern2line(p) for p in self._pattern]
-        return '\n'.join(lines)
+        """パターン辞書を保存する。
+        1行目は'%phrases%\tフレーズの数'で、続く行にフレーズを1行ずつ書き、
+        その後に各パターンを'単語\tフレーズの番号 フレーズの番号 ...'の形で書く。
+        どのパターンからも参照されていないフレーズは書かず、番号は書き出した順に振り直す。"""
+        table = self._pattern.phrases
+        numbers = {}
+        phrases = []
+        lines = []
+        for word, ids in self._pattern.entries():
+            renumbered = []
+            for phrase_id in ids:
+                number = numbers.get(phrase_id)
+                if number is None:
+                    number = numbers[phrase_id] = len(phrases)
+                    phrases.append(table[phrase_id])
+                renumbered.append(str(number))
+            lines.append('{}\t{}'.format(word, ' '.join(renumbered)))
+        header = '{}\t{}'.format(Dictionary.PHRASES_MARK, len(phrases))
+        return '\n'.join([header] + phrases + lines)
 
     @save_dictionary('random')
     def _save_random(self):
         """ランダム辞書を保存する。"""
-        return '\n'.join(self.random)
-
-    def _find_duplicated_pattern(self, word):
-        """パターン辞書に名詞wordがあればパターンハッシュを、無ければNoneを返す。"""
-        return next((p for p in self._pattern if p['pattern'] == word), None)
+        return '\n'.join(self._random)
 
     def load_dictionary(dict_key):
         """辞書ファイルを読み込むためのデコレータ"""
         def _load_dictionary(func):
             @functools.wraps(func)
-            def wrapper(*args, **kwargs):
-                """ファイルを読み込み、行ごとに分割して関数に渡す"""
-                dicfile = os.path.join(Dictionary.DICT_DIR, Dictionary.DICT[dict_key])
+            def wrapper(*args, dict_dir=None, **kwargs):
+                """ディレクトリdict_dir(省略時はDICT_DIR)のファイルを読み込み、行ごとに分割して関数に渡す。
+                1行目がジャーナルの記録の番号であれば、それを除いて渡す。"""
+                dicfile = Dictionary.dicfile(dict_key, dict_dir)
                 if not os.path.exists(dicfile):
                     return func([], *args, **kwargs)
                 with open(dicfile, encoding='utf-8') as f:
-                    return func(f.read().splitlines(), *args, **kwargs)
+                    lines = f.read().splitlines()
+                if lines and lines[0].startswith(Dictionary.JOURNAL_MARK + '\t'):
+                    del lines[0]
+                return func(lines, *args, **kwargs)
             return wrapper
         return _load_dictionary
 
     @staticmethod
     @load_dictionary('random')
-    def load_random(lines):
-        """ランダム辞書を読み込み、リストを返す。
-        空である場合、['こんにちは']という一文を追加する。"""
-        return lines if lines else ['こんにちは']
+    def load_random(lines, default=('こんにちは',)):
+        """ランダム辞書を読み込み、IndexedSetを返す。
+        空である場合、default(省略時は'こんにちは'という一文)を追加する。"""
+        return IndexedSet(lines if lines else default)
 
     @staticmethod
     @load_dictionary('pattern')
     def load_pattern(lines):
-        """パターン辞書を読み込み、パターンハッシュのリストを返す。"""
-        return [Dictionary.line2pattern(l) for l in lines]
+        """パターン辞書を読み込み、PatternStoreを返す。
+        1行目が'%phrases%\tフレーズの数'であればフレーズ表を持つ形式として、
+        そうでなければ各行が'単語\tフレーズ|フレーズ|...'の従来の形式として読み込む。"""
+        mark, _, count = lines[0].partition('\t') if lines else ('', '', '')
+        if mark != Dictionary.PHRASES_MARK:
+            patterns = (Dictionary.line2pattern(l) for l in lines)
+            return PatternStore(p for p in patterns if p)
+
+        end = 1 + int(count)
+        entries = (line.split('\t') for line in lines[end:] if line)
+        return PatternStore.from_table(lines[1:end],
+                                       ((word, map(int, ids.split())) for word, ids in entries))
 
     @staticmethod
     @load_dictionary('template')
     def load_template(lines):
-        """テンプレート辞書を読み込み、ハッシュを返す。"""
-        templates = defaultdict(lambda: [])
+        """テンプレート辞書を読み込み、TemplateStoreを返す。
+        出現数の列が無い行は、出現数を1とする。"""
+        templates = TemplateStore()
         for line in lines:
-            count, template = line.split('\t')
-            if count and template:
-                count = int(count)
-                templates[count].append(template)
+            fields = line.split('\t')
+            if len(fields) >= 2 and fields[0] and fields[1]:
+                frequency = int(fields[2]) if len(fields) > 2 else 1
+                templates.add(fields[1], frequency)
         return templates
 
     @staticmethod
-    def load_markov(filename):
-        """Markovオブジェクトを生成し、filenameから読み込みを行う。"""
-        markov = Markov()
-        if os.path.exists(filename):
+    def load_markov(filename, order=None):
+        """Markovオブジェクトを生成し、filenameから読み込みを行う。
+        filenameがNgramMarkovの辞書であるか、ファイルが無くorderが指定されていれば、
+        NgramMarkovを生成する。"""
+        exists = os.path.exists(filename)
+        if exists and NgramMarkov.is_ngram_file(filename):
+            markov = NgramMarkov()
+        elif not exists and order:
+            return NgramMarkov(order)
+        else:
+            markov = Markov()
+        if exists:
             markov.load(filename)
         return markov
 
@@ -218,26 +594,97 @@ class Dictionary:
             return {'pattern': pattern, 'phrases': phrases.split('|')}
 
     @staticmethod
-    def dicfile(key):
-        """辞書ファイルのパスを 'DICT_DIR/DICT[key]' の形式で返す。"""
-        return os.path.join(Dictionary.DICT_DIR, Dictionary.DICT[key])
+    def dicfile(key, dict_dir=None):
+        """辞書ファイルのパスを 'dict_dir/DICT[key]' の形式で返す。dict_dirの省略時はDICT_DIRとする。"""
+        return os.path.join(dict_dir if dict_dir is not None else Dictionary.DICT_DIR,
+                            Dictionary.DICT[key])
+
+    def _dicfile(self, key):
+        """この辞書の辞書ファイルのパスを返す。"""
+        return Dictionary.dicfile(key, self._dict_dir)
+
+    @property
+    def lock(self):
+        """辞書の読み書きロック(RWLock)。
+        辞書を参照する間は読み込みロックを取得すれば、学習と同時に参照しても安全である。"""
+        return self._lock
+
+    @property
+    def dict_dir(self):
+        """辞書ファイルを置くディレクトリ"""
+        return self._dict_dir
+
+    @property
+    def base(self):
+        """重ねている共有の辞書(Dictionary)。重ねていない場合はNone"""
+        return self._base
+
+    @property
+    def pool(self):
+        """マルコフ辞書の応答プール(ResponsePool)。使わない場合はNone"""
+        return self._pool
+
+    @property
+    def backend(self):
+        """辞書の保存先(StorageBackend)。ファイルに保存する場合はNone"""
+        return self._backend
 
     @property
     def random(self):
         """ランダム辞書"""
-        return self._random
+        return self._layered('random')
 
     @property
     def pattern(self):
         """パターン辞書"""
-        return self._pattern
+        return self._layered('pattern')
 
     @property
     def template(self):
         """テンプレート辞書"""
-        return self._template
+        return self._layered('template')
 
     @property
     def markov(self):
         """マルコフ辞書"""
-        return self._markov
+        return self._layered('markov')
+
+    def _layered(self, name):
+        """辞書nameを返す。共有の辞書に重ねている場合は、共有の辞書とこの辞書を重ねた辞書を返す。"""
+        if self._base is None:
+            return self._own(name)
+        layered = self._layers.get(name)
+        if layered is None:
+            layered = Dictionary.LAYERS[name](getattr(self._base, name), self._own(name))
+            self._layers[name] = layered
+        return layered
+
+    def _check_layerable(self, load):
+        """共有の辞書とこの辞書のマルコフ辞書が、重ねられるMarkovであることを確かめる。
+        そうでなければValueErrorを送出する。この辞書のマルコフ辞書は、loadであればファイルの形式で判別する。"""
+        if type(self._base.markov) is not Markov:
+            raise ValueError('重ねられるのはMarkovのマルコフ辞書だけです: 共有の辞書が{}です'.format(
+                type(self._base.markov).__name__))
+        markov_file = self._dicfile('markov')
+        if load and os.path.exists(markov_file) and NgramMarkov.is_ngram_file(markov_file):
+            raise ValueError('重ねられるのはMarkovのマルコフ辞書だけです: {}がNgramMarkovです'.format(
+                markov_file))
+
+    def _own(self, name):
+        """この辞書自身の辞書nameを返す。まだ読み込んでいなければ読み込む。"""
+        store = getattr(self, '_' + name)
+        if store is None:
+            store = self._load(name)
+            setattr(self, '_' + name, store)
+        return store
+
+    def _load(self, name):
+        """辞書nameを、バックエンドがあればバックエンドから、無ければ辞書ファイルから読み込む。"""
+        if self._backend is not None:
+            return self._backend.load(name)
+        if name == 'markov':
+            return Dictionary.load_markov(self._dicfile('markov'), self._markov_order)
+        if name == 'random' and self._base is not None:
+            # 共有の辞書に重ねる場合、空のランダム辞書に既定の発言を加えない
+            return Dictionary.load_random(dict_dir=self._dict_dir, default=())
+        return getattr(Dictionary, 'load_' + name)(dict_dir=self._dict_dir)
@@ -0,0 +1,348 @@
+"""共有の辞書(基底)に、人格ごとの小さな辞書(上層)を重ねて一つの辞書として扱う。
+
+多くの人格が同じ大きな辞書を元に会話する場合、人格ごとに辞書全体を読み込んで学習させると
+人格の数だけ辞書の複製ができる。重ねた辞書では基底を読み取り専用で共有し、
+学習した内容は上層にだけ書き込む(コピーオンライト)。参照は両方の層をまとめて行うため、
+Responderからは一つの辞書に見える。
+
+- ランダム辞書・パターン辞書: 基底の項目の後に、上層にだけある項目が続く。
+  基底にある発言やフレーズは上層に追加しない
+- テンプレート辞書: 同じテンプレートの出現数は両方の層の和になる
+- マルコフ辞書: 各状態で、両方の層の出現数の和で重み付けして次の単語を選ぶ
+
+どの層も、項目を取り除くときは上層からだけ取り除く。基底は共有されるため、重ねている間は学習させないこと。
+"""
+import random
+from collections.abc import Sequence, Mapping
+from .markov import Markov
+from .store import IndexedSet
+
+
+def _choose_layer(layers, weights, rng):
+    """重みweightsに従ってlayersから一つを選ぶ。重みの合計が0であればNoneを返す。
+    重みを持つ層が一つだけであれば、乱数を使わずにそれを返す。"""
+    candidates = [layer for layer, weight in zip(layers, weights) if weight]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+    total = sum(weights)
+    rest = rng.randrange(total)
+    for layer, weight in zip(layers, weights):
+        rest -= weight
+        if rest < 0:
+            return layer
+
+
+class LayeredRandom(Sequence):
+    """基底のランダム辞書(IndexedSet)に上層を重ねたランダム辞書。
+
+    基底の発言に、上層にだけある発言が続くシーケンスとして振る舞う。
+    重ねる際に、基底にもある発言は上層から取り除く。
+
+    メソッド:
+    add(item) -- 基底に無ければ、itemを上層の末尾に追加する
+    index(item) -- itemの位置を返す
+    remove_all(items) -- itemsに含まれるものを上層から取り除く
+    """
+
+    def __init__(self, base, overlay):
+        self._base = base
+        self.overlay = overlay
+        overlay.remove_all([item for item in overlay if item in base])
+
+    def add(self, item):
+        """基底と上層のどちらにも無ければitemを上層の末尾に追加し、追加したかどうかを真偽値で返す。"""
+        if item in self._base:
+            return False
+        return self.overlay.add(item)
+
+    def index(self, item):
+        """itemの位置を返す。無ければValueErrorを送出する。"""
+        if item in self._base:
+            return self._base.index(item)
+        return len(self._base) + self.overlay.index(item)
+
+    def remove_all(self, items):
+        """イテラブルitemsに含まれるものを上層から取り除く。基底は変わらない。"""
+        self.overlay.remove_all(items)
+
+    def __getitem__(self, index):
+        size = len(self._base)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('LayeredRandom index out of range')
+        return self._base[index] if index < size else self.overlay[index - size]
+
+    def __len__(self):
+        return len(self._base) + len(self.overlay)
+
+    def __iter__(self):
+        yield from self._base
+        yield from self.overlay
+
+    def __contains__(self, item):
+        return item in self._base or item in self.overlay
+
+
+class LayeredPatternStore(Sequence):
+    """基底のパターン辞書(PatternStore)に上層を重ねたパターン辞書。
+
+    同じ単語のパターンが両方の層にあれば、基底のフレーズに上層のフレーズを続けた
+    パターンハッシュを返す。基底の単語は上層の単語より先に登録されたものとして照合する。
+
+    メソッド:
+    add(word, text, regex) -- 基底のパターンに無ければ、上層のパターンに発言textを追加する
+    get(word) -- 単語wordの、両方の層をまとめたパターンハッシュを返す
+    has(word, text) -- 単語wordのパターンに発言textがあるかどうかを返す
+    search(text) -- textに一致する最初のパターンと一致した文字列を返す
+    remove_all(words) -- wordsに含まれる単語のパターンを上層から取り除く
+    """
+
+    def __init__(self, base, overlay):
+        self._base = base
+        self.overlay = overlay
+
+    def add(self, word, text, regex=False):
+        """基底の単語wordのパターンに発言textが無ければ、上層のパターンに追加する。"""
+        if not self._base.has(word, text):
+            self.overlay.add(word, text, regex)
+
+    def get(self, word, default=None):
+        """単語wordの、両方の層のフレーズをまとめたパターンハッシュを返す。無ければdefaultを返す。"""
+        base = self._base.get(word)
+        if base is None:
+            return self.overlay.get(word, default)
+        return self._merged(base)
+
+    def has(self, word, text):
+        """単語wordのパターンに発言textがあるかどうかを真偽値で返す。"""
+        return self._base.has(word, text) or self.overlay.has(word, text)
+
+    def search(self, text):
+        """textに一致するパターンのうち、最も先に登録されたものを探す。
+        (パターンハッシュ, 一致した文字列)のタプルを、無ければNoneを返す。"""
+        matched = self._base.search(text)
+        if matched is not None:
+            return self._merged(matched[0]), matched[1]
+        return self.overlay.search(text)
+
+    def remove_all(self, words):
+        """イテラブルwordsに含まれる単語のパターンを上層から取り除く。基底は変わらない。"""
+        self.overlay.remove_all(words)
+
+    def _merged(self, pattern):
+        """基底のパターンハッシュpatternに、上層の同じ単語のフレーズを加えたものを返す。"""
+        overlay = self.overlay.get(pattern['pattern'])
+        if overlay is None:
+            return pattern
+        return dict(pattern, phrases=pattern['phrases'] + overlay['phrases'])
+
+    def _patterns(self):
+        """両方の層をまとめたパターンハッシュのリストを返す。"""
+        patterns = [self._merged(pattern) for pattern in self._base]
+        patterns.extend(pattern for pattern in self.overlay if self._base.get(pattern['pattern']) is None)
+        return patterns
+
+    def __getitem__(self, index):
+        return self._patterns()[index]
+
+    def __len__(self):
+        return len(self._base) + sum(1 for pattern in self.overlay
+                                     if self._base.get(pattern['pattern']) is None)
+
+    def __iter__(self):
+        return iter(self._patterns())
+
+
+class LayeredTemplateStore(Mapping):
+    """基底のテンプレート辞書(TemplateStore)に上層を重ねたテンプレート辞書。
+
+    テンプレートの出現数は両方の層の出現数の和であり、chooseはその和で重み付けして選択する。
+
+    プロパティ:
+    total -- テンプレートの総数
+
+    メソッド:
+    add(template, frequency) -- テンプレートを上層に出現数frequencyだけ追加する
+    frequency(template) -- テンプレートの出現数を返す
+    entries() -- (テンプレート, 出現数)を登録順に列挙する
+    weight(count) -- 名詞がcount個のテンプレートの出現数の合計を返す
+    choose(count, rng) -- 名詞がcount個のテンプレートを出現数で重み付けして選択する
+    fill(template, keywords) -- テンプレートの'%noun%'を順にkeywordsで置き換える
+    generate(keywords, rng) -- keywordsの数に合うテンプレートを選び、名詞を埋めて返す
+    remove_all(templates) -- templatesに含まれるテンプレートを上層から取り除く
+    """
+
+    def __init__(self, base, overlay):
+        self._base = base
+        self.overlay = overlay
+
+    @property
+    def total(self):
+        """テンプレートの総数"""
+        return self._base.total + sum(1 for template, _ in self.overlay.entries()
+                                      if not self._base.frequency(template))
+
+    def add(self, template, frequency=1):
+        """テンプレートtemplateを上層に出現数frequencyだけ追加し、新しいテンプレートであったかを真偽値で返す。"""
+        added = self.overlay.add(template, frequency)
+        return added and not self._base.frequency(template)
+
+    def frequency(self, template):
+        """テンプレートtemplateの、両方の層の出現数の和を返す。"""
+        return self._base.frequency(template) + self.overlay.frequency(template)
+
+    def entries(self):
+        """(テンプレート, 出現数)を、基底のテンプレート、上層にだけあるテンプレートの順に列挙する。"""
+        for template, frequency in self._base.entries():
+            yield template, frequency + self.overlay.frequency(template)
+        for template, frequency in self.overlay.entries():
+            if not self._base.frequency(template):
+                yield template, frequency
+
+    def weight(self, count):
+        """名詞がcount個のテンプレートの、両方の層の出現数の合計を返す。"""
+        return self._base.weight(count) + self.overlay.weight(count)
+
+    def choose(self, count, rng=random):
+        """名詞がcount個のテンプレートを、両方の層の出現数の和で重み付けして選択する。
+        無ければNoneを返す。"""
+        layers = (self._base, self.overlay)
+        layer = _choose_layer(layers, [layer.weight(count) for layer in layers], rng)
+        return None if layer is None else layer.choose(count, rng)
+
+    def fill(self, template, keywords):
+        """テンプレートtemplateの'%noun%'を、先頭から順にkeywordsの単語で置き換えた文字列を返す。"""
+        layer = self.overlay if self.overlay.frequency(template) else self._base
+        return layer.fill(template, keywords)
+
+    def generate(self, keywords, rng=random):
+        """名詞の数がkeywordsと同じテンプレートを選び、keywordsで埋めた文字列を返す。
+        該当するテンプレートが無ければNoneを返す。"""
+        template = self.choose(len(keywords), rng)
+        return None if template is None else self.fill(template, keywords)
+
+    def remove_all(self, templates):
+        """イテラブルtemplatesに含まれるテンプレートを上層から取り除く。基底は変わらない。"""
+        self.overlay.remove_all(templates)
+
+    def __getitem__(self, count):
+        if count not in self._base and count not in self.overlay:
+            raise KeyError(count)
+        return IndexedSet(list(self._base.get(count, ())) + list(self.overlay.get(count, ())))
+
+    def __len__(self):
+        return len(set(self._base) | set(self.overlay))
+
+    def __iter__(self):
+        yield from self._base
+        yield from (count for count in self.overlay if count not in self._base)
+
+
+class LayeredMarkov:
+    """基底のマルコフ辞書(Markov)に上層を重ねたマルコフ辞書。
+
+    文章は単語の形で両方の層をたどって生成する。状態ごとに各層の出現数の合計で層を選び、
+    選んだ層がその出現数で次の単語を選ぶため、両方の層の出現数を足した辞書から選ぶのと同じ確率になる。
+    キーワードを含む状態と文章を始める単語は、各層の選択肢の数で重み付けして層を選ぶ。
+
+    メソッド:
+    add_sentence(parts) -- 上層に学習させる
+    generate(keyword, rng) -- keywordを含む文章を生成する
+    merge(other) -- 別のMarkovの学習内容を上層に取り込む
+    prune(min_count) -- 上層から出現数の少ない遷移を取り除く
+    sizes() -- 各層の大きさの和を返す
+    transitions(), starts() -- 基底、上層の順に遷移と文章が始まる単語を列挙する
+    """
+
+    def __init__(self, base, overlay):
+        for markov in (base, overlay):
+            if type(markov) is not Markov:
+                raise ValueError('重ねられるのはMarkovのマルコフ辞書だけです: {}'.format(
+                    type(markov).__name__))
+        self._base = base
+        self.overlay = overlay
+        self._layers = (base, overlay)
+        self._base_ids = {}
+
+    def add_sentence(self, parts):
+        """形態素解析結果partsを上層に学習させる。"""
+        self.overlay.add_sentence(parts)
+
+    def merge(self, other):
+        """別のMarkov otherの学習内容を上層に取り込む。"""
+        self.overlay.merge(other)
+
+    def prune(self, min_count):
+        """上層から出現数がmin_count未満の遷移を取り除き、取り除いた遷移の数を返す。基底は変わらない。"""
+        return self.overlay.prune(min_count)
+
+    def sizes(self):
+        """各層の大きさの和を返す。両方の層にある単語や状態は二度数える。"""
+        base, overlay = self._base.sizes(), self.overlay.sizes()
+        return {name: size + overlay[name] for name, size in base.items()}
+
+    def transitions(self):
+        """基底、上層の順に、記録されている遷移を(prefix1, prefix2, suffix, 出現数)の形で列挙する。"""
+        for layer in self._layers:
+            yield from layer.transitions()
+
+    def starts(self):
+        """基底、上層の順に、文章が始まる単語を(単語, 出現数)の形で列挙する。"""
+        for layer in self._layers:
+            yield from layer.starts()
+
+    def generate(self, keyword, rng=random):
+        """keywordを含む文章を両方の層から生成して返す。どちらの層も空であればNoneを返す。"""
+        layers = self._layers
+        layer = _choose_layer(layers, [layer.keyword_weight(keyword) for layer in layers], rng)
+        if layer is not None:
+            state = layer.choose_around(keyword, rng)
+            words = [layer.word(word_id) for word_id in state]
+            head = self._extend(words[::-1], rng, backward=True)
+            words = head[::-1]
+        else:
+            layer = _choose_layer(layers, [layer.start_weight() for layer in layers], rng)
+            if layer is None:
+                return None
+            words = [layer.word(word_id) for word_id in layer.choose_start(rng)]
+        return ''.join(self._extend(words, rng))
+
+    def _extend(self, words, rng, backward=False):
+        """単語のリストwordsを、末尾の2単語から伸ばしたリストを返す。
+        backwardがTrueであれば、wordsは文章を逆順に並べたものとし、後ろ向きの連鎖で伸ばす。
+        後ろ向きに伸ばすのはMarkov.CHAIN_MAXの半分までとする。
+
+        状態は層ごとの単語IDの組で保持し、選んだ単語は他の層の単語IDに変換する。
+        後ろ向きの連鎖の状態は(先頭の単語, 2番目の単語)であり、逆順のwordsの末尾2単語を入れ替えたものになる。"""
+        layers = self._layers
+        if backward:
+            states = [(self._word_id(i, words[-1]), self._word_id(i, words[-2])) for i in range(2)]
+        else:
+            states = [(self._word_id(i, words[-2]), self._word_id(i, words[-1])) for i in range(2)]
+        for _ in range(Markov.CHAIN_MAX // 2 if backward else Markov.CHAIN_MAX):
+            weights = [0 if None in state else layer.weight(*state, backward)
+                       for layer, state in zip(layers, states)]
+            chosen = _choose_layer((0, 1), weights, rng)
+            if chosen is None:
+                break
+            word_id = layers[chosen].choose_word(*states[chosen], rng, backward)
+            word = layers[chosen].word(word_id)
+            if word == Markov.ENDMARK:
+                break
+            words.append(word)
+            for i, state in enumerate(states):
+                new = word_id if i == chosen else self._word_id(i, word)
+                states[i] = (new, state[0]) if backward else (state[1], new)
+        return words
+
+    def _word_id(self, layer, word):
+        """番号layerの層での単語wordのIDを返す。無ければNoneを返す。
+        基底は変わらないため、引いたIDを覚えておく(mmapした辞書の単語の検索は二分探索になる)。"""
+        if layer:
+            return self.overlay.word_id(word)
+        try:
+            return self._base_ids[word]
+        except KeyError:
+            word_id = self._base_ids[word] = self._base.word_id(word)
+            return word_id
@@ -1,17 +1,257 @@
 import os
 import sys
-from random import choice
-from collections import defaultdict
-import re
-import copy
-import dill
+import bisect
+import pickle
+from array import array
+import random
 import tqdm
+from . import markovfile
+from .markovfile import TokenTable, TokenIndex, OffsetMap
 from .morph import analyze, is_keyword
 
 
+class ChainTable:
+    """状態(prefix1, prefix2)から接尾辞への遷移を、出現数とともに配列で保持する表。
+
+    状態は開番地法のハッシュ表で管理し、状態ごとの接尾辞と出現数は
+    共通の配列上の連結リストとして記録する。同じ遷移が何度現れても、増えるのは出現数だけである。
+    出現数が前の要素を上回った要素は一つ前と入れ替えるため、
+    よく出現する接尾辞ほどリストの先頭に集まり、学習時の検索も生成時の選択も短い走査で終わる。
+    接尾辞がWIDE個を超えた状態は、学習時に接尾辞から要素への対応表で検索し(入れ替えは行わない)、
+    出現数の合計がWIDE_TOTAL以上の状態は、生成時に出現数の累積和を二分探索して選択する。
+
+    メソッド:
+    add(prefix1, prefix2, suffix, count) -- 遷移を出現数countだけ記録する
+    choose(prefix1, prefix2, rng) -- 出現数で重み付けして接尾辞を選択する
+    suffixes(prefix1, prefix2) -- 状態に続く(接尾辞, 出現数)を列挙する
+    total(prefix1, prefix2) -- 状態に続く遷移の出現数の合計を返す
+    states() -- 記録されている状態を(prefix1, prefix2)の形で列挙する
+    prefixes(state) -- 状態番号stateの状態を(prefix1, prefix2)の形で返す
+    transitions() -- 記録されている遷移の数を返す
+    sections(prefix) -- 表を構成する配列を返す
+    from_sections(sections, prefix) -- 配列から表を作成する
+    thaw() -- 表を書き換え可能な配列に複製する
+    """
+
+    TYPECODE = 'I'
+    KEYCODE = 'Q'
+    ARRAYS = ('slots', 'keys', 'heads', 'totals', 'suffixes', 'counts', 'nexts')
+    INITIAL_SLOTS = 8
+    WIDE = 64
+    WIDE_TOTAL = 256
+    _GOLDEN = 0x9E3779B97F4A7C15
+
+    def __init__(self):
+        """空の表を作成する。状態番号・要素番号の0は「無し」を表すために予約する。
+        self._slots -- ハッシュ表。 _slots[slot] == 状態番号
+        self._keys -- 状態のキー。 _keys[state] == prefix1 << 32 | prefix2
+        self._heads -- 状態ごとのリストの先頭。 _heads[state] == 要素番号
+        self._totals -- 状態ごとの出現数の合計。 _totals[state] == count
+        self._suffixes, self._counts, self._nexts -- 要素ごとの接尾辞、出現数、次の要素番号
+        self._wide -- 接尾辞の多い状態の、接尾辞から要素番号への対応表とリストの末尾。
+                      学習時に作成し、保存はしない。 _wide[state] == ({suffix: entry}, tail)
+        self._cumulative -- 出現数の多い状態の、接尾辞と出現数の累積和の配列。
+                            生成時に作成し、状態の出現数が変わると作り直す。
+                            _cumulative[state] == (total, suffixes, cumulative)
+        """
+        self._slots = array(ChainTable.TYPECODE, [0]) * ChainTable.INITIAL_SLOTS
+        self._keys = array(ChainTable.KEYCODE, [0])
+        self._heads = array(ChainTable.TYPECODE, [0])
+        self._totals = array(ChainTable.TYPECODE, [0])
+        self._suffixes = array(ChainTable.TYPECODE, [0])
+        self._counts = array(ChainTable.TYPECODE, [0])
+        self._nexts = array(ChainTable.TYPECODE, [0])
+        self._wide = {}
+        self._cumulative = {}
+
+    def add(self, prefix1, prefix2, suffix, count=1):
+        """状態(prefix1, prefix2)からsuffixへの遷移を出現数countだけ記録する。
+        新しい状態を作成した場合はTrueを返す。新しい状態の状態番号はlen(self)である。"""
+        key = ChainTable._key(prefix1, prefix2)
+        slot, state = self._lookup(key)
+        if not state:
+            state = len(self._keys)
+            self._keys.append(key)
+            self._heads.append(self._new_entry(suffix, count))
+            self._totals.append(count)
+            self._slots[slot] = state
+            if state * 3 > len(self._slots) * 2:
+                self._grow()
+            return True
+
+        self._totals[state] += count
+        wide = self._wide.get(state)
+        if wide is not None:
+            entries, tail = wide
+            entry = entries.get(suffix)
+            if entry:
+                self._counts[entry] += count
+            else:
+                entry = entries[suffix] = self._nexts[tail] = self._new_entry(suffix, count)
+                self._wide[state] = entries, entry
+            return False
+
+        prev, entry, length = 0, self._heads[state], 0
+        while entry:
+            if self._suffixes[entry] == suffix:
+                self._counts[entry] += count
+                if prev and self._counts[prev] < self._counts[entry]:
+                    self._swap(prev, entry)
+                return False
+            prev, entry, length = entry, self._nexts[entry], length + 1
+        self._nexts[prev] = self._new_entry(suffix, count)
+        if length >= ChainTable.WIDE:
+            self._index_wide(state)
+        return False
+
+    def choose(self, prefix1, prefix2, rng=random):
+        """状態(prefix1, prefix2)に続く接尾辞を、出現数の累積和を使って重み付きで選択する。
+        乱数は乱数生成器rng(randomモジュールまたはrandom.Random)から得る。
+        状態が記録されていなければNoneを返す。"""
+        _, state = self._lookup(ChainTable._key(prefix1, prefix2))
+        if not state:
+            return None
+        total = self._totals[state]
+        rest = rng.randrange(total)
+        if total >= ChainTable.WIDE_TOTAL:
+            suffixes, cumulative = self._cumulative_of(state)
+            return suffixes[bisect.bisect_right(cumulative, rest)]
+        entry = self._heads[state]
+        while True:
+            rest -= self._counts[entry]
+            if rest < 0:
+                return self._suffixes[entry]
+            entry = self._nexts[entry]
+
+    def suffixes(self, prefix1, prefix2):
+        """状態(prefix1, prefix2)に続く(接尾辞, 出現数)を列挙する。"""
+        _, state = self._lookup(ChainTable._key(prefix1, prefix2))
+        entry = self._heads[state] if state else 0
+        while entry:
+            yield self._suffixes[entry], self._counts[entry]
+            entry = self._nexts[entry]
+
+    def total(self, prefix1, prefix2):
+        """状態(prefix1, prefix2)に続く遷移の出現数の合計を返す。状態が記録されていなければ0を返す。"""
+        _, state = self._lookup(ChainTable._key(prefix1, prefix2))
+        return self._totals[state]
+
+    def states(self):
+        """記録されている状態を(prefix1, prefix2)の形で登録順に列挙する。"""
+        for key in self._keys[1:]:
+            yield key >> 32, key & 0xFFFFFFFF
+
+    def prefixes(self, state):
+        """状態番号stateの状態を(prefix1, prefix2)の形で返す。"""
+        key = self._keys[state]
+        return key >> 32, key & 0xFFFFFFFF
+
+    def transitions(self):
+        """記録されている遷移(状態と接尾辞の組)の数を返す。"""
+        return len(self._suffixes) - 1
+
+    def sections(self, prefix=''):
+        """表を構成する配列を、名前から配列への辞書として返す。名前にはprefixを前に付ける。"""
+        return {prefix + name: getattr(self, '_' + name) for name in ChainTable.ARRAYS}
+
+    @staticmethod
+    def from_sections(sections, prefix=''):
+        """sections(prefix)で得た配列から表を作成する。
+        mmapしたmemoryviewから作成した表は読み取り専用であり、書き換える前にthaw()で複製する。"""
+        table = ChainTable.__new__(ChainTable)
+        for name in ChainTable.ARRAYS:
+            setattr(table, '_' + name, sections[prefix + name])
+        table._wide = {}
+        table._cumulative = {}
+        return table
+
+    def thaw(self):
+        """すべての配列を書き換え可能なarrayに複製した表を返す。"""
+        return ChainTable.from_sections({name: markovfile.thaw(values)
+                                         for name, values in self.sections().items()})
+
+    def __contains__(self, prefixes):
+        return bool(self._lookup(ChainTable._key(*prefixes))[1])
+
+    def __len__(self):
+        return len(self._keys) - 1
+
+    def _lookup(self, key):
+        """キーkeyの状態を探し、(ハッシュ表の位置, 状態番号)を返す。
+        状態が無ければ、挿入すべき位置と0を返す。"""
+        mask = len(self._slots) - 1
+        slot = (key * ChainTable._GOLDEN >> 32) & mask
+        while True:
+            state = self._slots[slot]
+            if not state or self._keys[state] == key:
+                return slot, state
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        """ハッシュ表を2倍に広げ、すべての状態を入れ直す。"""
+        self._slots = array(ChainTable.TYPECODE, [0]) * (len(self._slots) * 2)
+        for state in range(1, len(self._keys)):
+            slot, _ = self._lookup(self._keys[state])
+            self._slots[slot] = state
+
+    def _cumulative_of(self, state):
+        """状態stateの接尾辞と出現数の累積和の配列を返す。出現数が変わるまで使い回す。"""
+        cached = self._cumulative.get(state)
+        if cached is not None and cached[0] == self._totals[state]:
+            return cached[1:]
+        suffixes = array(ChainTable.TYPECODE)
+        cumulative = array(ChainTable.KEYCODE)
+        total = 0
+        entry = self._heads[state]
+        while entry:
+            total += self._counts[entry]
+            suffixes.append(self._suffixes[entry])
+            cumulative.append(total)
+            entry = self._nexts[entry]
+        self._cumulative[state] = total, suffixes, cumulative
+        return suffixes, cumulative
+
+    def _index_wide(self, state):
+        """状態stateの接尾辞から要素番号への対応表を作成する。"""
+        entries = {}
+        entry = self._heads[state]
+        while entry:
+            entries[self._suffixes[entry]] = tail = entry
+            entry = self._nexts[entry]
+        self._wide[state] = entries, tail
+
+    def _new_entry(self, suffix, count):
+        self._suffixes.append(suffix)
+        self._counts.append(count)
+        self._nexts.append(0)
+        return len(self._suffixes) - 1
+
+    def _swap(self, a, b):
+        """要素aとbの接尾辞と出現数を入れ替える。リストのつながりは変えない。"""
+        self._suffixes[a], self._suffixes[b] = self._suffixes[b], self._suffixes[a]
+        self._counts[a], self._counts[b] = self._counts[b], self._counts[a]
+
+    @staticmethod
+    def _key(prefix1, prefix2):
+        """2つの単語IDを1つの整数にまとめ、状態のキーとする。"""
+        return prefix1 << 32 | prefix2
+
+
 class Markov:
     """マルコフ連鎖による文章の学習・生成を行う。
 
+    単語は出現順に整数のIDへ変換(インターン)し、遷移はChainTableに出現数として記録する。
+    辞書ファイルはmmapで開き、参照された部分だけをディスクから読み込む。
+    学習を行うと、その時点で辞書をメモリ上に複製する。
+
+    遷移(w1, w2) -> w3は、逆向きの遷移(w2, w3) -> w1としても記録し(後ろ向きの連鎖)、
+    さらに単語ごとに、その単語を含む状態を記録する(転置索引)。
+    キーワードがどこかの状態に含まれていれば、その状態から前後へ文章を伸ばすため、
+    キーワードが文頭に現れたことがなくても、キーワードを含む文章を生成できる。
+
+    単語IDで遷移を参照するメソッド(weight, choose_wordなど)は、
+    複数の辞書を重ねて一つの辞書として文章を生成するために使う(layered.LayeredMarkov)。
+
     クラス定数:
     ENDMARK -- 文章の終わりを表す記号
     CHAIN_MAX -- 連鎖を行う最大値
@@ -19,13 +259,34 @@ class Markov:
     ENDMARK = '%END%'
     CHAIN_MAX = 30
 
-    def __init__(self):
+    def __init__(self, weighted_starts=False):
         """インスタンス変数の初期化。
-        self._dic -- マルコフ辞書。 _dic['prefix1']['prefix2'] == ['suffixes']
-        self._starts -- 文章が始まる単語の数。 _starts['prefix'] == count
+        weighted_starts -- Trueであれば、文章を始める単語を学習した回数で重み付けして選択する
+
+        self._tokens -- IDから単語への対応表。 _tokens[id] == 'word'
+        self._ids -- 単語からIDへの対応表。 _ids['word'] == id
+        self._chains -- マルコフ辞書。 (prefix1, prefix2)からsuffixへの遷移と出現数
+        self._backward -- 後ろ向きの連鎖。 (prefix2, suffix)からprefix1への遷移と出現数。
+                          文頭の状態(w1, w2)からは、文頭を表すENDMARKへの遷移を記録する
+        self._occurrences -- 単語を含む状態の番号の配列。 _occurrences[word] == array(state)
+        self._seconds -- prefix1に続くprefix2の配列。 _seconds[prefix1] == array(prefix2)
+        self._starts -- 文章が始まる単語の数。 _starts[prefix1] == count
+        self._start_words -- 文章が始まる単語の配列。重複は含まない
+        self._start_cumulative -- _start_wordsと同じ位置の、学習した回数の累積和の配列。
+                                  weighted_startsで選択するときに作成し、回数が変わると作り直す
         """
-        self._dic = defaultdict(lambda: defaultdict(lambda: []))
-        self._starts = defaultdict(lambda: 0)
+        self.weighted_starts = weighted_starts
+        self._tokens = []
+        self._ids = {}
+        self._chains = ChainTable()
+        self._backward = ChainTable()
+        self._occurrences = {}
+        self._seconds = {}
+        self._starts = {}
+        self._start_words = array(ChainTable.TYPECODE)
+        self._start_cumulative = None
+        self._end = self.__intern(Markov.ENDMARK)
+        self._mapped = None
 
     def add_sentence(self, parts):
         """形態素解析結果partsを分解し、学習を行う。"""
@@ -33,85 +294,381 @@ class Markov:
         if len(parts) < 3:
             return
 
-        # 呼び出し元の値を変更しないように`copy`する
-        parts = copy.copy(parts)
+        # mmapしたファイルを参照している場合は、書き換える前にメモリ上へ複製する
+        self.__thaw()
+
+        # 品詞情報は必要ないため、単語だけをIDに変換する
+        words = [self.__intern(word) for word, _ in parts]
 
         # prefix1, prefix2 には文章の先頭の2単語が入る
-        prefix1, prefix2 = parts.pop(0)[0], parts.pop(0)[0]
+        prefix1, prefix2 = words[0], words[1]
 
         # 文章の開始点を記録する
         # 文章生成時に「どの単語から文章を作るか」の参考にするため
+        # 後ろ向きの連鎖には、文頭の状態から文頭へ戻る遷移を記録する
         self.__add_start(prefix1)
+        self._backward.add(prefix1, prefix2, self._end)
 
         # `prefix`と`suffix`をスライドさせながら`__add_suffix`で学習させる
-        # 品詞情報は必要ないため、`_`で使わないことを明示する
         # すべての単語を登録したら、最後にENDMARKを追加する
-        for suffix, _ in parts:
+        for suffix in words[2:]:
             self.__add_suffix(prefix1, prefix2, suffix)
             prefix1, prefix2 = prefix2, suffix
-        self.__add_suffix(prefix1, prefix2, Markov.ENDMARK)
+        self.__add_suffix(prefix1, prefix2, self._end)
 
-    def generate(self, keyword):
-        """keywordをprefix1とし、そこから始まる文章を生成して返す。"""
+    def sizes(self):
+        """単語の数(words)、状態の数(states)、遷移の数(transitions)、
+        文章が始まる単語の数(starts)を辞書で返す。"""
+        return {
+            'words': len(self._tokens) - 1,
+            'states': len(self._chains),
+            'transitions': self._chains.transitions(),
+            'starts': len(self._start_words),
+        }
+
+    def transitions(self):
+        """記録されている遷移を(prefix1, prefix2, suffix, 出現数)の単語の形で列挙する。"""
+        tokens = self._tokens
+        for prefix1, prefix2 in self._chains.states():
+            for suffix, count in self._chains.suffixes(prefix1, prefix2):
+                yield tokens[prefix1], tokens[prefix2], tokens[suffix], count
+
+    def starts(self):
+        """文章が始まる単語を(単語, 出現数)の形で列挙する。"""
+        for prefix1 in self._start_words:
+            yield self._tokens[prefix1], self._starts[prefix1]
+
+    def merge(self, other):
+        """別のMarkov otherが学習した遷移と文章の開始点を、出現数ごと取り込む。
+        otherがMarkovでなければTypeErrorを送出する。"""
+        if not isinstance(other, Markov):
+            raise TypeError('Markovに取り込めるのはMarkovだけです: {}'.format(type(other).__name__))
+        self.__thaw()
+        words = [self.__intern(word) for word in other._tokens]
+        for prefix1, prefix2 in other._chains.states():
+            for suffix, count in other._chains.suffixes(prefix1, prefix2):
+                self.__add_suffix(words[prefix1], words[prefix2], words[suffix], count)
+        for prefix1 in other._start_words:
+            self.__add_start(words[prefix1], other._starts[prefix1])
+        for (prefix1, prefix2), count in other.__heads():
+            self._backward.add(words[prefix1], words[prefix2], self._end, count)
+
+    def prune(self, min_count):
+        """出現数がmin_count未満の遷移を取り除き、使われなくなった単語・状態・開始点を詰めて作り直す。
+        取り除いた遷移の数を返す。mmapした辞書は作り直す際にメモリ上へ複製される。"""
+        pruned = Markov(self.weighted_starts)
+        tokens = self._tokens
+        removed = 0
+        for prefix1, prefix2 in self._chains.states():
+            for suffix, count in self._chains.suffixes(prefix1, prefix2):
+                if count < min_count:
+                    removed += 1
+                    continue
+                pruned.__add_suffix(pruned.__intern(tokens[prefix1]),
+                                    pruned.__intern(tokens[prefix2]),
+                                    pruned.__intern(tokens[suffix]), count)
+        for prefix1 in self._start_words:
+            word_id = pruned._ids.get(tokens[prefix1])
+            if word_id in pruned._seconds:
+                pruned.__add_start(word_id, self._starts[prefix1])
+        for (prefix1, prefix2), count in self.__heads():
+            state = (pruned._ids.get(tokens[prefix1]), pruned._ids.get(tokens[prefix2]))
+            if None not in state and state in pruned._chains:
+                pruned._backward.add(*state, pruned._end, count)
+        self.__replace(pruned)
+        return removed
+
+    def __replace(self, other):
+        """表をすべて、作り直したMarkov otherのものに置き換える。weighted_startsは変えない。"""
+        self._tokens = other._tokens
+        self._ids = other._ids
+        self._chains = other._chains
+        self._backward = other._backward
+        self._occurrences = other._occurrences
+        self._seconds = other._seconds
+        self._starts = other._starts
+        self._start_words = other._start_words
+        self._start_cumulative = other._start_cumulative
+        self._end = other._end
+        self._mapped = other._mapped
+
+    def word_id(self, word):
+        """単語wordのIDを返す。無ければNoneを返す。"""
+        return self._ids.get(word)
+
+    def word(self, word_id):
+        """IDがword_idの単語を返す。"""
+        return self._tokens[word_id]
+
+    def weight(self, prefix1, prefix2, backward=False):
+        """単語IDの状態(prefix1, prefix2)に続く遷移の出現数の合計を返す。記録が無ければ0を返す。
+        backwardがTrueであれば、後ろ向きの連鎖で状態(prefix1, prefix2)の前に来る単語について返す。"""
+        return (self._backward if backward else self._chains).total(prefix1, prefix2)
+
+    def choose_word(self, prefix1, prefix2, rng=random, backward=False):
+        """単語IDの状態(prefix1, prefix2)に続く単語のIDを、出現数で重み付けして選択して返す。
+        文章の終わり(後ろ向きの連鎖では文頭)であればENDMARKのIDを、記録が無ければNoneを返す。"""
+        return (self._backward if backward else self._chains).choose(prefix1, prefix2, rng)
+
+    def keyword_weight(self, keyword):
+        """keywordを含む状態の数を返す。"""
+        keyword_id = self._ids.get(keyword)
+        return len(self._occurrences[keyword_id]) if keyword_id in self._occurrences else 0
+
+    def choose_around(self, keyword, rng=random):
+        """keywordを含む状態を一つ選び、単語IDの組(prefix1, prefix2)で返す。無ければNoneを返す。"""
+        keyword_id = self._ids.get(keyword)
+        if keyword_id not in self._occurrences:
+            return None
+        return self._chains.prefixes(rng.choice(self._occurrences[keyword_id]))
+
+    def start_weight(self):
+        """文章を始める単語の選択肢の数を返す。weighted_startsがTrueであれば学習した回数の合計を返す。"""
+        if not self.weighted_starts:
+            return len(self._start_words)
+        return self.__start_cumulative()[-1] if self._start_words else 0
+
+    def choose_start(self, rng=random):
+        """文章を始める2単語を選び、単語IDの組(prefix1, prefix2)で返す。無ければNoneを返す。"""
+        if not self._start_words:
+            return None
+        prefix1 = self.__choose_start(rng)
+        return prefix1, rng.choice(self._seconds[prefix1])
+
+    def generate(self, keyword, rng=random):
+        """keywordを含む文章を生成して返す。
+        乱数生成器rngを渡すと、同じ状態のrngからは同じ文章を生成する。"""
         # 辞書が空である場合はNoneを返す
-        if not self._dic:
+        if not self._chains:
             return None
 
-        # keywordがprefix1として登録されていない場合、_startsからランダムに選択する
-        prefix1 = keyword if self._dic[keyword] else choice(list(self._starts.keys()))
+        # keywordを含む状態があれば、そのうちの一つを選び、そこから前後へ文章を伸ばす
+        # 存在しないkeywordを調べても辞書には何も追加しない
+        keyword_id = self._ids.get(keyword)
+        if keyword_id in self._occurrences:
+            prefix1, prefix2 = self._chains.prefixes(rng.choice(self._occurrences[keyword_id]))
+            words = self.__extend_backward([prefix1, prefix2], rng)
+            return self.__extend_forward(words, rng)
+
+        # keywordがどの状態にも含まれていない場合、文章が始まる単語からランダムに選択する
+        if not self._start_words:
+            return None
+        prefix1 = self.__choose_start(rng)
 
         # prefix1をもとにprefix2をランダムに選択する
-        prefix2 = choice(list(self._dic[prefix1].keys()))
+        prefix2 = rng.choice(self._seconds[prefix1])
 
-        # 文章の始めの単語2つをwordsに設定する
-        words = [prefix1, prefix2]
+        # 文章の始めの単語2つから、後ろへ文章を伸ばす
+        return self.__extend_forward([prefix1, prefix2], rng)
 
+    def __extend_forward(self, words, rng):
+        """単語IDのリストwordsの末尾の2単語から、後ろへ文章を伸ばして文字列で返す。"""
         # 最大CHAIN_MAX回のループを回し、単語を選択してwordsを拡張していく
-        # ランダムに選択したsuffixがENDMARKであれば終了し、単語であればwordsに追加する
+        # 出現数で重み付けして選択したsuffixがENDMARKであれば終了し、単語であればwordsに追加する
+        # pruneで遷移が取り除かれ、続く状態が無い場合も終了する
         # その後prefix1, prefix2をスライドさせて始めに戻る
+        prefix1, prefix2 = words[-2:]
         for _ in range(Markov.CHAIN_MAX):
-            suffix = choice(self._dic[prefix1][prefix2])
-            if suffix == Markov.ENDMARK:
+            suffix = self._chains.choose(prefix1, prefix2, rng)
+            if suffix is None or suffix == self._end:
                 break
             words.append(suffix)
             prefix1, prefix2 = prefix2, suffix
 
-        return ''.join(words)
+        return ''.join(self._tokens[word] for word in words)
+
+    def __extend_backward(self, words, rng):
+        """単語IDのリストwordsの先頭の2単語から、後ろ向きの連鎖で前へ文章を伸ばしたリストを返す。
+        前へ伸ばすのは最大CHAIN_MAXの半分までとし、文頭に戻るか、記録が無ければ終了する。"""
+        head = []
+        prefix2, suffix = words[0], words[1]
+        for _ in range(Markov.CHAIN_MAX // 2):
+            prefix1 = self._backward.choose(prefix2, suffix, rng)
+            if prefix1 is None or prefix1 == self._end:
+                break
+            head.append(prefix1)
+            prefix2, suffix = prefix1, prefix2
+        head.reverse()
+        return head + words
 
     def load(self, filename):
-        """ファイルfilenameから辞書データを読み込む。"""
+        """ファイルfilenameから辞書データを読み込む。
+        バイナリ形式の辞書はmmapで開き、必要になるまで読み込まない。
+        pickleやdillで保存された旧形式の辞書は、読み込み時に変換する。"""
+        if markovfile.is_markov_file(filename):
+            self.__map(filename)
+            return
+
         with open(filename, 'rb') as f:
-            self._dic, self._starts = dill.load(f)
+            try:
+                data = pickle.load(f)
+            except ModuleNotFoundError as error:
+                raise RuntimeError('旧形式のマルコフ辞書を読み込むにはdillが必要です: '
+                                   '{}'.format(filename)) from error
+
+        if isinstance(data, tuple):
+            self.__load_legacy(*data)
+            return
+
+        self._tokens = data['tokens']
+        self._ids = {word: i for i, word in enumerate(self._tokens)}
+        self._chains = data['chains']
+        self._seconds = data['seconds']
+        self._starts = {}
+        self._start_words = array(ChainTable.TYPECODE)
+        self._start_cumulative = None
+        for prefix1, count in data['starts'].items():
+            self.__add_start(prefix1, count)
+        self._end = self._ids[Markov.ENDMARK]
+        self.__derive_backward()
+
+    def save(self, filename, journal=None):
+        """ファイルfilenameへ辞書データをバイナリ形式で書き込む。
+        mmapしたファイルから何も学習していなければ、同じファイルへは書き込まない。
+        journalを指定すると、辞書が取り込んだジャーナルの最後の記録の番号としてjournalセクションに書き込む。"""
+        if self._mapped == os.path.abspath(filename):
+            return
+
+        sections = TokenTable.sections(self._tokens)
+        sections.update(self._chains.sections())
+        sections.update(self._backward.sections('b'))
+        sections.update(OffsetMap.sections(self._seconds, len(self._tokens),
+                                           'secoffs', 'seconds'))
+        sections.update(OffsetMap.sections(self._occurrences, len(self._tokens),
+                                           'occoffs', 'occurs'))
+        sections['startwds'] = self._start_words
+        sections['startcnt'] = array(ChainTable.TYPECODE,
+                                     (self._starts[word] for word in self._start_words))
+        if journal is not None:
+            sections['journal'] = array('Q', [journal])
+        markovfile.write(filename, sections)
+
+    def __map(self, filename):
+        """バイナリ形式の辞書ファイルfilenameをmmapし、各配列として参照する。"""
+        sections = markovfile.read(filename)
+        self._tokens = TokenTable(sections['tokoffs'], sections['tokblob'])
+        self._ids = TokenIndex(self._tokens, sections['tokorder'])
+        self._chains = ChainTable.from_sections(sections)
+        self._seconds = OffsetMap(sections['secoffs'], sections['seconds'])
+        self._start_words = sections['startwds']
+        self._start_cumulative = None
+        self._starts = dict(zip(self._start_words, sections['startcnt']))
+        self._end = self._ids.get(Markov.ENDMARK)
+        if 'bkeys' in sections:
+            self._backward = ChainTable.from_sections(sections, 'b')
+            self._occurrences = OffsetMap(sections['occoffs'], sections['occurs'])
+        else:
+            # バージョン1の辞書には後ろ向きの連鎖が無いため、前向きの遷移から作成する
+            self.__derive_backward()
+        self._mapped = os.path.abspath(filename)
+
+    def __thaw(self):
+        """mmapしたファイルを参照している場合、すべてをメモリ上の書き換え可能な形に複製する。"""
+        if self._mapped is None:
+            return
+        self._tokens = list(self._tokens)
+        self._ids = {word: i for i, word in enumerate(self._tokens)}
+        self._chains = self._chains.thaw()
+        self._backward = self._backward.thaw()
+        self._seconds = {prefix1: markovfile.thaw(self._seconds[prefix1])
+                         for prefix1 in self._seconds.keys()}
+        self._occurrences = {word: markovfile.thaw(self._occurrences[word])
+                             for word in self._occurrences.keys()}
+        self._start_words = markovfile.thaw(self._start_words)
+        self._mapped = None
+
+    def __load_legacy(self, dic, starts):
+        """旧形式の辞書 dic['prefix1']['prefix2'] == ['suffixes'] を取り込む。"""
+        for prefix1, suffixes_by_prefix2 in dic.items():
+            for prefix2, suffixes in suffixes_by_prefix2.items():
+                for suffix in suffixes:
+                    self.__add_suffix(self.__intern(prefix1),
+                                      self.__intern(prefix2),
+                                      self.__intern(suffix))
+        for prefix1, count in starts.items():
+            self.__add_start(self.__intern(prefix1), count)
+
+    def __intern(self, word):
+        """単語wordのIDを返す。未登録であれば新しいIDを割り当てる。"""
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self._tokens)
+            self._tokens.append(word)
+        return word_id
+
+    def __add_suffix(self, prefix1, prefix2, suffix, count=1):
+        if self._chains.add(prefix1, prefix2, suffix, count):
+            self._seconds.setdefault(prefix1, array(ChainTable.TYPECODE)).append(prefix2)
+            self.__index_state(prefix1, prefix2, len(self._chains))
+        if suffix != self._end:
+            self._backward.add(prefix2, suffix, prefix1, count)
+
+    def __index_state(self, prefix1, prefix2, state):
+        """状態番号stateの状態(prefix1, prefix2)を、含まれる単語ごとに転置索引へ記録する。"""
+        self._occurrences.setdefault(prefix1, array(ChainTable.TYPECODE)).append(state)
+        if prefix2 != prefix1:
+            self._occurrences.setdefault(prefix2, array(ChainTable.TYPECODE)).append(state)
+
+    def __heads(self):
+        """文頭の状態を((prefix1, prefix2), 出現数)の形で列挙する。"""
+        for prefix2, suffix in self._backward.states():
+            for prefix1, count in self._backward.suffixes(prefix2, suffix):
+                if prefix1 == self._end:
+                    yield (prefix2, suffix), count
+
+    def __derive_backward(self):
+        """前向きの遷移から、後ろ向きの連鎖と転置索引を作成する。
+        どの状態が文頭であったかは記録されていないため、後ろ向きの連鎖は文頭で止まらず、
+        記録の無い状態に達するか、CHAIN_MAXの半分まで伸ばして終わる。"""
+        self._backward = ChainTable()
+        self._occurrences = {}
+        for state, (prefix1, prefix2) in enumerate(self._chains.states(), 1):
+            self.__index_state(prefix1, prefix2, state)
+            for suffix, count in self._chains.suffixes(prefix1, prefix2):
+                if suffix != self._end:
+                    self._backward.add(prefix2, suffix, prefix1, count)
 
-    def save(self, filename):
-        """ファイルfilenameへ辞書データを書き込む。"""
-        with open(filename, 'wb') as f:
-            dill.dump((self._dic, self._starts), f)
+    def __add_start(self, prefix1, count=1):
+        if prefix1 not in self._starts:
+            self._starts[prefix1] = 0
+            self._start_words.append(prefix1)
+        self._starts[prefix1] += count
+        self._start_cumulative = None
 
-    def __add_suffix(self, prefix1, prefix2, suffix):
-        self._dic[prefix1][prefix2].append(suffix)
+    def __choose_start(self, rng):
+        """文章を始める単語を選択する。
+        weighted_startsがTrueであれば学習した回数で重み付けし、そうでなければ一様に選択する。"""
+        if not self.weighted_starts:
+            return rng.choice(self._start_words)
+        cumulative = self.__start_cumulative()
+        return self._start_words[bisect.bisect_right(cumulative, rng.randrange(cumulative[-1]))]
 
-    def __add_start(self, prefix1):
-        self._starts[prefix1] += 1
+    def __start_cumulative(self):
+        """文章が始まる単語の、学習した回数の累積和の配列を返す。回数が変わるまで使い回す。"""
+        cumulative = self._start_cumulative
+        if cumulative is None:
+            cumulative = array(ChainTable.KEYCODE)
+            total = 0
+            for prefix1 in self._start_words:
+                total += self._starts[prefix1]
+                cumulative.append(total)
+            self._start_cumulative = cumulative
+        return cumulative
 
 
 def main():
+    # 循環importを避けるため、コーパスの分割はここで読み込む
+    from .train import iter_sentences
     markov = Markov()
-    sep = r'[。?？!！ 　]+'
     filename = sys.argv[1]
     dicfile = '{}.dat'.format(filename)
     if os.path.exists(dicfile):
         markov.load(dicfile)
     else:
+        # コーパスは一行ずつ読み込み、文ごとに学習するため、全体をメモリに載せない
         with open(filename, encoding='utf-8') as f:
-            sentences = []
-            for line in f:
-                sentences.extend(re.split(sep, line.strip()))
-        for sentence in tqdm.tqdm(sentences):
-            if sentence:
+            for sentence in tqdm.tqdm(iter_sentences(f), unit='sentences'):
                 markov.add_sentence(analyze(sentence))
-                # print('.', end='')
-                # sys.stdout.flush()
         markov.save(dicfile)
     print('\n')
 
@@ -0,0 +1,294 @@
+"""マルコフ辞書(markov.dat)のバイナリ形式を読み書きするモジュール。
+
+ファイルはヘッダ、セクション表、セクション本体の順に並ぶ。数値はすべてリトルエンディアン。
+
+ヘッダ(16バイト):
+    magic    8s  b'UNMOMKV\\0'
+    version  I   形式のバージョン(現在は2。2で後ろ向きの連鎖と転置索引のセクションを加えた)
+    count    I   セクションの数
+
+セクション表(1セクションあたり40バイト、count個):
+    name     16s セクション名(ASCII、NULで埋める)
+    typecode c   要素の型(arrayモジュールの型コード。'B', 'I', 'Q'のいずれか)
+    (7バイトの詰め物)
+    offset   Q   ファイル先頭からのバイト位置(8の倍数)
+    length   Q   バイト数
+
+セクション本体は8バイト境界に揃えて置かれるため、mmapしたファイルを
+そのままmemoryview.castで配列として参照できる。
+
+Markovが書き出すセクション:
+    tokoffs   I  単語ID順の、tokblob内の開始位置。末尾に終端位置を加えた(単語数+1)個
+    tokblob   B  UTF-8でエンコードした単語を連結したもの
+    tokorder  I  単語のバイト列の昇順に並べた単語ID。単語からIDを二分探索するために使う
+    slots, keys, heads, totals, suffixes, counts, nexts
+              I/Q ChainTableの配列をそのまま書き出したもの
+    bslots, bkeys, bheads, btotals, bsuffixes, bcounts, bnexts
+              I/Q 後ろ向きの連鎖のChainTableの配列
+    secoffs   I  prefix1ごとの、secondsの開始位置。(単語数+1)個
+    seconds   I  prefix1に続くprefix2を、prefix1の順に連結したもの
+    occoffs   I  単語ごとの、occursの開始位置。(単語数+1)個
+    occurs    I  単語を含む状態の番号を、単語の順に連結したもの
+    startwds  I  文章が始まる単語
+    startcnt  I  startwdsそれぞれの出現数。重み付けの累積和は読み込んだ後に作成する
+    (以前の版が書き出していたstartevs(文章が始まる単語を学習した回数だけ並べたもの)は読み飛ばす)
+    journal   Q  辞書が取り込んだジャーナルの最後の記録の番号(要素は1個)。ジャーナルモードで保存したときだけ書き出す
+
+NgramMarkov(unmo.ngram)は、tokoffs/tokblob/tokorder、startwds/startcnt、journalに加えて、
+次のセクションを書き出す:
+    order     I  次数(要素は1個)
+    parents, labels, counts, totals, firsts, nexts
+              I  n-gramのトライ木の、節点ごとの配列
+    childoffs I  節点ごとの、childlbls/childord内の子の開始位置。(節点数+1)個
+    childlbls I  根を除く節点を(親の節点, 単語)の昇順に並べたときの、各節点の単語
+    childord  I  childlblsと同じ順に並べた節点。子の節点を親ごとに二分探索するために使う
+
+関数:
+    write(filename, sections) -- セクションの辞書をファイルに書き出す
+    read(filename) -- ファイルをmmapし、セクション名から配列への辞書を返す
+    is_markov_file(filename) -- ファイルがこの形式であるかどうかを返す
+
+コマンドラインから実行すると、dillやpickleで保存された旧形式の辞書をこの形式に変換する。
+
+    python -m unmo.markovfile 旧形式のファイル [変換後のファイル]
+"""
+import sys
+import mmap
+import bisect
+import struct
+from array import array
+from collections.abc import Sequence
+from .util import atomic_open
+
+
+MAGIC = b'UNMOMKV\0'
+VERSION = 2
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<16sc7xQQ')
+ALIGN = 8
+
+
+def is_markov_file(filename):
+    """ファイルfilenameがこの形式のマルコフ辞書であるかどうかを真偽値で返す。"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write(filename, sections):
+    """セクション名から配列(arrayまたはmemoryview)への辞書sectionsをfilenameに書き出す。
+    一時ファイルに書き出してから置き換えるため、途中で失敗しても元のファイルは壊れない。"""
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table = []
+    for name, values in sections.items():
+        data = memoryview(values)
+        table.append((name, data, offset))
+        offset = _align(offset + data.nbytes)
+
+    with atomic_open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(table)))
+        for name, data, offset in table:
+            f.write(SECTION.pack(name.encode('ascii'), data.format[-1].encode('ascii'),
+                                 offset, data.nbytes))
+        for name, data, offset in table:
+            f.write(b'\0' * (offset - f.tell()))
+            if sys.byteorder == 'little' or data.itemsize == 1:
+                f.write(data.cast('B'))
+            else:
+                swapped = array(data.format[-1], data.tobytes())
+                swapped.byteswap()
+                f.write(swapped.tobytes())
+
+
+def read(filename):
+    """ファイルfilenameを読み取り専用でmmapし、セクション名から配列への辞書を返す。
+    配列はmmapを直接参照するmemoryviewであり、必要になるまでディスクから読み込まれない。
+    ビッグエンディアンの環境ではmmapせず、バイト順を入れ替えたarrayを返す。"""
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError('マルコフ辞書の形式ではありません: {}'.format(filename))
+    if version > VERSION:
+        raise ValueError('未対応のマルコフ辞書のバージョンです: {}'.format(version))
+
+    view = memoryview(buffer)
+    sections = {}
+    for i in range(count):
+        name, typecode, offset, length = SECTION.unpack_from(buffer, HEADER.size + SECTION.size * i)
+        name = name.rstrip(b'\0').decode('ascii')
+        typecode = typecode.decode('ascii')
+        data = view[offset:offset + length]
+        if sys.byteorder == 'little' or typecode == 'B':
+            sections[name] = data.cast(typecode)
+        else:
+            values = array(typecode, data.tobytes())
+            values.byteswap()
+            sections[name] = values
+    return sections
+
+
+def thaw(values):
+    """memoryviewやarrayの配列valuesを、書き換え可能なarrayに複製して返す。"""
+    copied = array(values.format[-1] if isinstance(values, memoryview) else values.typecode)
+    copied.frombytes(memoryview(values).cast('B'))
+    return copied
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class TokenTable(Sequence):
+    """tokoffs/tokblobセクションを参照し、単語IDから単語を引くシーケンス。
+    単語は参照されるたびにデコードする。"""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def raw(self, index):
+        """単語IDがindexである単語のUTF-8のバイト列を返す。"""
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @staticmethod
+    def sections(tokens):
+        """単語のシーケンスtokensから、tokoffs/tokblob/tokorderセクションを作成する。"""
+        encoded = [token.encode('utf-8') for token in tokens]
+        offsets = array('I', [0])
+        position = 0
+        for raw in encoded:
+            position += len(raw)
+            offsets.append(position)
+        order = array('I', sorted(range(len(encoded)), key=encoded.__getitem__))
+        return {
+            'tokoffs': offsets,
+            'tokblob': array('B', b''.join(encoded)),
+            'tokorder': order,
+        }
+
+
+class TokenIndex:
+    """tokorderセクションを二分探索し、単語から単語IDを引く対応表。"""
+
+    def __init__(self, tokens, order):
+        self._tokens = tokens
+        self._order = order
+
+    def get(self, word, default=None):
+        """単語wordの単語IDを返す。無ければdefaultを返す。"""
+        if word is None:
+            return default
+        key = word.encode('utf-8')
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            raw = self._tokens.raw(self._order[mid])
+            if raw < key:
+                lo = mid + 1
+            elif raw > key:
+                hi = mid
+            else:
+                return self._order[mid]
+        return default
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+
+class ChildIndex:
+    """childoffs/childlbls/childordセクションを参照し、(親の節点, 単語)のキーから子の節点を引く対応表。
+    キーは 親の節点 << 32 | 単語 である。同じ親の子は単語の順に連続して並ぶため、
+    その範囲だけをbisectで二分探索する。"""
+
+    def __init__(self, offsets, labels, order):
+        self._offsets = offsets
+        self._labels = labels
+        self._order = order
+
+    def get(self, key, default=None):
+        """キーkeyの子の節点を返す。無ければdefaultを返す。"""
+        parent, word = key >> 32, key & 0xFFFFFFFF
+        if parent + 1 >= len(self._offsets):
+            return default
+        hi = self._offsets[parent + 1]
+        i = bisect.bisect_left(self._labels, word, self._offsets[parent], hi)
+        if i < hi and self._labels[i] == word:
+            return self._order[i]
+        return default
+
+    @staticmethod
+    def sections(parents, labels):
+        """節点ごとの配列parents, labelsから、childoffs/childlbls/childordセクションを作成する。"""
+        order = sorted(range(1, len(parents)), key=lambda node: parents[node] << 32 | labels[node])
+        offsets = array('I', [0] * (len(parents) + 1))
+        for node in order:
+            offsets[parents[node] + 1] += 1
+        for node in range(len(parents)):
+            offsets[node + 1] += offsets[node]
+        return {
+            'childoffs': offsets,
+            'childlbls': array('I', (labels[node] for node in order)),
+            'childord': array('I', order),
+        }
+
+
+class OffsetMap:
+    """開始位置の配列offsetsと値の配列valuesから、
+    キー(単語ID)ごとの値の範囲を引く対応表。secoffs/secondsセクションの参照に使う。"""
+
+    def __init__(self, offsets, values):
+        self._offsets = offsets
+        self._values = values
+
+    def __contains__(self, key):
+        return (key is not None and 0 <= key < len(self._offsets) - 1
+                and self._offsets[key] < self._offsets[key + 1])
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self._values[self._offsets[key]:self._offsets[key + 1]]
+
+    def keys(self):
+        return (key for key in range(len(self._offsets) - 1) if key in self)
+
+    def __len__(self):
+        return sum(1 for _ in self.keys())
+
+    @staticmethod
+    def sections(mapping, size, offsets_name, values_name):
+        """単語IDから配列への辞書mappingを、size個の開始位置と連結した値のセクションにする。"""
+        offsets = array('I', [0])
+        values = array('I')
+        for key in range(size):
+            values.extend(mapping[key] if key in mapping else ())
+            offsets.append(len(values))
+        return {offsets_name: offsets, values_name: values}
+
+
+def main():
+    from .markov import Markov
+    if len(sys.argv) < 2:
+        print('usage: python -m unmo.markovfile 旧形式のファイル [変換後のファイル]')
+        sys.exit(1)
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else src
+    markov = Markov()
+    markov.load(src)
+    markov.save(dst)
+    print('{} -> {}'.format(src, dst))
+
+
+if __name__ == '__main__':
+    main()
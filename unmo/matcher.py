@@ -0,0 +1,125 @@
+import re
+
+
+class PatternMatcher:
+    """パターン辞書のキーワードをまとめて照合するためのトライ木。
+
+    PatternResponderはパターンの数だけre.searchを実行していたが、
+    PatternMatcherはすべてのキーワードを一本のトライ木に登録しておき、
+    入力文字列を一度走査するだけで一致するパターンを見つける。
+
+    正規表現のパターン(手書きのpattern.txtなど)はトライ木に登録できないため、
+    従来通りre.searchで照合する。学習した単語は、記号を含んでいても文字列としてトライ木に登録する。
+
+    辞書ファイルでは、正規表現のメタ文字を含む単語を正規表現として扱う。
+    そのため学習した単語は、メタ文字を含む場合はエスケープして書き出す(escape)。
+    読み込むときは、エスケープされた単語と正規表現としてコンパイルできない単語を文字列に戻す(parse)。
+
+    メソッド:
+    add(pattern) -- パターンハッシュを登録する
+    search(text) -- textに一致する最初のパターンと一致した文字列を返す
+
+    スタティックメソッド:
+    is_regex(word) -- wordが正規表現のメタ文字を含むかどうかを返す
+    parse(word) -- 辞書ファイルの単語を(キーワード, 正規表現であるか)に変換する
+    escape(word, regex) -- キーワードを辞書ファイルの単語に変換する
+    """
+
+    META_CHARS = frozenset('.^$*+?{}[]\\|()')
+    _TERMINAL = ''
+
+    def __init__(self, patterns=()):
+        """パターンハッシュのイテラブルpatternsを受け取り、登録順に登録する。"""
+        self._root = {}
+        self._regexes = []
+        self._order = 0
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        """パターンハッシュpatternを登録する。pattern['regex']が真であれば正規表現として照合する。
+        同じキーワードがすでに登録されている場合、先に登録されたものを優先する。"""
+        word = pattern['pattern']
+        order = self._order
+        self._order += 1
+
+        if pattern.get('regex'):
+            self._regexes.append((order, re.compile(word), pattern))
+            return
+
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node.setdefault(PatternMatcher._TERMINAL, (order, pattern))
+
+    def search(self, text):
+        """textに一致するパターンのうち、最も先に登録されたものを探す。
+        (パターンハッシュ, 一致した文字列)のタプルを、無ければNoneを返す。"""
+        best = None
+        for start in range(len(text)):
+            node = self._root
+            for end in range(start, len(text)):
+                node = node.get(text[end])
+                if node is None:
+                    break
+                terminal = node.get(PatternMatcher._TERMINAL)
+                if terminal and (best is None or terminal[0] < best[0]):
+                    best = (terminal[0], terminal[1], text[start:end + 1])
+
+        for order, regex, pattern in self._regexes:
+            if best is not None and best[0] < order:
+                break
+            matcher = regex.search(text)
+            if matcher:
+                best = (order, pattern, matcher[0])
+                break
+
+        return best[1:] if best else None
+
+    @staticmethod
+    def is_regex(word):
+        """wordが正規表現のメタ文字を含むかどうかを真偽値で返す。
+
+        >>> PatternMatcher.is_regex('名詞')
+        False
+        >>> PatternMatcher.is_regex('^(こんにちは|こんばんは)')
+        True
+        """
+        return any(char in PatternMatcher.META_CHARS for char in word)
+
+    @staticmethod
+    def parse(word):
+        """辞書ファイルに書かれた単語wordを、(キーワード, 正規表現であるか)のタプルに変換する。
+        エスケープされた文字列と、正規表現としてコンパイルできない単語は文字列として扱う。
+
+        >>> PatternMatcher.parse('^(こんにちは|こんばんは)')
+        ('^(こんにちは|こんばんは)', True)
+        >>> PatternMatcher.parse('C\\\\+\\\\+')
+        ('C++', False)
+        >>> PatternMatcher.parse('(笑')
+        ('(笑', False)
+        """
+        if not PatternMatcher.is_regex(word):
+            return word, False
+        literal = re.sub(r'\\(.)', r'\1', word, flags=re.DOTALL)
+        if re.escape(literal) == word:
+            return literal, False
+        try:
+            re.compile(word)
+        except re.error:
+            return word, False
+        return word, True
+
+    @staticmethod
+    def escape(word, regex=False):
+        """キーワードwordを辞書ファイルに書く単語に変換する。
+        正規表現でないキーワードがメタ文字を含んでいれば、エスケープする。
+
+        >>> PatternMatcher.escape('C++')
+        'C\\\\+\\\\+'
+        >>> PatternMatcher.escape('^(こんにちは|こんばんは)', True)
+        '^(こんにちは|こんばんは)'
+        """
+        if regex or not PatternMatcher.is_regex(word):
+            return word
+        return re.escape(word)
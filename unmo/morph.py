@@ -1,15 +1,161 @@
-import re
+import threading
+from collections import OrderedDict, namedtuple
 from janome.tokenizer import Tokenizer
 
 
-TOKENIZER = Tokenizer()
+_TOKENIZER = None
+_TOKENIZER_LOCK = threading.Lock()
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class AnalysisCache:
+    """形態素解析結果を入力文字列ごとに保持する、大きさに上限のあるLRUキャッシュ。
+
+    メソッド:
+    get(text) -- textの解析結果を返す。無ければNoneを返す
+    put(text, parts) -- textの解析結果partsを保持する
+    resize(maxsize) -- 上限を変更する。0であればキャッシュしない
+    clear() -- 保持している解析結果と統計を消去する
+    info() -- ヒット数・ミス数・追い出し数などをCacheInfoとして返す
+    """
+
+    def __init__(self, maxsize=1024):
+        self._entries = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = 0
+
+    def get(self, text):
+        with self._lock:
+            parts = self._entries.get(text)
+            if parts is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(text)
+            return parts
+
+    def put(self, text, parts):
+        with self._lock:
+            if self._maxsize <= 0:
+                return
+            self._entries[text] = parts
+            self._entries.move_to_end(text)
+            self._evict()
+
+    def resize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions,
+                             self._maxsize, len(self._entries))
+
+    def _evict(self):
+        while len(self._entries) > max(self._maxsize, 0):
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+CACHE = AnalysisCache()
+
+
+def tokenizer():
+    """プロセス全体で共有するjanomeのTokenizerを返す。
+    システム辞書の読み込みに時間がかかるため、初めて必要になったときに一度だけ作成する。"""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        with _TOKENIZER_LOCK:
+            if _TOKENIZER is None:
+                _TOKENIZER = Tokenizer()
+    return _TOKENIZER
 
 
 def analyze(text):
-    """文字列textを形態素解析し、[(surface, parts)]の形にして返す。"""
-    return [(t.surface, t.part_of_speech) for t in TOKENIZER.tokenize(text)]
+    """文字列textを形態素解析し、((surface, parts), ...)の形にして返す。
+    同じ文字列の解析結果はキャッシュから返すため、呼び出し元が変更できないタプルで返す。"""
+    parts = CACHE.get(text)
+    if parts is None:
+        parts = tuple((t.surface, t.part_of_speech) for t in tokenizer().tokenize(text))
+        CACHE.put(text, parts)
+    return parts
+
+
+def analyze_many(texts):
+    """文字列のイテラブルtextsを順に形態素解析し、(text, 解析結果)を一つずつ返すジェネレータ。
+    Tokenizerとキャッシュを一度だけ引き、同じ文字列はキャッシュから返す。"""
+    tokenize = tokenizer().tokenize
+    cache = CACHE
+    for text in texts:
+        parts = cache.get(text)
+        if parts is None:
+            parts = tuple((t.surface, t.part_of_speech) for t in tokenize(text))
+            cache.put(text, parts)
+        yield text, parts
+
+
+def set_cache_size(maxsize):
+    """analyzeのキャッシュの上限をmaxsize件にする。0であればキャッシュしない。"""
+    CACHE.resize(maxsize)
+
+
+def cache_info():
+    """analyzeのキャッシュのヒット数・ミス数・追い出し数などをCacheInfoとして返す。"""
+    return CACHE.info()
+
+
+class KeywordClassifier:
+    """品詞がキーワードであるかどうかを判定する。
+
+    キーワードとする品詞の分類を'名詞,一般'(品詞,品詞細分類1)または'名詞'(品詞)の形で持ち、
+    一度判定した品詞の文字列は結果を表に記録しておくため、二回目以降は辞書を引くだけで済む。
+
+    メソッド:
+    configure(classes) -- キーワードとする品詞の分類を変更する
+    """
+
+    def __init__(self, classes):
+        self.configure(classes)
+
+    def configure(self, classes):
+        """キーワードとする品詞の分類のイテラブルclassesを設定し、判定結果の表を作り直す。"""
+        self._classes = frozenset(classes)
+        self._table = {}
+
+    @property
+    def classes(self):
+        """キーワードとする品詞の分類"""
+        return self._classes
+
+    def __call__(self, part):
+        result = self._table.get(part)
+        if result is None:
+            result = self._table[part] = self._classify(part)
+        return result
+
+    def _classify(self, part):
+        fields = part.split(',', 2)
+        return fields[0] in self._classes or ','.join(fields[:2]) in self._classes
+
+
+KEYWORD_CLASSES = ('名詞,一般', '名詞,代名詞', '名詞,固有名詞', '名詞,サ変接続', '名詞,形容動詞語幹')
+
+CLASSIFIER = KeywordClassifier(KEYWORD_CLASSES)
 
 
 def is_keyword(part):
     """品詞partが学習すべきキーワードであるかどうかを真偽値で返す。"""
-    return bool(re.match(r'名詞,(一般|代名詞|固有名詞|サ変接続|形容動詞語幹)', part))
+    return CLASSIFIER(part)
+
+
+def set_keyword_classes(classes):
+    """is_keywordがキーワードとする品詞の分類を、'名詞,一般'や'名詞'の形のclassesに変更する。"""
+    CLASSIFIER.configure(classes)
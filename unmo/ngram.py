@@ -0,0 +1,361 @@
+"""文脈の長さ(次数)を選べるマルコフ連鎖。
+
+Markovは直前の2単語だけを文脈とするが、NgramMarkovは直前の0〜4単語を文脈とし、
+長い文脈ほど文章のつながりが自然になる代わりに、辞書が大きくなる。
+
+学習した単語列は、長さ1からorderまでのすべてのn-gramを一つのトライ木に出現数とともに記録する。
+n-gram(w1, w2, w3)の節点はn-gram(w1, w2)の節点の子であり、
+(w1, w2)に続く単語とその出現数は、そのまま(w1, w2)の節点の子として得られる。
+そのため低い次数のn-gramは高い次数のn-gramと節点を共有し、次数ごとに別の辞書を持つ必要はない。
+
+文章を生成するときは、記録されている最も長い文脈から次の単語を選び(バックオフ)、
+generateのorderで次数を下げれば、同じ辞書から短い文脈だけを使った文章も生成できる。
+"""
+import os
+import bisect
+import random
+from array import array
+from . import markovfile
+from .markov import ChainTable, Markov
+from .markovfile import TokenTable, TokenIndex, ChildIndex
+
+
+class NgramMarkov:
+    """次数order(1〜5)のマルコフ連鎖による文章の学習・生成を行う。
+
+    orderはn-gramの長さであり、文脈の単語数はorder - 1である。
+    order=3はMarkovと同じく直前の2単語を文脈とするが、
+    その文脈が記録されていなければ直前の1単語、0単語の文脈へと順に短くして選択する。
+
+    メソッド:
+    add_sentence(parts) -- 形態素解析結果partsを学習する
+    generate(keyword, rng, order) -- keywordから始まる文章を生成する
+    merge(other) -- 別のNgramMarkovの学習内容を取り込む
+    prune(min_count) -- 出現数の少ないn-gramを取り除く
+    sizes() -- 辞書の大きさを返す
+    save(filename), load(filename) -- 辞書を保存する、読み込む
+    is_ngram_file(filename) -- ファイルがNgramMarkovの辞書であるかどうかを返す
+
+    プロパティ:
+    order -- 辞書の次数
+    """
+
+    MIN_ORDER = 1
+    MAX_ORDER = 5
+    ARRAYS = ('parents', 'labels', 'counts', 'totals', 'firsts', 'nexts')
+    WIDE_TOTAL = 256
+
+    def __init__(self, order=3, weighted_starts=False):
+        """次数orderの空の辞書を作成する。
+        weighted_starts -- Trueであれば、文章を始める単語を学習した回数で重み付けして選択する
+
+        self._tokens, self._ids -- Markovと同じ、単語とIDの対応表
+        節点ごとの配列。節点0は長さ0のn-gram(根)である
+            self._parents -- 親の節点
+            self._labels -- n-gramの最後の単語
+            self._counts -- n-gramの出現数
+            self._totals -- 子の出現数の合計
+            self._firsts, self._nexts -- 最初の子の節点と、次の兄弟の節点
+        self._children -- (親の節点, 単語)から子の節点への対応表。
+                          mmapしたファイルを参照する間は、ファイルのセクションを二分探索するChildIndex
+        self._wide -- 出現数がWIDE_TOTAL以上の節点の、子の単語と出現数の累積和。生成時に作成する
+        self._starts, self._start_words, self._start_cumulative -- Markovと同じ、文章が始まる単語
+        """
+        if not NgramMarkov.MIN_ORDER <= order <= NgramMarkov.MAX_ORDER:
+            raise ValueError('次数は{}から{}まででなければなりません: {}'.format(
+                NgramMarkov.MIN_ORDER, NgramMarkov.MAX_ORDER, order))
+        self.weighted_starts = weighted_starts
+        self._order = order
+        self._tokens = []
+        self._ids = {}
+        for name in NgramMarkov.ARRAYS:
+            setattr(self, '_' + name, array(ChainTable.TYPECODE, [0]))
+        self._children = {}
+        self._wide = {}
+        self._starts = {}
+        self._start_words = array(ChainTable.TYPECODE)
+        self._start_cumulative = None
+        self._end = self._intern(Markov.ENDMARK)
+        self._mapped = None
+
+    @property
+    def order(self):
+        """辞書の次数"""
+        return self._order
+
+    def add_sentence(self, parts):
+        """形態素解析結果partsを分解し、学習を行う。
+        文章の各位置から始まる、長さorderまでのすべてのn-gramに出現数を加える。"""
+        if not parts:
+            return
+        self._thaw()
+        words = [self._intern(word) for word, _ in parts]
+        self._add_start(words[0])
+        words.append(self._end)
+        for i in range(len(words)):
+            self._add_path(words[i:i + self._order])
+
+    def generate(self, keyword, rng=random, order=None):
+        """keywordを先頭の単語とし、そこから始まる文章を生成して返す。
+        keywordに続く単語が記録されていなければ、文章が始まる単語からランダムに選択する。
+        orderを指定すると、辞書の次数よりも短い文脈だけを使って生成する。"""
+        if not self._start_words:
+            return None
+        context = min(order or self._order, self._order) - 1
+
+        first = self._ids.get(keyword)
+        node = self._child(0, first) if first is not None else None
+        if node is None or not self._totals[node]:
+            first = self._choose_start(rng)
+
+        words = [first]
+        for _ in range(Markov.CHAIN_MAX + 1):
+            suffix = self._choose(words[-context:] if context else [], rng)
+            if suffix is None or suffix == self._end:
+                break
+            words.append(suffix)
+
+        return ''.join(self._tokens[word] for word in words)
+
+    def merge(self, other):
+        """別のNgramMarkov otherが学習したn-gramと文章の開始点を、出現数ごと取り込む。
+        otherの次数が高い場合、この辞書の次数を超えるn-gramは取り込まない。
+        otherがNgramMarkovでなければTypeErrorを送出する。"""
+        if not isinstance(other, NgramMarkov):
+            raise TypeError('NgramMarkovに取り込めるのはNgramMarkovだけです: {}'.format(
+                type(other).__name__))
+        self._thaw()
+        words = [self._intern(word) for word in other._tokens]
+        for path, count in other._ngrams():
+            if len(path) <= self._order:
+                self._add_count([words[word] for word in path], count)
+        for word in other._start_words:
+            self._add_start(words[word], other._starts[word])
+
+    def prune(self, min_count):
+        """出現数がmin_count未満のn-gramを取り除き、辞書を作り直す。取り除いたn-gramの数を返す。
+        n-gramの出現数はその前半部分の出現数を超えないため、短いn-gramを取り除くときは
+        それを含む長いn-gramもすでに取り除かれている。"""
+        pruned = NgramMarkov(self._order, self.weighted_starts)
+        tokens = self._tokens
+        removed = 0
+        for path, count in self._ngrams():
+            if count < min_count:
+                removed += 1
+                continue
+            pruned._add_count([pruned._intern(tokens[word]) for word in path], count)
+        for word in self._start_words:
+            word_id = pruned._ids.get(tokens[word])
+            node = pruned._child(0, word_id) if word_id is not None else None
+            if node is not None and pruned._totals[node]:
+                pruned._add_start(word_id, self._starts[word])
+        self._replace(pruned)
+        return removed
+
+    def _replace(self, other):
+        """表をすべて、作り直した同じ次数のNgramMarkov otherのものに置き換える。"""
+        self._tokens = other._tokens
+        self._ids = other._ids
+        for name in NgramMarkov.ARRAYS:
+            setattr(self, '_' + name, getattr(other, '_' + name))
+        self._children = other._children
+        self._wide = other._wide
+        self._starts = other._starts
+        self._start_words = other._start_words
+        self._start_cumulative = other._start_cumulative
+        self._end = other._end
+        self._mapped = other._mapped
+
+    def sizes(self):
+        """単語の数(words)、続く単語が記録されている文脈の数(states)、
+        文脈と続く単語の組(n-gram)の数(transitions)、文章が始まる単語の数(starts)を辞書で返す。"""
+        return {
+            'words': len(self._tokens) - 1,
+            'states': sum(1 for total in self._totals if total),
+            'transitions': len(self._parents) - 1,
+            'starts': len(self._start_words),
+        }
+
+    def save(self, filename, journal=None):
+        """ファイルfilenameへ辞書データをバイナリ形式で書き込む。
+        mmapしたファイルから何も学習していなければ、同じファイルへは書き込まない。
+        journalを指定すると、辞書が取り込んだジャーナルの最後の記録の番号としてjournalセクションに書き込む。"""
+        if self._mapped == os.path.abspath(filename):
+            return
+        sections = TokenTable.sections(self._tokens)
+        sections['order'] = array(ChainTable.TYPECODE, [self._order])
+        for name in NgramMarkov.ARRAYS:
+            sections[name] = getattr(self, '_' + name)
+        sections.update(ChildIndex.sections(self._parents, self._labels))
+        sections['startwds'] = self._start_words
+        sections['startcnt'] = array(ChainTable.TYPECODE,
+                                     (self._starts[word] for word in self._start_words))
+        if journal is not None:
+            sections['journal'] = array('Q', [journal])
+        markovfile.write(filename, sections)
+
+    def load(self, filename):
+        """ファイルfilenameをmmapして辞書データを参照する。次数はファイルに記録されたものになる。
+        子の節点はファイルのchildoffs/childlbls/childordセクションを二分探索して引く。
+        それらのセクションの無い古いファイルであれば、対応表を読み込み時にメモリ上へ作成する。"""
+        sections = markovfile.read(filename)
+        if 'order' not in sections:
+            raise ValueError('NgramMarkovの辞書ではありません: {}'.format(filename))
+        self._order = sections['order'][0]
+        self._tokens = TokenTable(sections['tokoffs'], sections['tokblob'])
+        self._ids = TokenIndex(self._tokens, sections['tokorder'])
+        for name in NgramMarkov.ARRAYS:
+            setattr(self, '_' + name, sections[name])
+        if 'childord' in sections:
+            self._children = ChildIndex(sections['childoffs'], sections['childlbls'],
+                                        sections['childord'])
+        else:
+            self._children = self._index_children()
+        self._wide = {}
+        self._start_words = sections['startwds']
+        self._start_cumulative = None
+        self._starts = dict(zip(self._start_words, sections['startcnt']))
+        self._end = self._ids.get(Markov.ENDMARK)
+        self._mapped = os.path.abspath(filename)
+
+    @staticmethod
+    def is_ngram_file(filename):
+        """ファイルfilenameがNgramMarkovの辞書であるかどうかを真偽値で返す。"""
+        return markovfile.is_markov_file(filename) and 'order' in markovfile.read(filename)
+
+    def _choose(self, context, rng):
+        """文脈context(古い順の単語のリスト)に続く単語を、出現数で重み付けして選択する。
+        contextに続く単語が記録されていなければ、古い単語から順に除いた短い文脈で選択する。"""
+        for start in range(len(context) + 1):
+            node = self._node(context[start:])
+            if node is None or not self._totals[node]:
+                continue
+            total = self._totals[node]
+            rest = rng.randrange(total)
+            if total >= NgramMarkov.WIDE_TOTAL:
+                labels, cumulative = self._cumulative(node)
+                return labels[bisect.bisect_right(cumulative, rest)]
+            child = self._firsts[node]
+            while True:
+                rest -= self._counts[child]
+                if rest < 0:
+                    return self._labels[child]
+                child = self._nexts[child]
+        return None
+
+    def _cumulative(self, node):
+        """節点nodeの子の単語と、出現数の累積和の配列を返す。
+        出現数の多い文脈は続く単語も多く、子を順にたどると時間がかかるため、
+        作成した配列は文脈の出現数が変わるまで使い回す。"""
+        cached = self._wide.get(node)
+        if cached is not None and cached[0] == self._totals[node]:
+            return cached[1:]
+        labels = array(ChainTable.TYPECODE)
+        cumulative = array(ChainTable.KEYCODE)
+        total = 0
+        child = self._firsts[node]
+        while child:
+            total += self._counts[child]
+            labels.append(self._labels[child])
+            cumulative.append(total)
+            child = self._nexts[child]
+        self._wide[node] = (total, labels, cumulative)
+        return labels, cumulative
+
+    def _add_path(self, path):
+        """n-gram pathと、その前半部分のすべてのn-gramの出現数を1ずつ加える。"""
+        node = 0
+        for word in path:
+            child = self._child(node, word, create=True)
+            self._counts[child] += 1
+            self._totals[node] += 1
+            node = child
+
+    def _add_count(self, path, count):
+        """n-gram pathの出現数だけにcountを加える。前半部分のn-gramはすでに記録されていなければ作成する。"""
+        node = 0
+        for word in path:
+            node = self._child(node, word, create=True)
+        self._counts[node] += count
+        self._totals[self._parents[node]] += count
+
+    def _node(self, path):
+        """n-gram path(単語IDのリスト)の節点を返す。無ければNoneを返す。"""
+        node = 0
+        for word in path:
+            node = self._children.get(NgramMarkov._key(node, word))
+            if node is None:
+                return None
+        return node
+
+    def _child(self, node, word, create=False):
+        """節点nodeのn-gramの後ろに単語wordを加えたn-gramの節点を返す。
+        無ければ、createがTrueなら出現数0で作成し、そうでなければNoneを返す。"""
+        key = NgramMarkov._key(node, word)
+        child = self._children.get(key)
+        if child is None and create:
+            child = self._children[key] = len(self._parents)
+            self._parents.append(node)
+            self._labels.append(word)
+            self._counts.append(0)
+            self._totals.append(0)
+            self._firsts.append(0)
+            self._nexts.append(self._firsts[node])
+            self._firsts[node] = child
+        return child
+
+    def _ngrams(self):
+        """記録されているn-gramを(単語IDのリスト, 出現数)の形で、前半部分のn-gramを先にして列挙する。"""
+        paths = {0: []}
+        for node in range(1, len(self._parents)):
+            path = paths[node] = paths[self._parents[node]] + [self._labels[node]]
+            yield path, self._counts[node]
+
+    def _intern(self, word):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self._tokens)
+            self._tokens.append(word)
+        return word_id
+
+    def _add_start(self, word, count=1):
+        if word not in self._starts:
+            self._starts[word] = 0
+            self._start_words.append(word)
+        self._starts[word] += count
+        self._start_cumulative = None
+
+    def _choose_start(self, rng):
+        if not self.weighted_starts:
+            return rng.choice(self._start_words)
+        cumulative = self._start_cumulative
+        if cumulative is None:
+            cumulative = array(ChainTable.KEYCODE)
+            total = 0
+            for word in self._start_words:
+                total += self._starts[word]
+                cumulative.append(total)
+            self._start_cumulative = cumulative
+        return self._start_words[bisect.bisect_right(cumulative, rng.randrange(cumulative[-1]))]
+
+    def _thaw(self):
+        """mmapしたファイルを参照している場合、すべてをメモリ上の書き換え可能な形に複製する。"""
+        if self._mapped is None:
+            return
+        self._tokens = list(self._tokens)
+        self._ids = {word: i for i, word in enumerate(self._tokens)}
+        for name in NgramMarkov.ARRAYS:
+            setattr(self, '_' + name, markovfile.thaw(getattr(self, '_' + name)))
+        if not isinstance(self._children, dict):
+            self._children = self._index_children()
+        self._start_words = markovfile.thaw(self._start_words)
+        self._mapped = None
+
+    def _index_children(self):
+        """(親の節点, 単語)から子の節点への対応表をメモリ上に作成して返す。"""
+        return {NgramMarkov._key(parent, label): node for node, (parent, label)
+                in enumerate(zip(self._parents, self._labels)) if node}
+
+    @staticmethod
+    def _key(node, word):
+        return node << 32 | word
@@ -0,0 +1,153 @@
+"""よく使われるキーワードについて、マルコフ辞書の応答をあらかじめ生成しておく応答プール。
+
+MarkovResponderは応答のたびに最大CHAIN_MAX回の遷移をたどって文章を生成する。
+応答プールを使うと、よく使われるキーワードの応答を手の空いている間に生成して蓄えておき、
+応答時にはそれを取り出すだけで済む。
+
+- キーワードは応答で使われた順に登録し、上限を超えるとCapacityの追い出し方(既定ではlfu)で取り除く
+- 各キーワードには最大per_keyword個の応答を蓄える
+- 辞書がキーワードを含む文章を学習すると、そのキーワードの蓄えた応答を捨てる。
+  遷移の変化は文章のどの部分にも影響しうるため、これは近似である
+- 補充はfill()を直接呼ぶか、start()で起動したスレッドが、応答の途切れている間に行う
+
+蓄えた応答は専用の乱数生成器で生成するため、応答プールを使うとseedを指定しても応答は再現されない。
+"""
+import time
+import random
+import threading
+from collections import deque
+from .capacity import Capacity
+
+
+class ResponsePool:
+    """キーワードごとの、あらかじめ生成したマルコフ辞書の応答の蓄え。
+
+    メソッド:
+    take(keyword) -- keywordの応答を一つ取り出す。無ければNoneを返す
+    invalidate(keywords) -- keywordsの蓄えた応答を捨てる。省略するとすべて捨てる
+    fill(markov, limit) -- 足りない応答をmarkovで生成して補充する
+    start(dictionary, idle) -- 応答が途切れている間に補充するスレッドを起動する
+    stop() -- 補充するスレッドを止める
+
+    プロパティ:
+    hits, misses -- takeで応答を取り出せた回数と、取り出せなかった回数
+    """
+
+    def __init__(self, per_keyword=8, max_keywords=256, policy='lfu', seed=None):
+        """キーワードごとにper_keyword個、最大max_keywords個のキーワードの応答を蓄える応答プールを作成する。
+        キーワードが上限を超えたときはpolicy('lru', 'lfu', 'age')に従って取り除く。
+        seedは応答の生成に使う乱数の種である。"""
+        if per_keyword < 1:
+            raise ValueError('蓄える応答の数は1以上でなければなりません: {}'.format(per_keyword))
+        self._per_keyword = per_keyword
+        self._capacity = Capacity(max_keywords, policy)
+        self._ready = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._hits = 0
+        self._misses = 0
+        self._last_take = 0.0
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def hits(self):
+        """takeで応答を取り出せた回数"""
+        return self._hits
+
+    @property
+    def misses(self):
+        """takeで応答を取り出せなかった回数"""
+        return self._misses
+
+    def take(self, keyword):
+        """keywordの蓄えた応答を一つ取り出して返す。無ければNoneを返す。
+        初めてのkeywordは登録し、以後の補充の対象とする。"""
+        with self._lock:
+            self._last_take = time.monotonic()
+            ready = self._ready.get(keyword)
+            if ready is None:
+                self._ready[keyword] = deque()
+                self._versions[keyword] = 0
+                self._capacity.learned(keyword)
+                self._evict()
+            else:
+                self._capacity.used(keyword)
+            if ready:
+                self._hits += 1
+                return ready.popleft()
+            self._misses += 1
+            return None
+
+    def invalidate(self, keywords=None):
+        """イテラブルkeywordsに含まれるキーワードの、蓄えた応答を捨てる。
+        keywordsがNoneであれば、すべてのキーワードの応答を捨てる。"""
+        with self._lock:
+            for keyword in self._ready if keywords is None else keywords:
+                ready = self._ready.get(keyword)
+                if ready is not None:
+                    ready.clear()
+                    self._versions[keyword] += 1
+
+    def fill(self, markov, limit=None):
+        """登録されたキーワードの足りない応答をmarkovで生成し、生成した数を返す。
+        limitを指定すると、最大limit個生成したところでやめる。
+        markovを参照する間は、呼び出し側で辞書の読み込みロックを取得しておくこと。"""
+        with self._lock:
+            wanted = [(keyword, self._per_keyword - len(ready), self._versions[keyword])
+                      for keyword, ready in self._ready.items()
+                      if len(ready) < self._per_keyword]
+        generated = 0
+        for keyword, count, version in wanted:
+            for _ in range(count):
+                if limit is not None and generated >= limit:
+                    return generated
+                response = markov.generate(keyword, self._rng)
+                if response is None:
+                    return generated
+                with self._lock:
+                    # 生成している間に取り除かれたか、捨てられたキーワードには加えない
+                    if self._versions.get(keyword) != version:
+                        break
+                    self._ready[keyword].append(response)
+                generated += 1
+        return generated
+
+    def start(self, dictionary, idle=0.05, batch=16):
+        """辞書dictionaryの応答を補充するスレッドを起動する。
+        スレッドは最後のtakeからidle秒以上経っているときに、読み込みロックを取得して
+        batch個ずつ補充する。補充するものが無ければidleの10倍の間休む。"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._refill, args=(dictionary, idle, batch),
+                                        name='unmo-pool', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """補充するスレッドを止め、終わるまで待つ。"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _refill(self, dictionary, idle, batch):
+        wait = idle
+        while not self._stopped.wait(wait):
+            if time.monotonic() - self._last_take < idle:
+                wait = idle
+                continue
+            with dictionary.lock.read():
+                generated = self.fill(dictionary.markov, batch)
+            wait = 0 if generated else idle * 10
+
+    def _evict(self):
+        """キーワードが上限を超えていれば、Capacityが選んだキーワードを取り除く。"""
+        count = self._capacity.overflow(len(self._ready))
+        if count:
+            victims = self._capacity.victims(list(self._ready), count)
+            for keyword in victims:
+                del self._ready[keyword], self._versions[keyword]
+            self._capacity.forget(victims)
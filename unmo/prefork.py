@@ -0,0 +1,281 @@
+"""辞書を一度だけ読み込み、複数のワーカープロセスで共有して応答するpreforkサーバー。
+
+UnmoServerは一つのプロセスで応答するため、GILにより使えるCPUは一つである。
+PreforkServerは親プロセスで辞書と形態素解析器を読み込んでから、ワーカープロセスをforkする。
+ワーカーは親のメモリをコピーオンライトで共有し、同じ待ち受けソケットから接続を受け付けて応答する。
+
+- fork前にgc.freeze()を呼び、読み込んだオブジェクトをGCの対象から外す。
+  GCがオブジェクトのヘッダを書き換えて、共有しているページが複製されるのを防ぐ。
+  親も共有しているページを書き換えないよう、凍結したオブジェクトは親でも凍結したままにする。
+  凍結したゴミは回収されなくなるため、凍結する前にgc.collect()で回収しておく
+- マルコフ辞書はmmapしたファイルであり、ページキャッシュを通じて共有される
+- ワーカーは辞書に学習させず、学習内容をキューで親に送る。親は受け取った順に学習し、終了時に保存する
+- ワーカーでの計測(Stats)と、上限のある辞書で応答に使われた項目の記録も、学習内容とともに親に送る。
+  親の計測結果と追い出す項目の選択には、すべてのワーカーの応答が反映される
+- 親の学習スレッドは辞書のロックの外でも計測(Stats)と記録(Capacity)のロックを取得する。
+  その間にforkしても子プロセスでロックが解放されないまま残らないよう、両者のロックは子プロセスで作り直す
+- ワーカーの辞書はforkした時点のものである。refresh_everyを指定すると、
+  親がその件数だけ学習するたびにワーカーを一つずつforkし直し、新しい学習内容を反映する
+
+    python -m unmo --serve --workers 4 [--refresh-every 1000]
+
+os.forkを使うため、POSIXでのみ動作する。
+"""
+import gc
+import os
+import time
+import random
+import signal
+import traceback
+import socket
+import asyncio
+import threading
+import multiprocessing
+from .morph import analyze
+
+
+class PreforkServer:
+    """一つの辞書を複数のワーカープロセスで共有するチャットサーバー。
+
+    プロトコルはUnmoServerと同じで、UTF-8の発言を一行送るたびに応答を一行受け取る。
+
+    メソッド:
+    start() -- 辞書を読み込み、ワーカーをforkして接続の受け付けを始める
+    serve_forever() -- 終了したワーカーを作り直し、必要であれば学習内容を反映しながら待つ
+    close() -- ワーカーを止め、学習を終えてから辞書を保存する
+
+    プロパティ:
+    address -- 待ち受けている(ホスト, ポート)
+    workers -- ワーカーのプロセスIDのリスト
+    learned -- 親プロセスが学習した件数
+    """
+
+    def __init__(self, unmo, host='127.0.0.1', port=8765, workers=2, refresh_every=None, grace=5.0):
+        """Unmoインスタンスunmoを、host:portでworkers個のワーカーから公開するサーバーを作成する。
+        refresh_every -- 親がこの件数だけ学習するたびにワーカーをforkし直す。Noneであれば作り直さない
+        grace -- ワーカーを止めるときに、続いているセッションの終わりを待つ秒数
+        バックエンドを使う辞書は、データベースへの接続をforkしたプロセスで共有できないため使えない。"""
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('preforkサーバーはos.forkを使えるシステムでのみ動作します')
+        if workers < 1:
+            raise ValueError('ワーカーの数は1以上でなければなりません: {}'.format(workers))
+        if unmo.dictionary.backend is not None:
+            raise ValueError('バックエンドを使う辞書はpreforkサーバーで共有できません')
+        self._unmo = unmo
+        self._host = host
+        self._port = port
+        self._size = workers
+        self._refresh_every = refresh_every
+        self._grace = grace
+        self._queue = multiprocessing.get_context('fork').SimpleQueue()
+        self._learner = threading.Thread(target=self._learn, name='unmo-learner', daemon=True)
+        self._socket = None
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._learned = 0
+        self._refreshed = 0
+        self._used = []
+
+    @property
+    def address(self):
+        """待ち受けている(ホスト, ポート)"""
+        return self._socket.getsockname()[:2]
+
+    @property
+    def workers(self):
+        """ワーカーのプロセスIDのリスト"""
+        return list(self._workers)
+
+    @property
+    def learned(self):
+        """親プロセスが学習した件数"""
+        return self._learned
+
+    def start(self):
+        """辞書と形態素解析器を読み込み、待ち受けソケットを作成してワーカーをforkする。"""
+        dictionary = self._unmo.dictionary
+        with dictionary.lock.read():
+            # 遅延読み込みの辞書も、forkの前に読み込んで共有する
+            for name in ('random', 'pattern', 'template', 'markov'):
+                getattr(dictionary, name)
+        analyze('こんにちは')
+        self._socket = socket.create_server((self._host, self._port))
+        self._learner.start()
+        with self._workers_lock:
+            for _ in range(self._size):
+                self._workers.append(self._spawn())
+
+    def serve_forever(self, interval=0.1):
+        """close()が呼ばれるまで、interval秒ごとに終了したワーカーを作り直し、
+        refresh_everyだけ学習が進んでいればワーカーをforkし直す。"""
+        if self._socket is None:
+            self.start()
+        while not self._closing.wait(interval):
+            with self._workers_lock:
+                if self._closing.is_set():
+                    break
+                self._reap()
+                if self._refresh_every and self._learned - self._refreshed >= self._refresh_every:
+                    self._refreshed = self._learned
+                    self._refresh()
+
+    def close(self):
+        """ワーカーを止め、ワーカーから届いた学習をすべて終えてから辞書を保存する。"""
+        self._closing.set()
+        with self._workers_lock:
+            for pid in self._workers:
+                self._stop(pid, wait=False)
+            for pid in self._workers:
+                self._wait(pid)
+            self._workers = []
+        if self._learner.is_alive():
+            self._queue.put(None)
+            self._learner.join()
+        if self._socket is not None:
+            self._socket.close()
+        self._unmo.save()
+
+    def _spawn(self):
+        """ワーカーをforkし、親プロセスではそのプロセスIDを返す。
+        学習の途中の辞書を共有しないよう、読み込みロックを取得してforkする。
+        前回のforkから学習で生じた循環参照のゴミを凍結しないよう、回収してから凍結する。"""
+        with self._unmo.dictionary.lock.read():
+            gc.collect()
+            gc.freeze()
+            pid = os.fork()
+        if pid:
+            return pid
+        try:
+            self._work()
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+
+    def _refresh(self):
+        """ワーカーを一つずつforkし直す。新しいワーカーが受け付けを始めてから古いワーカーを止めるため、
+        受け付けが途切れることはない。"""
+        for index, pid in enumerate(self._workers):
+            self._workers[index] = self._spawn()
+            self._stop(pid)
+
+    def _reap(self):
+        """終了したワーカーを作り直す。"""
+        for index, pid in enumerate(self._workers):
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done:
+                self._workers[index] = self._spawn()
+
+    def _stop(self, pid, wait=True):
+        """ワーカーpidにSIGTERMを送る。waitがTrueであれば終了を待つ。"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        if wait:
+            self._wait(pid)
+
+    def _wait(self, pid):
+        """ワーカーpidの終了を待つ。graceの2倍の時間が経っても終わらなければSIGKILLで止める。"""
+        deadline = time.monotonic() + self._grace * 2
+        while True:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return
+            time.sleep(0.01)
+
+    def _learn(self):
+        """ワーカーから届いた計測と使われた項目の記録を親の辞書に加え、学習内容を順にstudyする。
+        Noneを受け取ると終了する。"""
+        dictionary = self._unmo.dictionary
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            text, parts, stats, used = item
+            if stats is not None and self._unmo.stats is not None:
+                self._unmo.stats.merge(stats)
+            for name, key in used:
+                dictionary.used(name, key)
+            self._unmo.study(text, parts)
+            self._learned += 1
+
+    def _work(self):
+        """ワーカープロセスの本体。SIGTERMを受け取るまで接続を受け付ける。"""
+        # 親と同じ乱数の状態から始まらないよう、ワーカーごとに乱数を初期化し直す
+        # Ctrl-Cは親が受け取ってワーカーを止めるため、ワーカーでは無視する
+        random.seed()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # 計測はforkまでの分が親に残っているため、ワーカーでは空から始め、応答ごとに親へ送る
+        if self._unmo.stats is not None:
+            self._unmo.stats.reset()
+        self._used = []
+        self._unmo.dictionary.record_usage(self._used)
+        pool = self._unmo.dictionary.pool
+        if pool is not None:
+            pool.start(self._unmo.dictionary)
+        asyncio.run(self._accept())
+
+    async def _accept(self):
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        sessions = set()
+
+        async def session(reader, writer):
+            task = asyncio.current_task()
+            sessions.add(task)
+            try:
+                await self._session(reader, writer)
+            finally:
+                sessions.discard(task)
+
+        server = await asyncio.start_server(session, sock=self._socket)
+        await stopped.wait()
+        server.close()
+        if sessions:
+            await asyncio.wait(sessions, timeout=self._grace)
+
+    async def _session(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                text = line.decode('utf-8').strip()
+                if not text:
+                    break
+                response = self._respond(text)
+                writer.write(response.replace('\n', ' ').encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, text):
+        """textに対する応答を作成し、学習内容と、応答の計測・使われた項目の記録を親に送る。"""
+        parts = self._unmo.analyze(text)
+        response = self._unmo.respond(text, parts)
+        stats = self._unmo.stats
+        used = list(self._used)
+        del self._used[:]
+        self._queue.put((text, parts, stats.drain() if stats is not None else None, used))
+        return response
+
+
+def serve(unmo, host='127.0.0.1', port=8765, workers=2, refresh_every=None):
+    """Unmoインスタンスunmoをhost:portでworkers個のワーカーから公開し、中断されるまで接続を受け付ける。"""
+    server = PreforkServer(unmo, host, port, workers, refresh_every)
+    server.start()
+    print('Unmo server listening on {}:{} ({} workers)'.format(*server.address, workers))
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
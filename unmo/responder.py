@@ -1,6 +1,5 @@
 import abc
-import re
-from random import choice
+import random
 from .morph import is_keyword
 
 
@@ -8,17 +7,20 @@ class Responder(metaclass=abc.ABCMeta):
     """AIの応答を制御する思考エンジンの基底クラス。
 
     メソッド:
-    response(str) -- ユーザーの入力strを受け取り、思考結果を返す
+    response(text, parts, rng) -- ユーザーの入力textと形態素partsを受け取り、思考結果を返す。
+                                  選択には乱数生成器rng(省略時はrandomモジュール)を使う
 
     プロパティ:
     name -- Responderオブジェクトの名前
     """
 
-    def __init__(self, name, dictionary):
+    def __init__(self, name, dictionary, stats=None):
         """文字列nameを受け取り、自身のnameに設定する。
-        辞書dictionaryを受け取り、自身のdictionaryに保持する。"""
+        辞書dictionaryを受け取り、自身のdictionaryに保持する。
+        statsを受け取った場合、ランダム辞書に頼った回数を'fallback.{name}'として記録する。"""
         self._name = name
         self._dictionary = dictionary
+        self._stats = stats
 
     @abc.abstractmethod
     def response(self, *args):
@@ -30,12 +32,24 @@ class Responder(metaclass=abc.ABCMeta):
         """思考エンジンの名前"""
         return self._name
 
+    def _fallback(self, rng):
+        """自身の辞書から応答できなかったときに、ランダム辞書から応答を選んで返す。"""
+        if self._stats is not None:
+            self._stats.count('fallback.' + self._name)
+        return self._choose_random(rng)
+
+    def _choose_random(self, rng):
+        """ランダム辞書から発言を選び、応答に使ったことを辞書に記録して返す。"""
+        text = rng.choice(self._dictionary.random)
+        self._dictionary.used('random', text)
+        return text
+
 
 class WhatResponder(Responder):
     """AIの応答を制御する思考エンジンクラス。
     入力に対して疑問形で聞き返す。"""
 
-    def response(self, text, _):
+    def response(self, text, _, rng=random):
         """文字列textを受け取り、'{text}ってなに？'という形式で返す。"""
         return '{}ってなに？'.format(text)
 
@@ -45,9 +59,9 @@ class RandomResponder(Responder):
     登録された文字列からランダムなものを返す。
     """
 
-    def response(self, *args):
+    def response(self, text, parts, rng=random):
         """ユーザーからの入力は受け取るが、使用せずにランダムな応答を返す。"""
-        return choice(self._dictionary.random)
+        return self._choose_random(rng)
 
 
 class PatternResponder(Responder):
@@ -55,34 +69,48 @@ class PatternResponder(Responder):
     登録されたパターンに反応し、関連する応答を返す。
     """
 
-    def response(self, text, _):
+    def response(self, text, _, rng=random):
         """ユーザーの入力に合致するパターンがあれば、関連するフレーズを返す。"""
-        for ptn in self._dictionary.pattern:
-            matcher = re.search(ptn['pattern'], text)
-            if matcher:
-                chosen_response = choice(ptn['phrases'])
-                return chosen_response.replace('%match%', matcher[0])
-        return choice(self._dictionary.random)
+        matched = self._dictionary.match_pattern(text)
+        if matched:
+            ptn, match = matched
+            self._dictionary.used('pattern', ptn['pattern'])
+            chosen_response = rng.choice(ptn['phrases'])
+            return chosen_response.replace('%match%', match)
+        return self._fallback(rng)
 
 
 class TemplateResponder(Responder):
-    def response(self, _, parts):
+    def response(self, _, parts, rng=random):
         """形態素解析結果partsに基づいてテンプレートを選択・生成して返す。"""
         keywords = [word for word, part in parts if is_keyword(part)]
-        count = len(keywords)
-        if count > 0:
-            if count in self._dictionary.template:
-                template = choice(self._dictionary.template[count])
-                for keyword in keywords:
-                    template = template.replace('%noun%', keyword, 1)
-                return template
-        return choice(self._dictionary.random)
+        if keywords:
+            templates = self._dictionary.template
+            template = templates.choose(len(keywords), rng)
+            if template is not None:
+                self._dictionary.used('template', template)
+                return templates.fill(template, keywords)
+        return self._fallback(rng)
 
 
 class MarkovResponder(Responder):
-    def response(self, _, parts):
+    def response(self, _, parts, rng=random):
         """形態素のリストpartsからキーワードを選択し、それに基づく文章を生成して返す。
+        辞書に応答プールがあり、キーワードの応答が蓄えられていればそれを返す。
         キーワードに該当するものがなかった場合はランダム辞書から返す。"""
         keyword = next((w for w, p in parts if is_keyword(p)), '')
-        response = self._dictionary.markov.generate(keyword)
-        return response if response else choice(self._dictionary.random)
+        response = self._take_pooled(keyword)
+        if response is None:
+            response = self._dictionary.markov.generate(keyword, rng)
+        return response if response else self._fallback(rng)
+
+    def _take_pooled(self, keyword):
+        """応答プールからkeywordの応答を取り出す。
+        statsがあれば、取り出せたかどうかを'pool.hit'または'pool.miss'として記録する。"""
+        pool = self._dictionary.pool
+        if pool is None:
+            return None
+        response = pool.take(keyword)
+        if self._stats is not None:
+            self._stats.count('pool.hit' if response is not None else 'pool.miss')
+        return response
@@ -0,0 +1,115 @@
+"""複数のセッションから一つのUnmoと対話するためのチャットサーバー。
+
+クライアントはTCPで接続し、UTF-8の発言を一行送るたびに応答を一行受け取る。
+空行を送るか接続を閉じるとセッションが終わる。
+
+    python -m unmo --serve [--host 127.0.0.1] [--port 8765]
+
+応答はスレッドプールで辞書の読み込みロックを取得して作成し、
+学習は専用のスレッドが受け付けた順に書き込みロックを取得して行う。
+学習を待たずに応答を返すため、応答が待たされるのは実行中の学習一件が終わるまでである。
+辞書に応答プールがあれば、応答の途切れている間にプールを補充する。
+"""
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UnmoServer:
+    """一つのUnmoを複数のセッションで共有するチャットサーバー。
+
+    メソッド:
+    start() -- 接続の受け付けを始める
+    serve_forever() -- 接続を受け付け続ける
+    close() -- 接続の受け付けを止め、学習を終えてから辞書を保存する
+
+    プロパティ:
+    address -- 待ち受けている(ホスト, ポート)
+    """
+
+    def __init__(self, unmo, host='127.0.0.1', port=8765, workers=None):
+        """Unmoインスタンスunmoを、host:portで公開するサーバーを作成する。
+        workersは応答を作成するスレッドの数で、Noneであればexecutorの既定値を使う。"""
+        self._unmo = unmo
+        self._host = host
+        self._port = port
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._queue = queue.Queue()
+        self._learner = threading.Thread(target=self._learn, name='unmo-learner', daemon=True)
+        self._server = None
+
+    async def start(self):
+        """学習スレッドと、辞書に応答プールがあれば補充スレッドを起動し、接続の受け付けを始める。"""
+        self._learner.start()
+        pool = self._unmo.dictionary.pool
+        if pool is not None:
+            pool.start(self._unmo.dictionary)
+        self._server = await asyncio.start_server(self._session, self._host, self._port)
+
+    async def serve_forever(self):
+        """接続を受け付け続ける。"""
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def close(self):
+        """接続の受け付けを止め、キューに積まれた学習を終えてから辞書を保存する。"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown()
+        pool = self._unmo.dictionary.pool
+        if pool is not None:
+            pool.stop()
+        if self._learner.is_alive():
+            self._queue.put(None)
+            await asyncio.get_running_loop().run_in_executor(None, self._learner.join)
+        self._unmo.save()
+
+    @property
+    def address(self):
+        """待ち受けている(ホスト, ポート)"""
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def _session(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                text = line.decode('utf-8').strip()
+                if not text:
+                    break
+                response = await loop.run_in_executor(self._executor, self._respond, text)
+                writer.write(response.replace('\n', ' ').encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, text):
+        """textに対する応答を作成し、学習をキューに積む。"""
+        parts = self._unmo.analyze(text)
+        response = self._unmo.respond(text, parts)
+        self._queue.put((text, parts))
+        return response
+
+    def _learn(self):
+        """キューから学習内容を取り出し、順にstudyする。Noneを受け取ると終了する。"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._unmo.study(*item)
+
+
+async def serve(unmo, host='127.0.0.1', port=8765):
+    """Unmoインスタンスunmoをhost:portで公開し、中断されるまで接続を受け付ける。"""
+    server = UnmoServer(unmo, host, port)
+    await server.start()
+    print('Unmo server listening on {}:{}'.format(*server.address))
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
@@ -0,0 +1,601 @@
+"""SQLiteのデータベース上に辞書を置く、SQLiteBackend用の辞書クラス。
+
+各クラスはメモリ上の辞書(IndexedSet, PatternStore, TemplateStore, Markov)と同じように振る舞うが、
+項目はデータベースに置いたまま、必要になった行だけを読み出す。
+データベースへの読み書きは、すべてSQLiteBackendを通して行う。
+"""
+import random
+import re
+from collections.abc import Sequence, Mapping
+from .store import IndexedSet, TemplateStore
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS random (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS phrase (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS pattern (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL UNIQUE,
+    regex INTEGER NOT NULL,
+    phrases INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pattern_phrase (
+    pattern_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    phrase_id INTEGER NOT NULL,
+    PRIMARY KEY (pattern_id, position),
+    UNIQUE (pattern_id, phrase_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS template (
+    id INTEGER PRIMARY KEY,
+    template TEXT NOT NULL UNIQUE,
+    nouns INTEGER NOT NULL,
+    frequency INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS template_nouns ON template (nouns, id);
+CREATE TABLE IF NOT EXISTS template_event (
+    nouns INTEGER NOT NULL,
+    cumulative INTEGER NOT NULL,
+    template_id INTEGER NOT NULL,
+    PRIMARY KEY (nouns, cumulative)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS token (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS chain (
+    prefix1 INTEGER NOT NULL,
+    prefix2 INTEGER NOT NULL,
+    suffix INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (prefix1, prefix2, suffix)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS start (
+    id INTEGER PRIMARY KEY,
+    token_id INTEGER NOT NULL UNIQUE,
+    count INTEGER NOT NULL
+);
+'''
+
+PAGE = 1000
+MAX_VARIABLES = 900
+
+
+def _renumber(db, table, columns):
+    """表tableのidを、登録順を保ったまま1から振り直す。
+    SQLRandomStoreとSQLMarkovは、idが連続していることを前提に番号で行を選ぶ。"""
+    names = ', '.join(columns)
+    db.execute('CREATE TEMP TABLE renumber AS SELECT {} FROM {} ORDER BY id'.format(names, table))
+    db.execute('DELETE FROM {}'.format(table))
+    db.execute('INSERT INTO {0} ({1}) SELECT {1} FROM renumber'.format(table, names))
+    db.execute('DROP TABLE renumber')
+
+
+class SQLRandomStore(Sequence):
+    """random表を参照するランダム辞書。idは1から連続しているため、位置で直接行を引ける。"""
+
+    def __init__(self, db):
+        self._db = db
+        self._size = db.query_one('SELECT COUNT(*) FROM random')[0]
+
+    def add(self, text):
+        """textを末尾に追加し、追加したかどうかを真偽値で返す。"""
+        added = _db_insert(self._db, 'INSERT OR IGNORE INTO random (id, text) VALUES (?, ?)',
+                           (self._size + 1, text))
+        self._size += added
+        return added
+
+    def remove_all(self, texts):
+        """イテラブルtextsに含まれる発言を取り除き、残りの登録順を保つ。"""
+        removed = _delete_in(self._db, 'random', 'text', texts)
+        if removed:
+            _renumber(self._db, 'random', ['text'])
+            self._size -= removed
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._size
+        row = self._db.query_one('SELECT text FROM random WHERE id = ?', (index + 1,))
+        if row is None:
+            raise IndexError(index)
+        return row[0]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (row[1] for row in _pages(self._db, 'SELECT id, text FROM random', 'id'))
+
+    def __contains__(self, text):
+        return self._db.query_one('SELECT 1 FROM random WHERE text = ?', (text,)) is not None
+
+
+class SQLPhrases(Sequence):
+    """パターンのフレーズを、位置で一つずつ引くシーケンス。"""
+
+    def __init__(self, db, pattern_id, size):
+        self._db = db
+        self._pattern_id = pattern_id
+        self._size = size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._size
+        row = self._db.query_one(
+            'SELECT phrase.text FROM pattern_phrase JOIN phrase ON phrase.id = phrase_id'
+            ' WHERE pattern_id = ? AND position = ?', (self._pattern_id, index))
+        if row is None:
+            raise IndexError(index)
+        return row[0]
+
+    def __len__(self):
+        return self._size
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+
+class SQLPatternStore(Sequence):
+    """pattern表を参照するパターン辞書。
+
+    フレーズはphrase表に一度だけ格納し、pattern_phrase表でパターンと結び付けるため、
+    同じ発言が複数の単語のパターンに含まれていても重複して保存しない。
+    検索では入力の部分文字列をまとめて単語の索引で引くため、トライ木をメモリに持たない。
+    正規表現のパターンだけは、メモリ上でコンパイルして照合する。
+    学習した単語は記号を含んでいても文字列として登録し、正規表現にはしない。
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._size = db.query_one('SELECT COUNT(*) FROM pattern')[0]
+        row = db.query_one('SELECT MAX(LENGTH(word)) FROM pattern WHERE regex = 0')
+        self._longest = row[0] or 0
+        self._regexes = []
+        literals = []
+        for pattern_id, word in db.query('SELECT id, word FROM pattern WHERE regex = 1 ORDER BY id'):
+            try:
+                self._regexes.append((pattern_id, re.compile(word), word))
+            except re.error:
+                literals.append((pattern_id, word))
+        if literals:
+            # 学習した記号の単語を正規表現として登録していた頃のデータベース
+            db.executemany('UPDATE pattern SET regex = 0 WHERE id = ?',
+                           [(pattern_id,) for pattern_id, _ in literals])
+            db.commit()
+            self._longest = max([self._longest] + [len(word) for _, word in literals])
+
+    def add(self, word, text, regex=False):
+        """単語wordのパターンに発言textを追加する。
+        パターンが無ければ新しく作成し、同じ発言があれば何もしない。
+        regexが真であれば、新しく作成するパターンは正規表現として照合する。"""
+        row = self._db.query_one('SELECT id, phrases FROM pattern WHERE word = ?', (word,))
+        if row is None:
+            pattern_id = self._db.execute('INSERT INTO pattern (word, regex) VALUES (?, ?)',
+                                          (word, regex)).lastrowid
+            phrases = 0
+            self._size += 1
+            if regex:
+                self._regexes.append((pattern_id, re.compile(word), word))
+            else:
+                self._longest = max(self._longest, len(word))
+        else:
+            pattern_id, phrases = row
+
+        self._db.execute('INSERT OR IGNORE INTO phrase (text) VALUES (?)', (text,))
+        phrase_id = self._db.query_one('SELECT id FROM phrase WHERE text = ?', (text,))[0]
+        if _db_insert(self._db, 'INSERT OR IGNORE INTO pattern_phrase VALUES (?, ?, ?)',
+                      (pattern_id, phrases, phrase_id)):
+            self._db.execute('UPDATE pattern SET phrases = phrases + 1 WHERE id = ?', (pattern_id,))
+
+    def get(self, word, default=None):
+        """単語wordのパターンハッシュを返す。無ければdefaultを返す。"""
+        row = self._db.query_one('SELECT id, word, phrases, regex FROM pattern WHERE word = ?', (word,))
+        return self._pattern(row) if row else default
+
+    def search(self, text):
+        """textに一致するパターンのうち、最も先に登録されたものを探す。
+        (パターンハッシュ, 一致した文字列)のタプルを、無ければNoneを返す。"""
+        candidates = {text[start:end] for start in range(len(text))
+                      for end in range(start + 1, min(len(text), start + self._longest) + 1)}
+        best = None
+        candidates = list(candidates)
+        for i in range(0, len(candidates), MAX_VARIABLES):
+            chunk = candidates[i:i + MAX_VARIABLES]
+            row = self._db.query_one(
+                'SELECT id, word, phrases, regex FROM pattern WHERE regex = 0 AND word IN ({})'
+                ' ORDER BY id LIMIT 1'.format(', '.join('?' * len(chunk))), chunk)
+            if row and (best is None or row[0] < best[0]):
+                best = row
+        matched = best[1] if best else None
+
+        for pattern_id, regex, word in self._regexes:
+            if best is not None and best[0] < pattern_id:
+                break
+            matcher = regex.search(text)
+            if matcher:
+                best = self._db.query_one('SELECT id, word, phrases, regex FROM pattern WHERE id = ?',
+                                          (pattern_id,))
+                matched = matcher[0]
+                break
+
+        return (self._pattern(best), matched) if best else None
+
+    def remove_all(self, words):
+        """イテラブルwordsに含まれる単語のパターンを取り除く。
+        どのパターンにも含まれなくなったフレーズも取り除く。"""
+        words = list(words)
+        removed = 0
+        for i in range(0, len(words), MAX_VARIABLES):
+            chunk = words[i:i + MAX_VARIABLES]
+            marks = ', '.join('?' * len(chunk))
+            self._db.execute('DELETE FROM pattern_phrase WHERE pattern_id IN'
+                             ' (SELECT id FROM pattern WHERE word IN ({}))'.format(marks), chunk)
+            removed += self._db.execute('DELETE FROM pattern WHERE word IN ({})'.format(marks),
+                                        chunk).rowcount
+        if removed:
+            self._db.execute('DELETE FROM phrase WHERE id NOT IN'
+                             ' (SELECT phrase_id FROM pattern_phrase)')
+            self._size -= removed
+            removed_words = set(words)
+            self._regexes = [entry for entry in self._regexes if entry[2] not in removed_words]
+
+    def _pattern(self, row):
+        pattern_id, word, phrases, regex = row
+        pattern = {'pattern': word, 'phrases': SQLPhrases(self._db, pattern_id, phrases)}
+        if regex:
+            pattern['regex'] = True
+        return pattern
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        row = self._db.query_one('SELECT id, word, phrases, regex FROM pattern ORDER BY id'
+                                 ' LIMIT 1 OFFSET ?', (index,))
+        if row is None:
+            raise IndexError(index)
+        return self._pattern(row)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (self._pattern(row) for row in
+                _pages(self._db, 'SELECT id, word, phrases, regex FROM pattern', 'id'))
+
+
+class SQLTemplateStore(Mapping):
+    """template表を参照するテンプレート辞書。名詞の数(nouns)の索引で候補を絞り込む。
+
+    template_event表には、名詞の数ごとに出現数の累積和(cumulative)とテンプレートを記録する。
+    最大の累積和がその名詞の数の出現数の合計になり、選択は主キーの索引で1行を引くだけで済む。
+    学習のたびに1行を追記し、行の数がテンプレートの数の2倍に達したら、テンプレートごとに1行へ詰め直す。
+    """
+
+    def __init__(self, db):
+        """self._sizes -- 名詞の数ごとの[テンプレートの数, template_event表の行の数]。
+                          詰め直す時期を決めるためだけに使い、初めて追記するときに数える"""
+        self._db = db
+        self._sizes = {}
+        if (db.query_one('SELECT 1 FROM template_event LIMIT 1') is None
+                and db.query_one('SELECT 1 FROM template LIMIT 1') is not None):
+            # template_event表が無かった頃に作られたデータベース
+            self._rebuild_events()
+            db.commit()
+
+    def _total_of(self, count):
+        """名詞がcount個のテンプレートの出現数の合計を返す。"""
+        return self._db.query_one('SELECT MAX(cumulative) FROM template_event WHERE nouns = ?',
+                                  (count,))[0] or 0
+
+    def _rebuild_events(self, count=None):
+        """template表から、名詞がcount個(省略時はすべて)のtemplate_event表の行を作り直す。
+        テンプレートごとに1行を登録順に並べる。"""
+        where, params = ('', ()) if count is None else (' WHERE nouns = ?', (count,))
+        self._db.execute('DELETE FROM template_event' + where, params)
+        self._db.execute('INSERT INTO template_event (nouns, cumulative, template_id) '
+                         'SELECT nouns, SUM(frequency) OVER (PARTITION BY nouns ORDER BY id), id '
+                         'FROM template' + where, params)
+        if count is None:
+            self._sizes.clear()
+        else:
+            self._sizes.pop(count, None)
+
+    def _size_of(self, count):
+        """名詞がcount個の[テンプレートの数, template_event表の行の数]を返す。"""
+        size = self._sizes.get(count)
+        if size is None:
+            size = self._sizes[count] = [
+                self._db.query_one('SELECT COUNT(*) FROM template WHERE nouns = ?', (count,))[0],
+                self._db.query_one('SELECT COUNT(*) FROM template_event WHERE nouns = ?', (count,))[0]]
+        return size
+
+    def add(self, template, frequency=1):
+        """テンプレートtemplateを出現数frequencyだけ追加し、新しいテンプレートであったかを真偽値で返す。
+        '%noun%'を含まないテンプレートは追加しない。"""
+        nouns = TemplateStore.compile(template)[1]
+        if not nouns:
+            return False
+        size = self._size_of(nouns)
+        row = self._db.query_one('SELECT id FROM template WHERE template = ?', (template,))
+        if row:
+            template_id = row[0]
+            self._db.execute('UPDATE template SET frequency = frequency + ? WHERE id = ?',
+                             (frequency, template_id))
+        else:
+            template_id = self._db.execute(
+                'INSERT INTO template (template, nouns, frequency) VALUES (?, ?, ?)',
+                (template, nouns, frequency)).lastrowid
+            size[0] += 1
+        if size[1] >= 2 * size[0]:
+            self._rebuild_events(nouns)
+        else:
+            self._db.execute('INSERT INTO template_event (nouns, cumulative, template_id) VALUES (?, ?, ?)',
+                             (nouns, self._total_of(nouns) + frequency, template_id))
+            size[1] += 1
+        return row is None
+
+    @property
+    def total(self):
+        """テンプレートの総数"""
+        return self._db.query_one('SELECT COUNT(*) FROM template')[0]
+
+    def frequency(self, template):
+        """テンプレートtemplateの出現数を返す。無ければ0を返す。"""
+        row = self._db.query_one('SELECT frequency FROM template WHERE template = ?', (template,))
+        return row[0] if row else 0
+
+    def entries(self):
+        """(テンプレート, 出現数)を登録順に列挙する。"""
+        return ((template, frequency) for _, template, frequency in
+                _pages(self._db, 'SELECT id, template, frequency FROM template', 'id'))
+
+    def choose(self, count, rng=random):
+        """名詞がcount個のテンプレートを、出現数で重み付けして選択する。無ければNoneを返す。"""
+        total = self._total_of(count)
+        if not total:
+            return None
+        row = self._db.query_one(
+            'SELECT t.template FROM template_event e JOIN template t ON t.id = e.template_id '
+            'WHERE e.nouns = ? AND e.cumulative > ? ORDER BY e.cumulative LIMIT 1',
+            (count, rng.randrange(total)))
+        return row[0]
+
+    def fill(self, template, keywords):
+        """テンプレートtemplateの'%noun%'を、先頭から順にkeywordsの単語で置き換えた文字列を返す。"""
+        return TemplateStore.compile(template)[0].format(*keywords)
+
+    def generate(self, keywords, rng=random):
+        """名詞の数がkeywordsと同じテンプレートを選び、keywordsで埋めた文字列を返す。
+        該当するテンプレートが無ければNoneを返す。"""
+        template = self.choose(len(keywords), rng)
+        return None if template is None else self.fill(template, keywords)
+
+    def remove_all(self, templates):
+        """イテラブルtemplatesに含まれるテンプレートを取り除き、template_event表を作り直す。"""
+        _delete_in(self._db, 'template', 'template', templates)
+        self._rebuild_events()
+
+    def __getitem__(self, count):
+        templates = IndexedSet(row[0] for row in self._db.query(
+            'SELECT template FROM template WHERE nouns = ? ORDER BY id', (count,)))
+        if not templates:
+            raise KeyError(count)
+        return templates
+
+    def __len__(self):
+        return self._db.query_one('SELECT COUNT(DISTINCT nouns) FROM template')[0]
+
+    def __iter__(self):
+        return (row[0] for row in self._db.query('SELECT DISTINCT nouns FROM template ORDER BY nouns'))
+
+    def __contains__(self, count):
+        return self._db.query_one('SELECT 1 FROM template WHERE nouns = ? LIMIT 1',
+                                  (count,)) is not None
+
+
+class SQLMarkov:
+    """token・chain・start表を参照するマルコフ辞書。
+
+    遷移は(prefix1, prefix2, suffix)を主キーとして出現数とともに記録し、
+    生成では現在の状態の遷移だけを主キーの索引で読み出す。
+    """
+
+    def __init__(self, db, weighted_starts=False):
+        self.weighted_starts = weighted_starts
+        self._db = db
+        from .markov import Markov
+        self._end = self._intern(Markov.ENDMARK)
+        self._chain_max = Markov.CHAIN_MAX
+
+    def add_sentence(self, parts):
+        """形態素解析結果partsを分解し、学習を行う。"""
+        if len(parts) < 3:
+            return
+        words = [self._intern(word) for word, _ in parts] + [self._end]
+        self._add_start(words[0], 1)
+        self._db.executemany(
+            'INSERT INTO chain VALUES (?, ?, ?, 1)'
+            ' ON CONFLICT (prefix1, prefix2, suffix) DO UPDATE SET count = count + 1',
+            zip(words, words[1:], words[2:]))
+
+    def merge(self, other):
+        """別のMarkovまたはSQLMarkov otherが学習した遷移と文章の開始点を、出現数ごと取り込む。
+        otherがそのどちらでもなければ(NgramMarkovなど)、TypeErrorを送出する。"""
+        from .markov import Markov
+        if not isinstance(other, (Markov, SQLMarkov)):
+            raise TypeError('SQLMarkovに取り込めるのはMarkovとSQLMarkovだけです: {}'.format(
+                type(other).__name__))
+        ids = {}
+
+        def intern(word):
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = ids[word] = self._intern(word)
+            return word_id
+
+        self._db.executemany(
+            'INSERT INTO chain VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (prefix1, prefix2, suffix) DO UPDATE SET count = count + excluded.count',
+            ((intern(prefix1), intern(prefix2), intern(suffix), count)
+             for prefix1, prefix2, suffix, count in other.transitions()))
+        for word, count in other.starts():
+            self._add_start(intern(word), count)
+
+    def transitions(self):
+        """記録されている遷移を(prefix1, prefix2, suffix, 出現数)の単語の形で列挙する。"""
+        last = (0, 0, 0)
+        while True:
+            rows = self._db.query(
+                'SELECT prefix1, prefix2, suffix, a.word, b.word, c.word, count FROM chain'
+                ' JOIN token AS a ON a.id = prefix1 JOIN token AS b ON b.id = prefix2'
+                ' JOIN token AS c ON c.id = suffix WHERE (prefix1, prefix2, suffix) > (?, ?, ?)'
+                ' ORDER BY prefix1, prefix2, suffix LIMIT ?', last + (PAGE,))
+            for row in rows:
+                yield row[3:]
+            if len(rows) < PAGE:
+                return
+            last = tuple(rows[-1][:3])
+
+    def starts(self):
+        """文章が始まる単語を(単語, 出現数)の形で列挙する。"""
+        return (row[1:] for row in _pages(
+            self._db, 'SELECT start.id, word, count FROM start JOIN token ON token.id = token_id',
+            'start.id'))
+
+    def generate(self, keyword, rng=random):
+        """keywordをprefix1とし、そこから始まる文章を生成して返す。"""
+        if self._db.query_one('SELECT 1 FROM chain LIMIT 1') is None:
+            return None
+
+        prefix1 = self._id(keyword)
+        seconds = self._seconds(prefix1) if prefix1 is not None else []
+        if not seconds:
+            prefix1 = self._choose_start(rng)
+            if prefix1 is None:
+                return None
+            seconds = self._seconds(prefix1)
+        prefix2 = rng.choice(seconds)
+
+        words = [prefix1, prefix2]
+        for _ in range(self._chain_max):
+            suffixes = self._db.query('SELECT suffix, count FROM chain'
+                                      ' WHERE prefix1 = ? AND prefix2 = ? ORDER BY suffix',
+                                      (prefix1, prefix2))
+            if not suffixes:
+                break
+            rest = rng.randrange(sum(count for _, count in suffixes))
+            for suffix, count in suffixes:
+                rest -= count
+                if rest < 0:
+                    break
+            if suffix == self._end:
+                break
+            words.append(suffix)
+            prefix1, prefix2 = prefix2, suffix
+
+        return ''.join(self._word(word_id) for word_id in words)
+
+    def prune(self, min_count):
+        """出現数がmin_count未満の遷移を取り除き、使われなくなった単語と開始点も取り除く。
+        取り除いた遷移の数を返す。"""
+        removed = self._db.execute('DELETE FROM chain WHERE count < ?', (min_count,)).rowcount
+        if removed:
+            self._db.execute('DELETE FROM start WHERE token_id NOT IN (SELECT prefix1 FROM chain)')
+            _renumber(self._db, 'start', ['token_id', 'count'])
+            self._db.execute(
+                'DELETE FROM token WHERE id != ? AND id NOT IN (SELECT prefix1 FROM chain)'
+                ' AND id NOT IN (SELECT prefix2 FROM chain) AND id NOT IN (SELECT suffix FROM chain)',
+                (self._end,))
+        return removed
+
+    def sizes(self):
+        """単語の数(words)、状態の数(states)、遷移の数(transitions)、
+        文章が始まる単語の数(starts)を辞書で返す。"""
+        return {
+            'words': self._db.query_one('SELECT COUNT(*) FROM token')[0] - 1,
+            'states': self._db.query_one(
+                'SELECT COUNT(*) FROM (SELECT 1 FROM chain GROUP BY prefix1, prefix2)')[0],
+            'transitions': self._db.query_one('SELECT COUNT(*) FROM chain')[0],
+            'starts': self._db.query_one('SELECT COUNT(*) FROM start')[0],
+        }
+
+    def _intern(self, word):
+        self._db.execute('INSERT OR IGNORE INTO token (word) VALUES (?)', (word,))
+        return self._id(word)
+
+    def _id(self, word):
+        row = self._db.query_one('SELECT id FROM token WHERE word = ?', (word,))
+        return row[0] if row else None
+
+    def _word(self, word_id):
+        return self._db.query_one('SELECT word FROM token WHERE id = ?', (word_id,))[0]
+
+    def _seconds(self, prefix1):
+        return [row[0] for row in self._db.query(
+            'SELECT DISTINCT prefix2 FROM chain WHERE prefix1 = ? ORDER BY prefix2', (prefix1,))]
+
+    def _add_start(self, word_id, count):
+        self._db.execute('INSERT INTO start (token_id, count) VALUES (?, ?)'
+                         ' ON CONFLICT (token_id) DO UPDATE SET count = count + excluded.count',
+                         (word_id, count))
+
+    def _choose_start(self, rng):
+        """文章を始める単語を選択する。
+        weighted_startsがTrueであれば学習した回数で重み付けし、そうでなければ一様に選択する。"""
+        size = self._db.query_one('SELECT COUNT(*) FROM start')[0]
+        if not size:
+            return None
+        if not self.weighted_starts:
+            return self._db.query_one('SELECT token_id FROM start WHERE id = ?',
+                                      (rng.randrange(size) + 1,))[0]
+        total = self._db.query_one('SELECT SUM(count) FROM start')[0]
+        rest = rng.randrange(total)
+        for token_id, count in self._db.query('SELECT token_id, count FROM start ORDER BY id'):
+            rest -= count
+            if rest < 0:
+                return token_id
+
+
+def _db_insert(db, sql, params):
+    """INSERT OR IGNOREを実行し、行を追加したかどうかを真偽値で返す。"""
+    return db.execute(sql, params).rowcount > 0
+
+
+def _delete_in(db, table, column, values):
+    """表tableから、columnがvaluesのいずれかである行を取り除き、取り除いた行の数を返す。"""
+    values = list(values)
+    removed = 0
+    for i in range(0, len(values), MAX_VARIABLES):
+        chunk = values[i:i + MAX_VARIABLES]
+        removed += db.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+            table, column, ', '.join('?' * len(chunk))), chunk).rowcount
+    return removed
+
+
+def _pages(db, select, key):
+    """select文の結果を、keyの順にPAGE行ずつ読み出して列挙する。
+    一度にすべての行を読み込まないため、大きな表も少ないメモリで走査できる。
+    結果の最初の列はkeyでなければならない。"""
+    last = None
+    while True:
+        if last is None:
+            rows = db.query('{} ORDER BY {} LIMIT ?'.format(select, key), (PAGE,))
+        else:
+            rows = db.query('{} WHERE {} > ? ORDER BY {} LIMIT ?'.format(select, key, key),
+                            (last, PAGE))
+        yield from rows
+        if len(rows) < PAGE:
+            return
+        last = rows[-1][0]
@@ -0,0 +1,136 @@
+"""応答にかかった時間と辞書の大きさを記録する計測機能。
+
+UnmoにStatsを渡したときだけ計測を行う。渡さなければ計測の処理は一切行わない。
+
+    stats = Stats()
+    unmo = Unmo('proto', stats=stats)
+    unmo.dialogue('こんにちは')
+    stats.dump(sys.stdout, unmo.dictionary)
+
+記録する区間:
+    analyze -- 形態素解析
+    respond.<Responder名> -- 各Responderの応答。PatternやMarkovの生成はここに含まれる
+    study -- 辞書への学習
+    dialogue -- 一回の対話全体
+"""
+import json
+import time
+import threading
+import contextlib
+from . import morph
+from .util import renew_lock_after_fork
+
+
+class Stats:
+    """区間ごとの所要時間と、名前ごとの回数を記録する。複数のスレッドから同時に記録できる。
+
+    メソッド:
+    timer(name) -- withブロックの所要時間を区間nameとして記録するコンテキストマネージャ
+    record(name, seconds) -- 区間nameの所要時間secondsを記録する
+    count(name, n) -- 回数nameにnを加える
+    snapshot(dictionary) -- 記録した内容を、JSONに変換できる辞書にして返す
+    dump(fp, dictionary) -- snapshotをJSONとしてファイルオブジェクトfpに書き出す
+    reset() -- 記録した内容を消去する
+    drain() -- 記録した内容を取り出して消去する
+    merge(drained) -- drainで取り出した内容を加える
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        renew_lock_after_fork(self)
+        self._timers = {}
+        self._counters = {}
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - began)
+
+    def record(self, name, seconds):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    def drain(self):
+        """記録した内容を(区間ごとの記録, 名前ごとの回数)のタプルとして取り出し、消去する。
+        別のプロセスのStatsにmergeで加えられるよう、pickleできる形で返す。"""
+        with self._lock:
+            drained = (self._timers, self._counters)
+            self._timers = {}
+            self._counters = {}
+        return drained
+
+    def merge(self, drained):
+        """drainで取り出した内容drainedを、この記録に加える。"""
+        timers, counters = drained
+        with self._lock:
+            for name, (count, total, longest) in timers.items():
+                timer = self._timers.get(name)
+                if timer is None:
+                    self._timers[name] = [count, total, longest]
+                else:
+                    timer[0] += count
+                    timer[1] += total
+                    timer[2] = max(timer[2], longest)
+            for name, n in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self, dictionary=None):
+        """記録した内容を辞書にして返す。dictionaryを渡すと、その辞書の大きさも含める。
+
+        timers -- 区間ごとの回数(count)、合計(total)・平均(mean)・最大(max)の秒数
+        counters -- 名前ごとの回数
+        responders -- Responderごとの応答回数(calls)、選ばれた割合(share)、
+                      自身の辞書から応答できた割合(hit_rate)、ランダム辞書に頼った割合(fallback_rate)
+        analyze_cache -- 形態素解析のキャッシュの統計
+        dictionary -- 各辞書の大きさ
+        """
+        with self._lock:
+            timers = {name: {'count': count, 'total': total, 'mean': total / count, 'max': longest}
+                      for name, (count, total, longest) in self._timers.items()}
+            counters = dict(self._counters)
+
+        prefix = 'respond.'
+        calls = {name[len(prefix):]: timer['count']
+                 for name, timer in timers.items() if name.startswith(prefix)}
+        total_calls = sum(calls.values())
+        responders = {}
+        for name, count in sorted(calls.items()):
+            fallbacks = counters.get('fallback.' + name, 0)
+            responders[name] = {
+                'calls': count,
+                'share': count / total_calls,
+                'hit_rate': (count - fallbacks) / count,
+                'fallback_rate': fallbacks / count,
+            }
+
+        snapshot = {
+            'timers': timers,
+            'counters': counters,
+            'responders': responders,
+            'analyze_cache': morph.cache_info()._asdict(),
+        }
+        if dictionary is not None:
+            snapshot['dictionary'] = dictionary.sizes()
+        return snapshot
+
+    def dump(self, fp, dictionary=None):
+        json.dump(self.snapshot(dictionary), fp, ensure_ascii=False, indent=2, sort_keys=True)
+        fp.write('\n')
@@ -0,0 +1,502 @@
+import bisect
+import random
+from array import array
+from collections.abc import Sequence, Mapping
+from .matcher import PatternMatcher
+
+
+class IndexedSet(Sequence):
+    """登録順を保ち、重複を持たないシーケンス。
+
+    メンバーの判定と位置の検索はハッシュで行い、インデックスによる参照もできるため、
+    random.choiceにそのまま渡すことができる。
+
+    メソッド:
+    add(item) -- itemを末尾に追加する。すでにあれば何もしない
+    index(item) -- itemの位置を返す
+    remove_all(items) -- itemsに含まれるものを取り除く
+    """
+
+    def __init__(self, items=()):
+        """イテラブルitemsを受け取り、重複を除いて登録順に保持する。"""
+        self._items = []
+        self._members = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """itemを末尾に追加し、追加したかどうかを真偽値で返す。"""
+        if item in self._members:
+            return False
+        self._members[item] = len(self._items)
+        self._items.append(item)
+        return True
+
+    def index(self, item):
+        """itemの位置を返す。無ければValueErrorを送出する。"""
+        position = self._members.get(item)
+        if position is None:
+            raise ValueError('{!r} is not in {}'.format(item, type(self).__name__))
+        return position
+
+    def remove_all(self, items):
+        """イテラブルitemsに含まれるものを取り除き、残りの登録順を保つ。"""
+        removed = set(items)
+        if not removed & self._members.keys():
+            return
+        self._items = [item for item in self._items if item not in removed]
+        self._members = {item: i for i, item in enumerate(self._items)}
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        return item in self._members
+
+    def __eq__(self, other):
+        if isinstance(other, IndexedSet):
+            return self._items == other._items
+        if isinstance(other, Sequence):
+            return self._items == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._items)
+
+
+class PhraseList(Sequence):
+    """フレーズ表の番号の配列を、フレーズのシーケンスとして見せる。
+
+    パターンハッシュの'phrases'として使い、リストと同じように参照・比較できる。
+    """
+
+    __slots__ = ('_table', '_ids')
+
+    def __init__(self, table, ids):
+        """フレーズ表tableと、フレーズの番号の配列idsを受け取る。"""
+        self._table = table
+        self._ids = ids
+
+    @property
+    def ids(self):
+        """フレーズの番号の配列"""
+        return self._ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._table[i] for i in self._ids[index]]
+        return self._table[self._ids[index]]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        table = self._table
+        return (table[i] for i in self._ids)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class PatternStore(Sequence):
+    """単語をキーとして登録順に保持するパターン辞書。
+
+    パターンハッシュ({'pattern': 単語, 'phrases': [発言]})のシーケンスとして振る舞うため、
+    従来のリスト形式のパターン辞書と同じように読み出すことができる。
+    単語の検索はハッシュで行う。正規表現のパターンのハッシュは'regex': Trueを持つ。
+    学習した単語は正規表現としては扱わない。
+
+    一つの発言は含まれる名詞の数だけのパターンに登録されるため、発言はフレーズ表に一度だけ保持し、
+    各パターンはフレーズの番号の配列で発言を参照する(パターンハッシュの'phrases'はPhraseList)。
+    フレーズの重複チェックは、最後にフレーズ表に加えた発言であれば、それを登録した単語の集合で行う。
+    それより前からある発言であれば、パターンの番号の集合で行う。番号の集合は、
+    そのパターンに前からある発言が初めて追加されたか、hasで調べられたときに作り、以後は保持する。
+    パターンを取り除くと、どのパターンからも参照されなくなった発言をフレーズ表から取り除き、番号を詰める。
+
+    メソッド:
+    add(word, text, regex) -- 単語wordのパターンに発言textを追加する
+    get(word) -- 単語wordのパターンハッシュを返す
+    has(word, text) -- 単語wordのパターンに発言textがあるかどうかを返す
+    search(text) -- textに一致する最初のパターンと一致した文字列を返す
+    remove_all(words) -- wordsに含まれる単語のパターンを取り除く
+    entries() -- (辞書ファイルの単語, フレーズの番号の配列)を登録順に列挙する
+
+    スタティックメソッド:
+    from_table(phrases, entries) -- フレーズ表と番号の配列からパターン辞書を作成する
+
+    プロパティ:
+    phrases -- フレーズ表(IndexedSet)
+    """
+
+    TYPECODE = 'I'
+    TOTALCODE = 'Q'
+
+    def __init__(self, patterns=()):
+        """パターンハッシュのイテラブルpatternsを受け取り、登録順に保持する。
+        同じ単語のパターンが複数あった場合はフレーズを先のものにまとめる。
+        'regex'を持たないパターンハッシュの単語は、辞書ファイルの書式として読む(PatternMatcher.parse)。
+
+        self._phrases -- フレーズ表。フレーズの番号は表の位置である
+        self._words -- 単語からパターンハッシュへの対応表
+        self._latest -- 最後にフレーズ表に加えたフレーズの(番号, それを登録した単語の集合)
+        self._members -- 単語から、そのパターンのフレーズの番号の集合への対応表。
+                         前からある発言を追加したパターンについてだけ持つ
+        """
+        self._phrases = IndexedSet()
+        self._patterns = []
+        self._words = {}
+        self._latest = (None, set())
+        self._members = {}
+        self._matcher = PatternMatcher()
+        for pattern in patterns:
+            if 'regex' in pattern:
+                word, regex = pattern['pattern'], pattern['regex']
+            else:
+                word, regex = PatternMatcher.parse(pattern['pattern'])
+            for text in pattern['phrases']:
+                self.add(word, text, regex)
+
+    @staticmethod
+    def from_table(phrases, entries):
+        """フレーズのリストphrasesと、(辞書ファイルの単語, フレーズの番号のリスト)のイテラブルentriesから
+        パターン辞書を作成する。同じ単語や、同じパターンの同じ番号は先のものにまとめる。"""
+        store = PatternStore()
+        table = store._phrases
+        for text in phrases:
+            table.add(text)
+        # 重複したフレーズをまとめた場合に限り、ファイル上の番号から表の番号へ変換する
+        numbers = None if len(table) == len(phrases) else [table.index(text) for text in phrases]
+        for word, ids in entries:
+            word, regex = PatternMatcher.parse(word)
+            if numbers is not None:
+                ids = [numbers[phrase_id] for phrase_id in ids]
+            pattern = store._words.get(word)
+            if pattern is None:
+                store._create(word, regex)['phrases'].ids.extend(dict.fromkeys(ids))
+                continue
+            for phrase_id in ids:
+                store._add_id(word, phrase_id)
+        return store
+
+    @property
+    def phrases(self):
+        """フレーズ表(IndexedSet)。フレーズの番号は表の位置である"""
+        return self._phrases
+
+    def add(self, word, text, regex=False):
+        """単語wordのパターンに発言textを追加する。
+        パターンが無ければ新しく作成し、同じ発言があれば何もしない。
+        regexが真であれば、新しく作成するパターンは正規表現として照合する。
+        学習した単語は記号を含んでいても文字列として照合する。"""
+        if word not in self._words:
+            self._create(word, regex)
+        if not self._phrases.add(text):
+            self._add_id(word, self._phrases.index(text))
+            return
+
+        # 初めての発言はどのパターンにも無い
+        phrase_id = len(self._phrases) - 1
+        self._latest = (phrase_id, {word})
+        self._append(word, phrase_id)
+
+    def _add_id(self, word, phrase_id):
+        """単語wordのパターンに、フレーズ表にすでにある番号phrase_idのフレーズを追加する。
+        同じフレーズがあれば何もしない。"""
+        latest, words = self._latest
+        if phrase_id == latest:
+            if word not in words:
+                words.add(word)
+                self._append(word, phrase_id)
+            return
+
+        if phrase_id not in self._members_of(word):
+            self._append(word, phrase_id)
+
+    def _members_of(self, word):
+        """単語wordのパターンのフレーズの番号の集合を返す。まだ無ければ作成して保持する。"""
+        members = self._members.get(word)
+        if members is None:
+            members = self._members.setdefault(word, set(self._words[word]['phrases'].ids))
+        return members
+
+    def _append(self, word, phrase_id):
+        """単語wordのパターンの末尾に番号phrase_idを加え、番号の集合があれば更新する。"""
+        self._words[word]['phrases'].ids.append(phrase_id)
+        members = self._members.get(word)
+        if members is not None:
+            members.add(phrase_id)
+
+    def _create(self, word, regex=False):
+        """単語wordの空のパターンハッシュを作成して登録する。"""
+        pattern = {'pattern': word, 'phrases': PhraseList(self._phrases, array(PatternStore.TYPECODE))}
+        if regex:
+            pattern['regex'] = True
+        self._words[word] = pattern
+        self._patterns.append(pattern)
+        self._matcher.add(pattern)
+        return pattern
+
+    def get(self, word, default=None):
+        """単語wordのパターンハッシュを返す。無ければdefaultを返す。"""
+        return self._words.get(word, default)
+
+    def has(self, word, text):
+        """単語wordのパターンに発言textがあるかどうかを真偽値で返す。"""
+        if word not in self._words or text not in self._phrases:
+            return False
+        phrase_id = self._phrases.index(text)
+        latest, words = self._latest
+        if phrase_id == latest:
+            return word in words
+        return phrase_id in self._members_of(word)
+
+    def search(self, text):
+        """textに一致するパターンのうち、最も先に登録されたものを探す。
+        (パターンハッシュ, 一致した文字列)のタプルを、無ければNoneを返す。"""
+        return self._matcher.search(text)
+
+    def entries(self):
+        """(辞書ファイルの単語, フレーズの番号の配列)を登録順に列挙する。
+        記号を含む学習した単語はエスケープする(PatternMatcher.escape)。"""
+        for pattern in self._patterns:
+            yield PatternMatcher.escape(pattern['pattern'], pattern.get('regex', False)), pattern['phrases'].ids
+
+    def remove_all(self, words):
+        """イテラブルwordsに含まれる単語のパターンを取り除く。
+        トライ木は項目を取り除けないため、残ったパターンから作り直す。
+        どのパターンからも参照されなくなったフレーズはフレーズ表から取り除く。"""
+        removed = {word for word in words if word in self._words}
+        if not removed:
+            return
+        for word in removed:
+            del self._words[word]
+        self._patterns = [pattern for pattern in self._patterns if pattern['pattern'] not in removed]
+        self._compact()
+        self._matcher = PatternMatcher(self._patterns)
+
+    def _compact(self):
+        """どのパターンからも参照されていないフレーズをフレーズ表から取り除き、
+        残ったフレーズの番号を登録順のまま詰めて、各パターンの番号の配列を書き換える。"""
+        self._latest = (None, set())
+        self._members = {}
+        live = set()
+        for pattern in self._patterns:
+            live.update(pattern['phrases'].ids)
+        table = self._phrases
+        if len(live) == len(table):
+            return
+        numbers = {}
+        dead = []
+        for phrase_id, text in enumerate(table):
+            if phrase_id in live:
+                numbers[phrase_id] = len(numbers)
+            else:
+                dead.append(text)
+        # PhraseListが同じフレーズ表を参照し続けるよう、表は作り直さずに取り除く
+        table.remove_all(dead)
+        for pattern in self._patterns:
+            ids = pattern['phrases'].ids
+            ids[:] = array(PatternStore.TYPECODE, (numbers[phrase_id] for phrase_id in ids))
+
+    def __reduce__(self):
+        # 照合用のトライ木はpickleせず、読み込み時に作り直す
+        return PatternStore.from_table, (list(self._phrases), list(self.entries()))
+
+    def __getitem__(self, index):
+        return self._patterns[index]
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+
+class TemplateStore(Mapping):
+    """名詞の数をキーとして、テンプレートを出現数とともに保持するテンプレート辞書。
+
+    名詞の数から、そのテンプレートのIndexedSetへの対応表として振る舞うため、
+    従来のテンプレート辞書と同じように読み出すことができる。
+    テンプレートは学習したときに'%noun%'の前後の文字列へ分割して書式文字列にしておき、
+    名詞を埋めるときはテンプレートを走査し直さず、一度のformatで文章を組み立てる。
+
+    同じテンプレートを学習すると出現数が増え、chooseは出現数で重み付けして選択する。
+    重み付けには学習のたびに(テンプレートの番号, 出現数の累積和)を追記し、累積和を二分探索する。
+    追記がテンプレートの数の2倍に達したら、テンプレートごとに1つへ詰め直す。
+    lambdaを含まないため、そのままpickleできる。
+
+    プロパティ:
+    total -- テンプレートの総数
+
+    メソッド:
+    add(template, frequency) -- テンプレートを出現数frequencyだけ追加する
+    frequency(template) -- テンプレートの出現数を返す
+    entries() -- (テンプレート, 出現数)を登録順に列挙する
+    weight(count) -- 名詞がcount個のテンプレートの出現数の合計を返す
+    choose(count, rng) -- 名詞がcount個のテンプレートを出現数で重み付けして選択する
+    fill(template, keywords) -- テンプレートの'%noun%'を順にkeywordsで置き換える
+    generate(keywords, rng) -- keywordsの数に合うテンプレートを選び、名詞を埋めて返す
+    remove_all(templates) -- templatesに含まれるテンプレートを取り除く
+
+    スタティックメソッド:
+    compile(template) -- テンプレートを書式文字列に変換する
+    """
+
+    SLOT = '%noun%'
+    TYPECODE = 'I'
+    TOTALCODE = 'Q'
+
+    def __init__(self, entries=()):
+        """(テンプレート, 出現数)のイテラブルentriesを受け取り、登録順に保持する。
+
+        self._templates -- 名詞の数からテンプレートへの対応表。 _templates[count] == IndexedSet
+        self._formats -- テンプレートを'%noun%'で分割し、'{}'でつないだ書式文字列と'%noun%'の数。
+                         _formats[template] == ('...{}...', count)
+        self._frequencies -- テンプレートの出現数。 _frequencies[template] == frequency
+        self._events -- 名詞の数ごとに、学習したテンプレートの番号を並べた配列
+        self._cumulative -- _eventsと同じ位置の、出現数の累積和の配列
+        """
+        self._templates = {}
+        self._formats = {}
+        self._frequencies = {}
+        self._events = {}
+        self._cumulative = {}
+        for template, frequency in entries:
+            self.add(template, frequency)
+
+    def add(self, template, frequency=1):
+        """テンプレートtemplateを出現数frequencyだけ追加し、新しいテンプレートであったかを真偽値で返す。
+        '%noun%'を含まないテンプレートは追加しない。"""
+        compiled = self._formats.get(template)
+        added = compiled is None
+        if added:
+            compiled = TemplateStore.compile(template)
+            if not compiled[1]:
+                return False
+            self._formats[template] = compiled
+            self._frequencies[template] = 0
+
+        count = compiled[1]
+        templates = self._templates.get(count)
+        if templates is None:
+            templates = self._templates[count] = IndexedSet()
+            self._events[count] = array(TemplateStore.TYPECODE)
+            self._cumulative[count] = array(TemplateStore.TOTALCODE)
+        if added:
+            templates.add(template)
+        self._frequencies[template] += frequency
+        events = self._events[count]
+        if len(events) >= 2 * len(templates):
+            self._rebuild_events(count)
+        else:
+            cumulative = self._cumulative[count]
+            events.append(templates.index(template))
+            cumulative.append((cumulative[-1] if cumulative else 0) + frequency)
+        return added
+
+    @staticmethod
+    def compile(template):
+        """テンプレートtemplateを'%noun%'で分割し、(書式文字列, '%noun%'の数)を返す。
+
+        >>> TemplateStore.compile('%noun%は{%noun%}です')
+        ('{}は{{{}}}です', 2)
+        """
+        segments = template.split(TemplateStore.SLOT)
+        escaped = (segment.replace('{', '{{').replace('}', '}}') for segment in segments)
+        return '{}'.join(escaped), len(segments) - 1
+
+    @property
+    def total(self):
+        """テンプレートの総数"""
+        return len(self._formats)
+
+    def frequency(self, template):
+        """テンプレートtemplateの出現数を返す。無ければ0を返す。"""
+        return self._frequencies.get(template, 0)
+
+    def entries(self):
+        """(テンプレート, 出現数)を登録順に列挙する。"""
+        for template in self._formats:
+            yield template, self._frequencies[template]
+
+    def weight(self, count):
+        """名詞がcount個のテンプレートの出現数の合計を返す。"""
+        cumulative = self._cumulative.get(count)
+        return cumulative[-1] if cumulative else 0
+
+    def choose(self, count, rng=random):
+        """名詞がcount個のテンプレートを、出現数で重み付けして選択する。無ければNoneを返す。"""
+        templates = self._templates.get(count)
+        if not templates:
+            return None
+        cumulative = self._cumulative[count]
+        rest = rng.randrange(cumulative[-1])
+        return templates[self._events[count][bisect.bisect_right(cumulative, rest)]]
+
+    def fill(self, template, keywords):
+        """テンプレートtemplateの'%noun%'を、先頭から順にkeywordsの単語で置き換えた文字列を返す。
+        keywordsの数は'%noun%'の数と同じでなければならない。"""
+        return self._formats[template][0].format(*keywords)
+
+    def generate(self, keywords, rng=random):
+        """名詞の数がkeywordsと同じテンプレートを選び、keywordsで埋めた文字列を返す。
+        該当するテンプレートが無ければNoneを返す。"""
+        template = self.choose(len(keywords), rng)
+        return None if template is None else self.fill(template, keywords)
+
+    def remove_all(self, templates):
+        """イテラブルtemplatesに含まれるテンプレートを取り除く。
+        重み付けの配列は番号がずれるため、取り除いたテンプレートと同じ名詞の数の分だけ作り直す。"""
+        removed = {template for template in templates if template in self._formats}
+        if not removed:
+            return
+        counts = {self._formats[template][1] for template in removed}
+        for template in removed:
+            del self._formats[template], self._frequencies[template]
+        for count in counts:
+            survivors = IndexedSet(template for template in self._templates[count]
+                                   if template not in removed)
+            if survivors:
+                self._templates[count] = survivors
+                self._rebuild_events(count)
+            else:
+                del self._templates[count], self._events[count], self._cumulative[count]
+
+    def _rebuild_events(self, count):
+        """名詞がcount個のテンプレートの重み付けを、テンプレートごとに1つずつ登録順に作り直す。"""
+        events = array(TemplateStore.TYPECODE)
+        cumulative = array(TemplateStore.TOTALCODE)
+        total = 0
+        for index, template in enumerate(self._templates[count]):
+            total += self._frequencies[template]
+            events.append(index)
+            cumulative.append(total)
+        self._events[count] = events
+        self._cumulative[count] = cumulative
+
+    def __reduce__(self):
+        # 書式文字列と重み付けの配列はpickleせず、読み込み時に作り直す
+        return TemplateStore, (list(self.entries()),)
+
+    def __getitem__(self, count):
+        return self._templates[count]
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __iter__(self):
+        return iter(self._templates)
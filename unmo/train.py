@@ -0,0 +1,93 @@
+"""コーパスから辞書をまとめて学習させるモジュール。
+
+コーパスのファイルを一行ずつ読み込んで文に分割し、一定数の文ごとのチャンクにまとめる。
+各チャンクの形態素解析と学習は別プロセスで行い、プロセスごとに作られた辞書を
+元の順番どおりに一つの辞書へmergeする。同時に処理するチャンクの数には上限があるため、
+コーパスがどれだけ大きくても読み込み途中の文が際限なくメモリに溜まることはない。
+
+    python -m unmo.train コーパスのファイル [-j プロセス数] [-c チャンクの文数]
+"""
+import os
+import re
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import tqdm
+from .dictionary import Dictionary
+from .ngram import NgramMarkov
+from .morph import analyze
+
+
+SEPARATOR = re.compile(r'[。?？!！ 　]+')
+
+
+def iter_sentences(lines):
+    """行のイテラブルlinesを文に分割し、空でない文を順に返す。"""
+    for line in lines:
+        for sentence in SEPARATOR.split(line.strip()):
+            if sentence:
+                yield sentence
+
+
+def iter_chunks(items, size):
+    """イテラブルitemsを、size個ずつのリストにまとめて順に返す。"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def study_chunk(sentences, markov_order=None):
+    """文のリストsentencesを形態素解析し、空の辞書に学習させて返す。
+    markov_orderを指定すると、マルコフ辞書を次数markov_orderのNgramMarkovで作成する。"""
+    dictionary = Dictionary(load=False, markov_order=markov_order)
+    for sentence in sentences:
+        dictionary.study(sentence, analyze(sentence))
+    return dictionary
+
+
+def train(dictionary, sentences, processes=None, chunk_size=1000, progress=None):
+    """文のイテラブルsentencesを、processes個のプロセスで並列に学習してdictionaryにmergeする。
+    progressが与えられた場合、mergeしたチャンクの文数を引数として呼び出す。
+    各プロセスはdictionaryと同じ種類・次数のマルコフ辞書に学習させる。"""
+    processes = processes or os.cpu_count() or 1
+    markov = dictionary.markov
+    markov_order = markov.order if isinstance(markov, NgramMarkov) else None
+    pending = deque()
+
+    def merge_oldest():
+        size, future = pending.popleft()
+        dictionary.merge(future.result())
+        if progress:
+            progress(size)
+
+    with ProcessPoolExecutor(processes) as executor:
+        for chunk in iter_chunks(sentences, chunk_size):
+            pending.append((len(chunk), executor.submit(study_chunk, chunk, markov_order)))
+            if len(pending) >= processes * 2:
+                merge_oldest()
+        while pending:
+            merge_oldest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='コーパスから辞書をまとめて学習させる')
+    parser.add_argument('corpus', help='UTF-8のテキストファイル')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='形態素解析を行うプロセスの数(既定はCPUの数)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=1000,
+                        help='一つのプロセスにまとめて渡す文の数')
+    args = parser.parse_args()
+
+    dictionary = Dictionary()
+    with open(args.corpus, encoding='utf-8') as f, tqdm.tqdm(unit='sentences') as bar:
+        train(dictionary, iter_sentences(f), args.processes, args.chunk_size, bar.update)
+    dictionary.save()
+
+
+if __name__ == '__main__':
+    main()
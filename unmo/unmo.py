@@ -1,33 +1,50 @@
-from random import randrange
-from janome.tokenizer import Tokenizer
-from .morph import analyze
+import random
+import contextlib
+from collections import namedtuple
+from .morph import analyze, analyze_many
 from .responder import WhatResponder, RandomResponder, PatternResponder, TemplateResponder, MarkovResponder
 from .dictionary import Dictionary
 
 
+Reply = namedtuple('Reply', ['text', 'responder', 'response'])
+
+_UNTIMED = contextlib.nullcontext()
+
+
 class Unmo:
     """人工無脳コアクラス。
 
+    メソッド:
+    dialogue(text) -- 入力に応答し、入力を学習する
+    dialogue_batch(texts, study, seed) -- 複数の入力に順に応答し、結果を一つずつ返す
+    analyze(text) -- 入力を形態素解析する
+    respond(text, parts, rng) -- 入力に応答する。学習は行わない
+    study(text, parts) -- 入力を学習する
+    save() -- 辞書を保存する
+
     プロパティ:
     name -- 人工無脳コアの名前
     responder_name -- 現在の応答クラスの名前
+    dictionary -- 使用している辞書
+    stats -- 計測に使うStats。計測しない場合はNone
     """
 
-    def __init__(self, name):
+    def __init__(self, name, dictionary=None, stats=None):
         """文字列を受け取り、コアインスタンスの名前に設定する。
         Responder(What, Random, Pattern)インスタンスを作成し、保持する。
-        Dictionaryインスタンスを作成し、保持する。
-        Tokenizerインスタンスを作成し、保持する。
+        Dictionaryインスタンスを作成し、保持する。dictionaryが渡された場合はそれを使う。
+        形態素解析にはmorphモジュールが共有するTokenizerを使う。
+        stats.Statsを渡すと、各処理の所要時間とResponderの応答結果を記録する。
         """
-        self._tokenizer = Tokenizer()
-        self._dictionary = Dictionary()
+        self._dictionary = dictionary if dictionary is not None else Dictionary()
+        self._stats = stats
 
         self._responders = {
-            'what':   WhatResponder('What', self._dictionary),
-            'random': RandomResponder('Random', self._dictionary),
-            'pattern': PatternResponder('Pattern', self._dictionary),
-            'template': TemplateResponder('Template', self._dictionary),
-            'markov': MarkovResponder('Markov', self._dictionary),
+            'what':   WhatResponder('What', self._dictionary, stats),
+            'random': RandomResponder('Random', self._dictionary, stats),
+            'pattern': PatternResponder('Pattern', self._dictionary, stats),
+            'template': TemplateResponder('Template', self._dictionary, stats),
+            'markov': MarkovResponder('Markov', self._dictionary, stats),
         }
         self._name = name
         self._responder = self._responders['pattern']
@@ -36,27 +53,66 @@ class Unmo:
         """ユーザーからの入力を受け取り、Responderに処理させた結果を返す。
         呼び出されるたびにランダムでResponderを切り替える。
         入力をDictionaryに学習させる。"""
-        chance = randrange(0, 100)
+        with self._timer('dialogue'):
+            parts = self.analyze(text)
+            response = self.respond(text, parts)
+            self.study(text, parts)
+        return response
+
+    def analyze(self, text):
+        """入力textを形態素解析した結果を返す。"""
+        with self._timer('analyze'):
+            return analyze(text)
+
+    def dialogue_batch(self, texts, study=True, seed=None):
+        """入力のイテラブルtextsを順に処理し、Reply(text, responder, response)を一つずつ返すジェネレータ。
+
+        study -- Trueであれば、各入力に応答した後、次の入力の前にそれを学習する。
+                 dialogueを順に呼び出した場合と同じ結果になる
+        seed -- Responderの選択と各Responderの選択に使う乱数の種。
+                同じ辞書に同じseedで同じ入力を与えると、同じ結果を返す。
+                乱数はこの呼び出し専用に作成するため、randomモジュールの状態は変わらない
+        """
+        rng = random.Random(seed)
+        for text, parts in analyze_many(texts):
+            response = self.respond(text, parts, rng)
+            if study:
+                self.study(text, parts)
+            yield Reply(text, self._responder.name, response)
+
+    def respond(self, text, parts, rng=random):
+        """入力textと形態素partsを受け取り、ランダムに選んだResponderの応答を返す。
+        学習は行わない。乱数は乱数生成器rng(省略時はrandomモジュール)から得る。
+        辞書は読み込みロックを取得して参照するため、
+        別のスレッドで学習が行われていても安全に呼び出せる。"""
+        chance = rng.randrange(0, 100)
         if chance in range(0, 29):
-            self._responder = self._responders['pattern']
+            responder = self._responders['pattern']
         elif chance in range(30, 49):
-            self._responder = self._responders['template']
+            responder = self._responders['template']
         elif chance in range(50, 69):
-            self._responder = self._responders['random']
+            responder = self._responders['random']
         elif chance in range(70, 89):
-            self._responder = self._responders['markov']
+            responder = self._responders['markov']
         else:
-            self._responder = self._responders['what']
+            responder = self._responders['what']
 
-        parts = analyze(text)
-        response = self._responder.response(text, parts)
-        self._dictionary.study(text, parts)
-        return response
+        self._responder = responder
+        with self._timer('respond.' + responder.name), self._dictionary.lock.read():
+            return responder.response(text, parts, rng)
+
+    def study(self, text, parts):
+        """入力textと形態素partsをDictionaryに学習させる。"""
+        with self._timer('study'):
+            self._dictionary.study(text, parts)
 
     def save(self):
         """Dictionaryへの保存を行う。"""
         self._dictionary.save()
 
+    def _timer(self, name):
+        return self._stats.timer(name) if self._stats is not None else _UNTIMED
+
     @property
     def name(self):
         """人工無脳インスタンスの名前"""
@@ -66,3 +122,13 @@ class Unmo:
     def responder_name(self):
         """保持しているResponderの名前"""
         return self._responder.name
+
+    @property
+    def dictionary(self):
+        """使用しているDictionary"""
+        return self._dictionary
+
+    @property
+    def stats(self):
+        """計測に使うStats。計測しない場合はNone"""
+        return self._stats
@@ -1,3 +1,100 @@
+import os
+import weakref
+import contextlib
+import threading
+import tempfile
+
+
+# 一時ファイルはmkstempにより0600で作成されるため、置き換える前に通常の権限へ戻す
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+# forkした子プロセスで_lockを作り直すオブジェクト
+_LOCK_OWNERS = weakref.WeakSet()
+
+
+def _renew_locks():
+    for owner in list(_LOCK_OWNERS):
+        owner._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_renew_locks)
+
+
+def renew_lock_after_fork(owner):
+    """ownerの_lock(threading.Lock)を、forkした子プロセスでは新しいロックに作り直すよう登録する。
+    他のスレッドがロックを取得している間にforkすると、子プロセスではロックが解放されなくなるため。"""
+    _LOCK_OWNERS.add(owner)
+
+
 def format_error(error):
     """例外errorを受け取り、'名前: メッセージ'の形式で返す"""
     return '{}: {}'.format(type(error).__name__, str(error))
+
+
+@contextlib.contextmanager
+def atomic_open(filename, mode='w', encoding=None):
+    """filenameに書き込むためのファイルを開くコンテキストマネージャ。
+    同じディレクトリの一時ファイルに書き込み、ブロックを抜けたときにfilenameと置き換える。
+    途中で例外が発生した場合は一時ファイルを削除し、filenameには手を付けない。"""
+    dirname = os.path.dirname(os.path.abspath(filename))
+    prefix = '.{}.'.format(os.path.basename(filename))
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix=prefix)
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmpname, 0o666 & ~_UMASK)
+        os.replace(tmpname, filename)
+    except BaseException:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+class RWLock:
+    """読み込みを優先する読み書きロック。
+
+    読み込みは何件でも同時に行えるが、書き込みは他の読み込み・書き込みと同時には行えない。
+    待っている書き込みがあっても新しい読み込みは待たされないため、
+    読み込みが待つのは実行中の書き込み一件が終わるまでである。
+
+    メソッド:
+    read() -- 読み込みロックを取得するコンテキストマネージャ
+    write() -- 書き込みロックを取得するコンテキストマネージャ
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()